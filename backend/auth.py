@@ -4,18 +4,29 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from pydantic import ValidationError
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from models.users import User as UserModel, UserRole, UserStatus
+from models.tokens import RefreshToken
 from schemas.users import UserCreate, UserResponse, UserUpdate, UserInDB
-from schemas.auth import Token, TokenData, PasswordChangeRequest
+from schemas.auth import Token, TokenData, PasswordChangeRequest, RefreshRequest
 from database import SessionLocal
+from utils.user_cache import token_versions, user_cache
+from utils.password_hashing import PasswordHasher, PasswordHashingBusyError, configured_bcrypt_rounds
+from utils import activity
+from utils.activity import activity_recorder
 
 # Environment variables for authentication
 import os
+import hashlib
+import hmac
 import logging
+import secrets
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
+# Setup logging (queue-based, see utils/logger.py)
+from utils.logger import setup_logging
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # JWT configuration
@@ -35,8 +46,13 @@ def get_jwt_secret_key():
 SECRET_KEY = get_jwt_secret_key()
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes with a different cost report needs_update and are replaced on login
+BCRYPT_ROUNDS = configured_bcrypt_rounds()
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+# Runs bcrypt in a bounded thread pool, see utils/password_hashing.py
+password_hasher = PasswordHasher(pwd_context)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Database dependency
@@ -54,6 +70,43 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# Async variants for request handlers, they don't block the event loop
+def _password_hashing_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many login attempts at the moment, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+async def verify_password_async(plain_password, hashed_password):
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHashingBusyError:
+        raise _password_hashing_busy()
+
+async def get_password_hash_async(password):
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHashingBusyError:
+        raise _password_hashing_busy()
+
+async def rehash_password_if_needed(user: UserModel, password: str) -> bool:
+    """
+    Replace a hash whose cost differs from BCRYPT_ROUNDS after a successful login.
+
+    Only sets user.hashed_password, the caller commits. When the hashing pool is
+    busy the update is skipped and happens on a later login.
+    """
+    if not pwd_context.needs_update(user.hashed_password):
+        return False
+    try:
+        user.hashed_password = await password_hasher.hash(password)
+    except PasswordHashingBusyError:
+        return False
+    user_cache.invalidate(user.username)
+    logger.info(f"Rehashed password of user {user.username} with bcrypt cost {BCRYPT_ROUNDS}")
+    return True
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -70,7 +123,127 @@ def get_user(db: Session, username: str):
 def get_user_by_email(db: Session, email: str):
     return db.query(UserModel).filter(UserModel.email == email).first()
 
+def access_token_claims(user: UserModel) -> dict:
+    """Claims of an access token: everything get_current_active_user checks, plus the token version."""
+    return {
+        "sub": user.username,
+        "ver": user.token_version or 0,
+        "role": user.role.value,
+        "status": user.status.value,
+        "email_verified": bool(user.email_verified),
+    }
+
+def get_token_version(db: Session, username: str):
+    """Current token version of a user, None if the user doesn't exist."""
+    row = db.query(UserModel.token_version).filter(UserModel.username == username).first()
+    return (row[0] or 0) if row is not None else None
+
+def revoke_user_tokens(db: Session, username: str):
+    """
+    Revoke all access tokens of a user by bumping users.token_version.
+
+    Must be called after changing a user's status, role, password or
+    verification state (the token claims would be stale) and after deleting
+    a user. Commits the session.
+    """
+    db.execute(
+        text("UPDATE users SET token_version = COALESCE(token_version, 0) + 1 WHERE username = :username"),
+        {"username": username}
+    )
+    db.commit()
+    version = get_token_version(db, username)
+    if version is None:
+        token_versions.invalidate(username)
+        # Refresh tokens of other versions are rejected anyway, those of deleted users are removed
+        db.query(RefreshToken).filter(RefreshToken.username == username).delete(synchronize_session=False)
+        db.commit()
+    else:
+        token_versions.put(username, version)
+    user_cache.invalidate(username)
+
+def hash_refresh_token(token: str) -> str:
+    """HMAC-SHA256 of a refresh token; only the HMAC is stored and looked up."""
+    return hmac.new(SECRET_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+def create_refresh_token(db: Session, user: UserModel, family_id: Optional[str] = None) -> str:
+    """
+    Issue a refresh token and store its HMAC. Commits the session.
+
+    A login starts a new token family (and removes the user's expired tokens),
+    a refresh continues the family of the rotated token.
+    """
+    now = datetime.utcnow()
+    if family_id is None:
+        family_id = secrets.token_hex(16)
+        db.query(RefreshToken).filter(
+            RefreshToken.username == user.username, RefreshToken.expires_at < now
+        ).delete(synchronize_session=False)
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        token_hash=hash_refresh_token(token),
+        family_id=family_id,
+        username=user.username,
+        token_version=user.token_version or 0,
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    db.commit()
+    return token
+
+def rotate_refresh_token(db: Session, token: str):
+    """
+    Exchange a refresh token for a new one of the same family.
+
+    Costs one HMAC and a few indexed queries instead of a bcrypt verification.
+    A token that was already rotated has been copied: the whole family is
+    revoked, so neither the thief nor the owner can continue with it.
+
+    Returns:
+        tuple: (user, new refresh token)
+
+    Raises:
+        HTTPException: 401 if the token is unknown, used, revoked, expired or was
+                       issued before the user's tokens were revoked
+    """
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    now = datetime.utcnow()
+    token_hash = hash_refresh_token(token)
+    stored = db.query(RefreshToken).filter(RefreshToken.token_hash == token_hash).first()
+    if stored is None or stored.revoked_at is not None:
+        raise invalid_token
+
+    # Marking the token as used in one statement makes concurrent refreshes with it count as reuse
+    marked = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == token_hash, RefreshToken.used_at.is_(None)
+    ).update({"used_at": now}, synchronize_session=False)
+    if not marked:
+        logger.warning(f"Refresh token reuse detected for user {stored.username}, revoking the token family")
+        db.query(RefreshToken).filter(
+            RefreshToken.family_id == stored.family_id, RefreshToken.revoked_at.is_(None)
+        ).update({"revoked_at": now}, synchronize_session=False)
+        db.commit()
+        raise invalid_token
+
+    user = get_user(db, stored.username)
+    if stored.expires_at < now or user is None or (user.token_version or 0) != stored.token_version:
+        db.commit()
+        raise invalid_token
+
+    return user, create_refresh_token(db, user, family_id=stored.family_id)
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """
+    Authenticated user of a request, taken from the token claims.
+
+    The only check against stored state is the token version, which comes from
+    the token_versions cache; the database is read for unknown users and when a
+    token is newer than the cached version. Endpoints that need the full user
+    record depend on get_current_user_record instead.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -81,15 +254,35 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
+        token_data = TokenData(
+            username=username,
+            token_version=payload.get("ver"),
+            role=payload.get("role"),
+            status=payload.get("status"),
+            email_verified=payload.get("email_verified", False),
+        )
+    except (JWTError, ValidationError):
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
-    if user is None:
+    # Tokens issued before the claims were introduced have no version and must be renewed
+    if token_data.token_version is None or token_data.role is None or token_data.status is None:
         raise credentials_exception
-    return user
 
-async def get_current_active_user(current_user: UserModel = Depends(get_current_user)):
+    cached_version = current_version = token_versions.get(username)
+    if current_version is None or token_data.token_version > current_version:
+        current_version = get_token_version(db, username)
+        if current_version is None:
+            user_cache.invalidate(username)
+            raise credentials_exception
+        if cached_version is not None and current_version != cached_version:
+            # Changed in another process, the cached record is stale
+            user_cache.invalidate(username)
+        token_versions.put(username, current_version)
+    if token_data.token_version != current_version:
+        logger.info(f"Rejected revoked token of user {username}")
+        raise credentials_exception
+    return token_data
+
+async def get_current_active_user(current_user: TokenData = Depends(get_current_user)):
     from utils.logger import get_logger
     logger = get_logger(__name__)
     
@@ -121,20 +314,47 @@ async def get_current_active_user(current_user: UserModel = Depends(get_current_
     
     return current_user
 
-def authenticate_user(db: Session, username: str, password: str):
+async def get_current_user_record(
+    current_user: TokenData = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Full user record of the authenticated user, for endpoints that need more than the token claims.
+
+    The cached record is only used if it has the token's version; the record
+    of an older or newer version is read again.
+    """
+    user = user_cache.get(current_user.username)
+    if user is None or (user.token_version or 0) != current_user.token_version:
+        user = get_user(db, username=current_user.username)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        # Cached users are shared between requests and must not belong to a session
+        db.expunge(user)
+        user_cache.put(user.username, user)
+    return user
+
+async def authenticate_user(db: Session, username: str, password: str):
     from utils.logger import get_logger
     logger = get_logger(__name__)
     
     user = get_user(db, username)
     
     # Check if user exists and password is correct
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await verify_password_async(password, user.hashed_password):
         logger.warning(f"Failed login attempt for username: {username}")
+        if user:
+            activity_recorder.record(user.username, activity.LOGIN_FAILED)
         return False
     
-    # Update last login time
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Upgrade the hash if the cost changed; last_login is written in the background
+    if await rehash_password_if_needed(user, password):
+        db.commit()
+    activity_recorder.record(user.username, activity.LOGIN)
     
     logger.info(f"User {username} authenticated successfully")
     return user
@@ -204,7 +424,7 @@ def create_initial_admin(db: Session = None):
 
 async def change_password(password_change: PasswordChangeRequest, user: UserModel, db: Session):
     """Change user password"""
-    if not verify_password(password_change.current_password, user.hashed_password):
+    if not await verify_password_async(password_change.current_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
@@ -214,7 +434,7 @@ async def change_password(password_change: PasswordChangeRequest, user: UserMode
     
     try:
         # Generate new password hash
-        new_hash = get_password_hash(password_change.new_password)
+        new_hash = await get_password_hash_async(password_change.new_password)
         logger.info(f"New hash generated: {new_hash[:20]}...")
         
         # Use direct SQLite access for maximum reliability
@@ -260,7 +480,7 @@ async def change_password(password_change: PasswordChangeRequest, user: UserMode
         logger.info(f"Updated hash in database: {updated_hash[:20]}...")
         
         # Verify authentication works with new password
-        verification_result = verify_password(password_change.new_password, updated_hash)
+        verification_result = await verify_password_async(password_change.new_password, updated_hash)
         logger.info(f"Password verification result: {verification_result}")
         
         if not verification_result:
@@ -274,6 +494,8 @@ async def change_password(password_change: PasswordChangeRequest, user: UserMode
         
         # Also update the user model in memory
         user.hashed_password = new_hash
+        revoke_user_tokens(db, user.username)
+        activity_recorder.record(user.username, activity.PASSWORD_CHANGE)
         
         return {"message": "Password updated successfully"}
             
@@ -0,0 +1,373 @@
+"""
+Backfill engine for derived tour metrics.
+
+Re-derives speed, distance, moving time, elevation gain and the tour type /
+e-bike heuristics (see utils/tour_metrics.py) for existing tours after the
+algorithms changed. The work is spread over worker processes; results are
+written back in batched transactions and every updated tour is stamped with
+the current METRICS_VERSION, so an interrupted run can simply be restarted.
+Tours without a full-fidelity track only get a partial update from the
+stored data; an archive run re-derives them even if they are stamped.
+
+The tour type heuristic depends on the format of the imported file (see
+classify_tour_type), which is stored per tour in tours.source_format.
+
+Sources:
+    stored tracks   The track data stored in the database (default)
+    --archive DIR   The original GPX/KML/KMZ files; tours are matched by
+                    Komoot ID, otherwise by name and date. Processed files
+                    are recorded in a state file to resume interrupted runs.
+                    Matched tours without a full-fidelity track in
+                    tour_tracks get the track from the archive file.
+
+Usage:
+    python backfill_metrics.py
+    python backfill_metrics.py --archive ../touren --workers 8
+    python backfill_metrics.py --force
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import gpxpy.gpx
+from sqlalchemy import text
+
+from import_gpx import engine, read_gpx, build_tour_record
+from utils.schema import ensure_tours_schema
+from utils.tour_metrics import METRICS_VERSION, classify_tour_type, derive_metrics, is_ebike_tour
+from utils.track_store import decode_track, iter_segments
+
+SUPPORTED_EXTENSIONS = ('.gpx', '.kml', '.kmz')
+METRIC_COLUMNS = ("type", "ebike", "speed_kmh", "distance_km", "duration_s", "elevation_up", "elevation_down")
+STATE_FILE_NAME = ".backfill_metrics_state.json"
+
+
+class Progress:
+    """Prints throughput and estimated remaining time of a backfill run."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.updated = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def advance(self, processed, updated, failed):
+        self.done += processed
+        self.updated += updated
+        self.failed += failed
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        print(f"  {self.done}/{self.total} verarbeitet, {self.updated} aktualisiert, "
+              f"{self.failed} fehlgeschlagen ({rate:.0f}/s, ETA {eta:.0f}s)", flush=True)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        print(f"✅ Backfill abgeschlossen in {elapsed:.1f}s:")
+        print(f"   {self.done} verarbeitet, {self.updated} Touren aktualisiert, {self.failed} fehlgeschlagen")
+
+
+# --- Worker functions (run in the worker processes) ---
+
+def _gpx_from_track(columns):
+    """Builds a gpxpy object with the tracks and segments of a decoded tour_tracks row."""
+    gpx = gpxpy.gpx.GPX()
+    tracks = {}
+    for track_number, points in iter_segments(columns):
+        if track_number not in tracks:
+            tracks[track_number] = gpxpy.gpx.GPXTrack()
+            gpx.tracks.append(tracks[track_number])
+        segment = gpxpy.gpx.GPXTrackSegment()
+        for lat, lon, elevation, epoch in points:
+            timestamp = datetime.fromtimestamp(epoch, tz=timezone.utc) if epoch is not None else None
+            segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=elevation, time=timestamp))
+        tracks[track_number].segments.append(segment)
+    return gpx
+
+
+def source_extension(source_format, name, speed_kmh, current_type):
+    """
+    File extension for the tour type heuristic of a stored tour.
+
+    Tours imported before tours.source_format existed have no format. If the
+    stored type is the one the KML rule gives and differs from the GPX result,
+    the tour was imported from KML and keeps that classification; the format
+    is then stored with the metrics.
+    """
+    if source_format:
+        return f".{source_format}"
+    if current_type is not None and current_type == classify_tour_type(name, speed_kmh, '.kml') \
+            != classify_tour_type(name, speed_kmh):
+        return '.kml'
+    return ''
+
+
+def derive_from_stored(row):
+    """
+    Re-derives the metrics of a tour from its stored track.
+
+    Tours with a full-fidelity track in tour_tracks get all metrics
+    re-derived. Older tours only have the coordinates in track_geojson, so
+    their time based metrics (speed, distance, moving time) are kept and only
+    the heuristics and, if the coordinates carry altitudes, the elevation gain
+    are recomputed.
+    """
+    tour_id, name, track_geojson, speed_kmh, current_type, source_format = row[:6]
+    track_row = dict(zip(("point_count", "codec", "lat", "lon", "elevation", "time", "segments"), row[6:]))
+
+    if track_row["codec"] is not None:
+        try:
+            gpx = _gpx_from_track(decode_track(track_row))
+            moving_data = gpx.get_moving_data()
+            speed = moving_data.moving_distance / 1000 / (moving_data.moving_time / 3600) \
+                if moving_data and moving_data.moving_time else 0.0
+            file_ext = source_extension(source_format, name, speed, current_type)
+            metrics = derive_metrics(gpx, name, file_ext)
+        except Exception as e:
+            print(f"Fehler beim Dekodieren des Tracks von Tour {tour_id}: {e}", file=sys.stderr)
+            return tour_id, None
+        if not source_format and file_ext:
+            metrics["source_format"] = file_ext.lstrip('.')
+        return tour_id, metrics
+
+    try:
+        coordinates = json.loads(track_geojson).get('coordinates', [])
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return tour_id, None
+
+    file_ext = source_extension(source_format, name, speed_kmh or 0.0, current_type)
+    metrics = {
+        "type": classify_tour_type(name, speed_kmh or 0.0, file_ext),
+        "ebike": is_ebike_tour(name),
+    }
+    if not source_format and file_ext:
+        metrics["source_format"] = file_ext.lstrip('.')
+
+    if coordinates and all(len(coord) > 2 for coord in coordinates):
+        segment = gpxpy.gpx.GPXTrackSegment()
+        for coord in coordinates:
+            segment.points.append(gpxpy.gpx.GPXTrackPoint(coord[1], coord[0], elevation=coord[2]))
+        uphill, downhill = segment.get_uphill_downhill()
+        metrics["elevation_up"] = round(uphill or 0.0, 2)
+        metrics["elevation_down"] = round(downhill or 0.0, 2)
+
+    return tour_id, metrics
+
+
+def _read_source_file(path):
+    """Parses an original GPX, KML or KMZ file into (source name, gpxpy object) tuples."""
+    file_ext = os.path.splitext(path.lower())[1]
+    if file_ext == '.gpx':
+        gpx = read_gpx(path)
+    elif file_ext == '.kml':
+        from utils.kml_converter import kml_to_gpx
+        gpx = kml_to_gpx(path)
+    else:
+        # Every KML document of a KMZ archive is a tour of its own; the worker
+        # processes must not start processes themselves
+        from utils.kmz_converter import kmz_to_gpx
+        return kmz_to_gpx(path, parallel=False) or []
+    return [(path, gpx)] if gpx is not None else []
+
+
+def derive_from_file(path):
+    """Parses an original file and returns the match keys and full metrics of its tours."""
+    try:
+        records = [build_tour_record(gpx, source_name) for source_name, gpx in _read_source_file(path)]
+    except Exception as e:
+        print(f"Fehler beim Verarbeiten von {path}: {e}", file=sys.stderr)
+        return path, []
+
+    return path, [
+        {key: record[key] for key in ("komootid", "name", "date", "track", "source_format") + METRIC_COLUMNS}
+        for record in records if record is not None
+    ]
+
+
+# --- Database writes ---
+
+def _update_sql(columns, where, force):
+    assignments = [f"{column} = :{column}" for column in columns]
+    assignments.append("metrics_version = :metrics_version")
+    sql = f"UPDATE tours SET {', '.join(assignments)} WHERE {where}"
+    if not force:
+        # Tours without a full-fidelity track only had a partial update from the stored data
+        sql += (" AND (metrics_version < :metrics_version"
+                " OR NOT EXISTS (SELECT 1 FROM tour_tracks WHERE tour_tracks.tour_id = tours.id))")
+    return sql
+
+
+def store_missing_tracks(updates, where):
+    """Stores the full-fidelity tracks from the archive for matched tours that have none yet."""
+    if not updates:
+        return
+    with engine.begin() as connection:
+        connection.execute(
+            text(f"""
+                INSERT OR IGNORE INTO tour_tracks (tour_id, point_count, codec, lat, lon, elevation, time, segments)
+                SELECT id, :point_count, :codec, :lat, :lon, :elevation, :time, :segments FROM tours WHERE {where}
+            """),
+            [{**update, **update["track"]} for update in updates]
+        )
+
+
+def write_batch(updates, where, force):
+    """
+    Writes a batch of metric updates in a single transaction.
+
+    Updates are grouped by the set of columns they change, so each group is
+    written with one executemany call. Every updated tour gets the current
+    METRICS_VERSION, also after a partial update, so it isn't processed again.
+
+    Returns:
+        int: Number of updated tours
+    """
+    groups = {}
+    for params in updates:
+        columns = tuple(column for column in METRIC_COLUMNS + ("source_format",) if column in params)
+        groups.setdefault(columns, []).append({**params, "metrics_version": METRICS_VERSION})
+
+    updated = 0
+    with engine.begin() as connection:
+        for columns, params in groups.items():
+            result = connection.execute(text(_update_sql(columns, where, force)), params)
+            updated += result.rowcount
+    return updated
+
+
+# --- Backfill runs ---
+
+def backfill_stored(executor, batch_size, force):
+    """Re-derives metrics from the tracks stored in the database."""
+    condition = "" if force else "AND t.metrics_version < :metrics_version"
+    with engine.connect() as connection:
+        total = connection.execute(
+            text(f"SELECT COUNT(*) FROM tours t WHERE 1=1 {condition}"),
+            {"metrics_version": METRICS_VERSION}
+        ).scalar()
+
+    print(f"Backfill aus gespeicherten Tracks: {total} Touren (Metrik-Version {METRICS_VERSION})")
+    progress = Progress(total)
+
+    # Keyset pagination over the ids, so updated rows don't shift the pages
+    last_id = 0
+    while True:
+        with engine.connect() as connection:
+            rows = connection.execute(
+                text(f"""
+                    SELECT t.id, t.name, t.track_geojson, t.speed_kmh, t.type, t.source_format,
+                           tt.point_count, tt.codec, tt.lat, tt.lon, tt.elevation, tt.time, tt.segments
+                    FROM tours t LEFT JOIN tour_tracks tt ON tt.tour_id = t.id
+                    WHERE t.id > :last_id {condition}
+                    ORDER BY t.id LIMIT :limit
+                """),
+                {"last_id": last_id, "metrics_version": METRICS_VERSION, "limit": batch_size}
+            ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        failed = 0
+        for tour_id, metrics in executor.map(derive_from_stored, [tuple(row) for row in rows], chunksize=32):
+            if metrics is None:
+                failed += 1
+            else:
+                updates.append({"id": tour_id, **metrics})
+
+        updated = write_batch(updates, "id = :id", force=True)
+        progress.advance(len(rows), updated, failed)
+
+    progress.summary()
+
+
+def _load_state(state_file, force):
+    if force or not os.path.exists(state_file):
+        return set()
+    with open(state_file, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    if state.get("metrics_version") != METRICS_VERSION:
+        return set()
+    return set(state.get("done", []))
+
+
+def _save_state(state_file, done):
+    temp_file = state_file + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump({"metrics_version": METRICS_VERSION, "done": sorted(done)}, f)
+    os.replace(temp_file, state_file)
+
+
+def backfill_archive(executor, archive_dir, batch_size, force, state_file=None):
+    """Re-derives metrics from an archive of the original tour files."""
+    state_file = state_file or os.path.join(archive_dir, STATE_FILE_NAME)
+    done = _load_state(state_file, force)
+
+    files = []
+    for root, _, filenames in os.walk(archive_dir):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                path = os.path.relpath(os.path.join(root, filename), archive_dir)
+                if path not in done:
+                    files.append(path)
+
+    print(f"Backfill aus Archiv {archive_dir}: {len(files)} Dateien offen, "
+          f"{len(done)} bereits verarbeitet (Metrik-Version {METRICS_VERSION})")
+    progress = Progress(len(files))
+
+    for start in range(0, len(files), batch_size):
+        batch = files[start:start + batch_size]
+        paths = [os.path.join(archive_dir, path) for path in batch]
+
+        by_komoot_id = []
+        by_name_and_date = []
+        failed = 0
+        for _, tours in executor.map(derive_from_file, paths, chunksize=8):
+            if not tours:
+                failed += 1
+            for metrics in tours:
+                if metrics["komootid"]:
+                    by_komoot_id.append(metrics)
+                else:
+                    by_name_and_date.append(metrics)
+
+        by_komoot_id_where = "komootid = :komootid"
+        by_name_and_date_where = "komootid IS NULL AND name = :name AND date = :date"
+        updated = write_batch(by_komoot_id, by_komoot_id_where, force)
+        updated += write_batch(by_name_and_date, by_name_and_date_where, force)
+        store_missing_tracks(by_komoot_id, by_komoot_id_where)
+        store_missing_tracks(by_name_and_date, by_name_and_date_where)
+
+        done.update(batch)
+        _save_state(state_file, done)
+        progress.advance(len(batch), updated, failed)
+
+    progress.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leitet die Tour-Kennzahlen aller Touren neu ab.")
+    parser.add_argument("--archive", help="Verzeichnis mit den Original-Dateien (GPX/KML/KMZ)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Anzahl Worker-Prozesse")
+    parser.add_argument("--batch-size", type=int, default=500, help="Touren pro Transaktion")
+    parser.add_argument("--state-file", help="Statusdatei für den Archiv-Modus")
+    parser.add_argument("--force", action="store_true",
+                        help="Alle Touren neu berechnen, auch wenn sie bereits aktuell sind")
+    args = parser.parse_args(argv)
+
+    ensure_tours_schema(engine)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        if args.archive:
+            backfill_archive(executor, args.archive, args.batch_size, args.force, args.state_file)
+        else:
+            backfill_stored(executor, args.batch_size, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Benchmark: throughput of the email outbox sender against a local SMTP server.
+
+Starts an aiosmtpd server on localhost, fills the outbox of a temporary
+database and lets the sender (utils/email_outbox.py) deliver all messages,
+once with a new SMTP connection per message and once with connection reuse.
+--handshake-ms delays the server greeting to simulate the connection setup
+of a remote mail server (TCP, TLS, login), which reuse avoids.
+
+Usage:
+    python benchmark_email_outbox.py [--messages 500] [--batch-size 50] [--handshake-ms 20]
+
+Requires aiosmtpd (pip install aiosmtpd).
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="tourmanager-mailbench-"), "mailbench.db"))
+
+import logging
+logging.disable(logging.WARNING)
+
+from aiosmtpd.controller import Controller
+from sqlalchemy import create_engine
+
+from database import Base
+from models.outbox import OutboxEmail
+from utils.email_outbox import EmailSender, enqueue_email
+
+
+class CountingHandler:
+    def __init__(self, handshake_seconds):
+        self.handshake_seconds = handshake_seconds
+        self.messages = 0
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        await asyncio.sleep(self.handshake_seconds)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return "250 Message accepted"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run(label, messages, batch_size, per_connection, handshake_seconds):
+    handler = CountingHandler(handshake_seconds)
+    port = free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+
+    engine = create_engine(f"sqlite:///{tempfile.mkdtemp(prefix='outbox-')}/outbox.db")
+    Base.metadata.create_all(bind=engine, tables=[OutboxEmail.__table__])
+    for i in range(messages):
+        enqueue_email(f"user{i}@example.com", "Benchmark", "<p>Benchmark message</p>", engine=engine)
+
+    settings = {"host": "127.0.0.1", "port": port, "starttls": False, "ssl": False,
+                "username": None, "password": None, "sender": "noreply@example.com"}
+    sender = EmailSender(engine, settings, batch_size=batch_size, max_messages_per_connection=per_connection)
+    started = time.perf_counter()
+    while sender.send_pending():
+        pass
+    duration = time.perf_counter() - started
+    sender._close()
+    controller.stop()
+
+    print(f"{label:<28} {handler.messages:>5} messages in {duration:6.2f}s  "
+          f"{handler.messages / duration:8.1f} msg/s  {handler.connections:>5} connections")
+    if handler.messages != messages:
+        print(f"  expected {messages} messages", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Email outbox throughput against a local SMTP server")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--handshake-ms", type=float, default=20,
+                        help="Simulated connection setup time of the mail server")
+    args = parser.parse_args()
+
+    handshake = args.handshake_ms / 1000
+    run("new connection per message", args.messages, args.batch_size, 1, handshake)
+    run("connection reuse", args.messages, args.batch_size, 100, handshake)
+
+
+if __name__ == "__main__":
+    main()
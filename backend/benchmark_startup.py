@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Benchmark: startup time of the API.
+
+Starts a fresh interpreter per run that imports main and answers a first
+GET /health/live, against a temporary database with an admin user. The first run
+applies the schema migrations; the following runs are restarts of an existing
+installation, which is what a deployment or an autoscaled worker does.
+Reported per phase (median over the runs): interpreter start until the import
+of main, the import itself, the first request, and the number of SQL
+statements executed while importing.
+
+Usage:
+    python benchmark_startup.py [--runs 10] [--imports 15]
+
+--imports additionally lists the slowest modules imported by main (python -X importtime).
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SETUP = """
+import database, models
+database.init_db()
+from auth import create_initial_admin
+create_initial_admin()
+"""
+
+CHILD = """
+import time
+started = time.perf_counter()
+import logging
+logging.disable(logging.WARNING)
+from sqlalchemy import event
+import database
+statements = []
+event.listen(database.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+before_import = time.perf_counter()
+import main
+imported = time.perf_counter()
+import_statements = len(statements)
+database.init_db()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+request_started = time.perf_counter()
+status = client.get("/health/live").status_code
+done = time.perf_counter()
+import json
+print("RESULT " + json.dumps({
+    "prelude": before_import - started,
+    "import": imported - before_import,
+    "request": done - request_started,
+    "statements": import_statements,
+    "status": status,
+}))
+"""
+
+
+def child_env(database_path):
+    env = dict(os.environ, DATABASE_PATH=database_path, LOG_LEVEL="WARNING")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def run_once(database_path):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=child_env(database_path),
+                               capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    for line in completed.stdout.splitlines():
+        if line.startswith("RESULT "):
+            result = json.loads(line[len("RESULT "):])
+            result["wall"] = wall
+            return result
+    raise RuntimeError(f"Benchmark run failed:\n{completed.stderr}")
+
+
+def slowest_imports(database_path, count):
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                               env=child_env(database_path), capture_output=True, text=True)
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if not match:
+            continue
+        depth = len(match.group(3))
+        if depth == 1 and match.group(4) != "main":
+            # Children are listed before their parent: what came so far belongs to e.g. site
+            imports = []
+        elif depth == 3:
+            # Modules imported directly by main, cumulative time
+            imports.append((int(match.group(2)), match.group(4)))
+    return sorted(imports, reverse=True)[:count]
+
+
+def ms(values):
+    return f"{statistics.median(values) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of the API (import of main and first request)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--imports", type=int, default=0, help="List the N slowest modules imported by main")
+    args = parser.parse_args()
+
+    database_path = os.path.join(tempfile.mkdtemp(prefix="tourmanager-startbench-"), "startbench.db")
+    # Create the tables and the admin user outside the measured runs
+    subprocess.run([sys.executable, "-c", SETUP], cwd=BACKEND_DIR, env=child_env(database_path),
+                   capture_output=True, check=True)
+
+    first = run_once(database_path)
+    restarts = [run_once(database_path) for _ in range(max(args.runs - 1, 1))]
+
+    print(f"{'':<24}{'first start':>14}{'restart (median)':>20}")
+    for key, label in (("prelude", "interpreter + database"), ("import", "import main"),
+                       ("request", "first GET /health/live"), ("wall", "total (wall clock)")):
+        print(f"{label:<24}{first[key] * 1000:11.1f} ms{ms([run[key] for run in restarts]):>20}")
+    print(f"{'SQL during import':<24}{first['statements']:>14}"
+          f"{statistics.median(run['statements'] for run in restarts):>20.0f}")
+    if any(run["status"] != 200 for run in [first] + restarts):
+        print("GET /health/live did not return 200", file=sys.stderr)
+
+    if args.imports:
+        print("\nSlowest modules imported by main:")
+        for microseconds, module in slowest_imports(database_path, args.imports):
+            print(f"  {microseconds / 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmarks of the tour endpoints and the upload pipeline on synthetic data.
+
+Run from backend/ (see README, "Benchmarks"):
+    python -m pytest benchmarks/bench_api.py --benchmark-json=benchmarks/results/latest.json
+    python -m benchmarks.compare benchmarks/results/latest.json
+
+Endpoints that read every tour (map GeoJSON, nearby search, bulk export) and
+the uploads run a fixed number of rounds; the cheap endpoints are calibrated
+by pytest-benchmark.
+"""
+import io
+import itertools
+import zipfile
+
+import pytest
+
+from benchmarks.synthetic import DEFAULT_SEED, synthetic_tour, upload_file
+
+# Rounds of the endpoints that scale with the number of tours
+HEAVY_ROUNDS = 3
+UPLOAD_ROUNDS = 10
+
+# A point in the middle of the generated region, so the nearby search finds tours
+NEARBY = {"latitude": 46.8, "longitude": 8.2, "radius_km": 10.0}
+
+_upload_index = itertools.count()
+
+
+def get_ok(client, url, **kwargs):
+    response = client.get(url, **kwargs)
+    assert response.status_code == 200, response.text[:200]
+    return response
+
+
+# --- Tour lists and statistics ---
+
+@pytest.mark.benchmark(group="tours")
+def test_get_tours(benchmark, client):
+    response = benchmark(get_ok, client, "/api/tours")
+    assert len(response.json()) == 100
+
+
+@pytest.mark.benchmark(group="tours")
+def test_get_tours_filtered(benchmark, client):
+    params = {"tour_type": "Bike", "date_from": "2018-01-01", "date_to": "2022-12-31", "min_distance": 10,
+              "limit": 50}
+    benchmark(get_ok, client, "/api/tours", params=params)
+
+
+@pytest.mark.benchmark(group="tours")
+def test_get_tours_last_page(benchmark, client, tour_total):
+    benchmark(get_ok, client, "/api/tours", params={"limit": 100, "offset": tour_total - 100})
+
+
+@pytest.mark.benchmark(group="tours")
+def test_get_tour_summary(benchmark, client):
+    response = benchmark(get_ok, client, "/api/tours/summary")
+    assert response.json()["total_tours"] > 0
+
+
+@pytest.mark.benchmark(group="tours")
+def test_get_tour_summary_filtered(benchmark, client):
+    benchmark(get_ok, client, "/api/tours/summary", params={"tour_type": "Hike", "date_from": "2020-01-01"})
+
+
+@pytest.mark.benchmark(group="tours")
+def test_get_tour_types(benchmark, client):
+    benchmark(get_ok, client, "/api/tours/types")
+
+
+@pytest.mark.benchmark(group="tours")
+def test_get_tour_detail(benchmark, client, tour_ids):
+    ids = itertools.cycle(tour_ids)
+    benchmark(lambda: get_ok(client, f"/api/tours/{next(ids)}"))
+
+
+# --- Map and search (read every tour) ---
+
+@pytest.mark.benchmark(group="map")
+def test_get_tours_geojson(benchmark, client):
+    # What the map view requests
+    response = benchmark.pedantic(get_ok, args=(client, "/api/tours/geojson"), kwargs={"params": {"limit": 999999}},
+                                  rounds=HEAVY_ROUNDS)
+    assert response.json()["features"]
+
+
+@pytest.mark.benchmark(group="map")
+def test_get_tours_geojson_filtered(benchmark, client):
+    params = {"limit": 999999, "tour_type": "Hike", "date_from": "2020-01-01", "date_to": "2020-12-31"}
+    benchmark.pedantic(get_ok, args=(client, "/api/tours/geojson"), kwargs={"params": params}, rounds=HEAVY_ROUNDS)
+
+
+@pytest.mark.benchmark(group="map")
+def test_get_nearby_tours(benchmark, client):
+    def nearby():
+        response = client.post("/api/tours/nearby", json=NEARBY)
+        assert response.status_code == 200, response.text[:200]
+        return response
+
+    benchmark.pedantic(nearby, rounds=HEAVY_ROUNDS)
+
+
+# --- Export ---
+
+@pytest.mark.benchmark(group="export")
+@pytest.mark.parametrize("export_format", ["gpx", "geojson", "kml"])
+def test_export_single_tour(benchmark, client, tour_ids, export_format):
+    benchmark(get_ok, client, f"/api/tours/{tour_ids[1]}/export", params={"format": export_format})
+
+
+@pytest.mark.benchmark(group="export")
+def test_export_tours(benchmark, client, auth_headers):
+    # One year of hikes keeps the archive size proportional to the dataset
+    params = {"format": "gpx", "tour_type": "Hike", "date_from": "2020-01-01", "date_to": "2020-12-31"}
+    response = benchmark.pedantic(get_ok, args=(client, "/api/tours/export"),
+                                  kwargs={"params": params, "headers": auth_headers}, rounds=HEAVY_ROUNDS)
+    assert zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+
+
+# --- Ingestion ---
+
+def upload(client, auth_headers, name, content):
+    response = client.post("/api/tours/upload", files={"file": (name, content)}, headers=auth_headers)
+    assert response.status_code == 200, response.text[:200]
+    assert response.json()["status"] == "success", response.json()
+    return response
+
+
+@pytest.mark.benchmark(group="ingest")
+@pytest.mark.parametrize("kind", ["gpx", "kml", "kmz"])
+def test_upload(benchmark, client, auth_headers, kind):
+    # Every round uploads a new tour, a repeated Komoot id would only be detected as duplicate
+    def next_file():
+        return (client, auth_headers, *upload_file(kind, next(_upload_index))), {}
+
+    benchmark.pedantic(upload, setup=next_file, rounds=UPLOAD_ROUNDS)
+
+
+@pytest.mark.benchmark(group="ingest")
+def test_upload_batch(benchmark, client, auth_headers):
+    def next_files():
+        files = [("files", upload_file(kind, next(_upload_index))) for kind in ("gpx", "gpx", "gpx", "kml", "kmz")]
+        return (files,), {}
+
+    def upload_batch(files):
+        response = client.post("/api/tours/upload/batch", files=files, headers=auth_headers)
+        assert response.status_code == 200, response.text[:200]
+        assert all(result["status"] == "success" for result in response.json()["results"]), response.json()
+
+    benchmark.pedantic(upload_batch, setup=next_files, rounds=UPLOAD_ROUNDS)
+
+
+@pytest.mark.benchmark(group="ingest")
+def test_upload_duplicate(benchmark, client, auth_headers):
+    # A tour that already exists is parsed but not stored again
+    name, content = upload_file("gpx", next(_upload_index))
+    upload(client, auth_headers, name, content)
+
+    def duplicate():
+        response = client.post("/api/tours/upload", files={"file": (name, content)}, headers=auth_headers)
+        assert response.json()["status"] == "warning", response.json()
+
+    benchmark.pedantic(duplicate, rounds=UPLOAD_ROUNDS)
+
+
+@pytest.mark.benchmark(group="ingest")
+def test_parse_gpx(benchmark, app_module):
+    """Parsing and metrics of a GPX file without the database (build_tour_record)."""
+    from benchmarks.synthetic import gpx_document
+    from import_gpx import build_tour_record, read_gpx
+
+    content = gpx_document(synthetic_tour(3 * 10**6, DEFAULT_SEED))
+    record = benchmark(lambda: build_tour_record(read_gpx(io.BytesIO(content)), "tour.gpx"))
+    assert record["points"]
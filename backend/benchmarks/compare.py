@@ -0,0 +1,151 @@
+"""
+Compares a benchmark run with the stored baseline.
+
+bench_api.py writes its results with --benchmark-json; this script prints the
+median of every benchmark next to the baseline (benchmarks/baseline.json) and
+marks changes beyond the threshold. A benchmark only counts as slower if
+even its fastest round is slower than the median of the baseline (and vice
+versa for faster), so single noisy rounds don't raise alarms.
+
+The baseline is a reduced copy of a run (median, min, IQR and rounds per
+benchmark plus the commit and dataset), so it stays small enough to be
+committed and reviewed with the change that moved it.
+
+Usage:
+    python -m benchmarks.compare benchmarks/results/latest.json
+    python -m benchmarks.compare benchmarks/results/latest.json --fail-on-regression
+    python -m benchmarks.compare benchmarks/results/latest.json --save   # new baseline
+"""
+import argparse
+import json
+import os
+import sys
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Relative change of the median that counts as slower or faster
+DEFAULT_THRESHOLD = 0.2
+
+
+def summarize(run: dict) -> dict:
+    """Reduces a pytest-benchmark JSON report to what the comparison needs (times in ms)."""
+    commit = run.get("commit_info", {})
+    machine = run.get("machine_info", {})
+    return {
+        "commit": commit.get("id"),
+        "dirty": commit.get("dirty"),
+        "datetime": run.get("datetime"),
+        "machine": {
+            "node": machine.get("node"),
+            "cpu": machine.get("cpu", {}).get("brand_raw"),
+            "python": machine.get("python_version"),
+        },
+        "dataset": machine.get("dataset"),
+        "benchmarks": {
+            bench["name"]: {
+                "group": bench["group"],
+                "median_ms": round(bench["stats"]["median"] * 1000, 3),
+                "min_ms": round(bench["stats"]["min"] * 1000, 3),
+                "iqr_ms": round(bench["stats"]["iqr"] * 1000, 3),
+                "rounds": bench["stats"]["rounds"],
+            }
+            for bench in run["benchmarks"]
+        },
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Rows of the comparison, sorted by group and name.
+
+    Returns:
+        list of dict: name, group, baseline_ms, current_ms, change (relative, None if
+        the benchmark is new or gone) and status ("slower", "faster", "ok", "new" or "missing")
+    """
+    rows = []
+    names = set(baseline["benchmarks"]) | set(current["benchmarks"])
+    for name in names:
+        before = baseline["benchmarks"].get(name)
+        after = current["benchmarks"].get(name)
+        row = {
+            "name": name,
+            "group": (after or before)["group"],
+            "baseline_ms": before["median_ms"] if before else None,
+            "current_ms": after["median_ms"] if after else None,
+            "change": None,
+        }
+        if before is None:
+            row["status"] = "new"
+        elif after is None:
+            row["status"] = "missing"
+        else:
+            row["change"] = after["median_ms"] / before["median_ms"] - 1
+            if row["change"] > threshold and after["min_ms"] > before["median_ms"]:
+                row["status"] = "slower"
+            elif row["change"] < -threshold and before["min_ms"] > after["median_ms"]:
+                row["status"] = "faster"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    rows.sort(key=lambda row: (row["group"] or "", row["name"]))
+    return rows
+
+
+def _ms(value):
+    return "-" if value is None else f"{value:,.2f}"
+
+
+def format_report(baseline: dict, current: dict, rows: list) -> str:
+    width = max([len(row["name"]) for row in rows] + [9])
+    lines = [
+        f"Baseline: {(baseline['commit'] or '?')[:10]} ({baseline['datetime']}, {baseline['dataset']})",
+        f"Current:  {(current['commit'] or '?')[:10]}{' (dirty)' if current['dirty'] else ''} "
+        f"({current['datetime']}, {current['dataset']})",
+    ]
+    if baseline["dataset"] != current["dataset"]:
+        lines.append("Warning: the runs used different datasets, the times are not comparable")
+    if baseline["machine"] != current["machine"]:
+        lines.append(f"Warning: different machines ({baseline['machine']} / {current['machine']})")
+    lines.append("")
+    lines.append(f"{'Benchmark':<{width}}  {'Group':<8} {'Baseline ms':>12} {'Current ms':>12} {'Change':>8}  Status")
+    for row in rows:
+        change = "" if row["change"] is None else f"{row['change']:+.0%}"
+        lines.append(f"{row['name']:<{width}}  {row['group'] or '':<8} {_ms(row['baseline_ms']):>12} "
+                     f"{_ms(row['current_ms']):>12} {change:>8}  {row['status']}")
+    counts = {status: sum(1 for row in rows if row["status"] == status)
+              for status in ("slower", "faster", "new", "missing")}
+    lines.append("")
+    lines.append(", ".join(f"{count} {status}" for status, count in counts.items()))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a benchmark run with the stored baseline")
+    parser.add_argument("result", help="JSON report of pytest --benchmark-json")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative change of the median reported as slower/faster (default 0.2)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with 1 if a benchmark got slower")
+    parser.add_argument("--save", action="store_true", help="Store the run as the new baseline")
+    args = parser.parse_args()
+
+    with open(args.result, encoding="utf-8") as result_file:
+        current = summarize(json.load(result_file))
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(current, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Baseline saved: {len(current['benchmarks'])} benchmarks of {(current['commit'] or '?')[:10]} "
+              f"to {args.baseline}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    rows = compare(baseline, current, args.threshold)
+    print(format_report(baseline, current, rows))
+    if args.fail_on_regression and any(row["status"] == "slower" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Fixtures of the API benchmarks (bench_api.py).
+
+The dataset size comes from BENCH_TOURS (1k, 10k, 100k or a number, default
+1k). The cached synthetic dataset is copied to a temporary directory and the
+app is imported with DATABASE_PATH pointing to the copy, so uploads never
+change the cached dataset and every run starts from the same data.
+"""
+import logging
+import os
+import shutil
+import sys
+
+import pytest
+
+from benchmarks.synthetic import DEFAULT_SEED, SIZES, cached_database
+
+BENCH_TOURS = os.getenv("BENCH_TOURS", "1k")
+BENCH_SEED = int(os.getenv("BENCH_SEED", str(DEFAULT_SEED)))
+
+
+def tour_count() -> int:
+    return SIZES.get(BENCH_TOURS) or int(BENCH_TOURS)
+
+
+def pytest_report_header(config):
+    return f"benchmark dataset: {tour_count()} synthetic tours (seed {BENCH_SEED})"
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_benchmark_update_machine_info(config, machine_info):
+    # Stored with the results, compare.py only compares runs on the same dataset
+    machine_info["dataset"] = {"tours": tour_count(), "seed": BENCH_SEED}
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """main with the synthetic dataset as its database."""
+    if "main" in sys.modules:
+        raise RuntimeError("main was imported before the benchmark dataset was set up, run the benchmarks separately")
+    path = str(tmp_path_factory.mktemp("bench") / "tourmanager.db")
+    shutil.copyfile(cached_database(tour_count(), BENCH_SEED), path)
+    os.environ["DATABASE_PATH"] = path
+    # Request logging would dominate the short requests
+    logging.disable(logging.INFO)
+
+    import database
+    import main
+    from auth import create_initial_admin
+
+    database.init_db()
+    create_initial_admin()
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(app_module):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app_module.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    response = client.post("/token", data={"username": "admin", "password": os.getenv("ADMIN_PASSWORD", "admin123")})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def tour_total():
+    return tour_count()
+
+
+@pytest.fixture(scope="session")
+def tour_ids(tour_total):
+    """Ids of a few tours spread over the dataset."""
+    return [1 + (tour_total * i) // 8 for i in range(8)]
@@ -0,0 +1,324 @@
+"""
+Deterministic synthetic tours for benchmarks and load tests.
+
+The same seed always produces the same tours: names, types, dates and tracks
+come from one random.Random per tour, so a dataset of 10k tours starts with
+the same 1k tours as the 1k dataset. Tracks are random walks through
+Switzerland with realistic lengths and sampling per type (hikes every 8 s at
+4-5 km/h, bike tours every 4 s at 14-28 km/h, ...); the number of points
+per tour follows a log-normal distribution around a few hundred to a
+thousand points, as recorded Komoot tours do.
+
+build_database() writes the tours straight into the tours and tour_tracks
+tables (the same rows the bulk import writes, without parsing GPX), datasets
+are cached per size and seed in BENCH_DATA_DIR. write_upload_files() writes
+GPX, KML and KMZ files in the formats the upload endpoints accept.
+
+Usage:
+    python -m benchmarks.synthetic database --tours 10000
+    python -m benchmarks.synthetic files --count 20 --out /tmp/uploads
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+# Bump when the generated data changes, cached datasets are rebuilt
+GENERATOR_VERSION = 2
+DEFAULT_SEED = 42
+SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+
+BENCH_DATA_DIR = os.getenv(
+    "BENCH_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+)
+
+# Bounding box of the start points (Switzerland)
+REGION = {"lat": (45.9, 47.7), "lon": (6.1, 10.4)}
+
+# (type, name template, share, speed range km/h, seconds between points, median points)
+PROFILES = [
+    ("Bike", "Fahrradtour {place}", 0.35, (14.0, 26.0), 4, 900),
+    ("Bike", "E-Bike Tour {place}", 0.10, (18.0, 28.0), 4, 1100),
+    ("Hike", "Wanderung {place}", 0.40, (3.5, 5.5), 8, 600),
+    ("Inline", "Inline {place}", 0.15, (12.0, 18.0), 4, 700),
+]
+POINTS_SIGMA = 0.6
+MIN_POINTS = 30
+MAX_POINTS = 10000
+
+PLACES = [
+    "Zürichsee", "Albis", "Uetliberg", "Pfannenstiel", "Greifensee", "Rigi", "Pilatus", "Emmental",
+    "Aareschlucht", "Thunersee", "Jura", "Napf", "Bodensee", "Rheinfall", "Säntis", "Walensee",
+    "Engadin", "Lavaux", "Seeland", "Tösstal",
+]
+
+EARTH_RADIUS_M = 6371000.0
+START_DATE = datetime(2015, 1, 1, tzinfo=timezone.utc)
+DATE_RANGE_DAYS = 11 * 365
+
+
+def _profile(rng):
+    value = rng.random()
+    for profile in PROFILES:
+        value -= profile[2]
+        if value <= 0:
+            return profile
+    return PROFILES[-1]
+
+
+def synthetic_tour(index: int, seed: int = DEFAULT_SEED, points_scale: float = 1.0) -> dict:
+    """
+    Generates tour number `index` of the dataset with the given seed.
+
+    Returns:
+        dict: name, type, ebike, komootid and the lats, lons, elevations and times of the track
+    """
+    rng = random.Random(f"{seed}:{index}")
+    tour_type, template, _, speeds, interval, median_points = _profile(rng)
+    points = int(median_points * points_scale * math.exp(rng.gauss(0, POINTS_SIGMA)))
+    points = max(MIN_POINTS, min(MAX_POINTS, points))
+    speed_ms = rng.uniform(*speeds) / 3.6
+
+    lat = rng.uniform(*REGION["lat"])
+    lon = rng.uniform(*REGION["lon"])
+    elevation = rng.uniform(300, 1800)
+    heading = rng.uniform(0, 2 * math.pi)
+    start = START_DATE + timedelta(days=rng.randrange(DATE_RANGE_DAYS), hours=rng.uniform(6, 16))
+    climb = 0.4 if tour_type == "Hike" else 0.25
+
+    lats, lons, elevations, times = [], [], [], []
+    for i in range(points):
+        lats.append(round(lat, 7))
+        lons.append(round(lon, 7))
+        elevations.append(round(elevation, 1))
+        times.append(start + timedelta(seconds=i * interval))
+        heading += rng.gauss(0, 0.3)
+        step = speed_ms * interval * rng.uniform(0.6, 1.4)
+        lat += math.degrees(step * math.cos(heading) / EARTH_RADIUS_M)
+        lon += math.degrees(step * math.sin(heading) / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+        elevation = min(3000.0, max(200.0, elevation + rng.gauss(0, climb * interval)))
+
+    name = template.format(place=rng.choice(PLACES))
+    return {
+        "name": f"{name} {index + 1}",
+        "type": tour_type,
+        "ebike": "E-Bike" in template,
+        # Every tour has a unique Komoot id, like tours exported from Komoot
+        "komootid": str(10**9 + seed * 10**7 + index),
+        "lats": lats,
+        "lons": lons,
+        "elevations": elevations,
+        "times": times,
+    }
+
+
+def _distance_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def tour_row(tour: dict, tour_id: int) -> tuple:
+    """Parameters of BULK_INSERT_TOUR_SQL and INSERT_TRACK_SQL for a synthetic tour."""
+    from utils.tour_metrics import METRICS_VERSION
+    from utils.track_store import encode_track
+
+    lats, lons, elevations, times = tour["lats"], tour["lons"], tour["elevations"], tour["times"]
+    distance = sum(_distance_m(lats[i], lons[i], lats[i + 1], lons[i + 1]) for i in range(len(lats) - 1))
+    duration = (times[-1] - times[0]).total_seconds()
+    climbs = [elevations[i + 1] - elevations[i] for i in range(len(elevations) - 1)]
+    params = {
+        "id": tour_id,
+        "name": tour["name"],
+        "type": tour["type"],
+        "date": times[0].isoformat(),
+        "distance": distance / 1000,
+        "duration": duration,
+        "start_lat": lats[0],
+        "start_lon": lons[0],
+        "track_geojson": json.dumps({"type": "LineString", "coordinates": [list(p) for p in zip(lons, lats)]}),
+        "komootid": tour["komootid"],
+        "komoothref": f"https://www.komoot.de/tour/{tour['komootid']}",
+        "ebike": tour["ebike"],
+        "speed_kmh": round(distance / 1000 / (duration / 3600), 2) if duration else 0.0,
+        "elevation_up": round(sum(c for c in climbs if c > 0), 2),
+        "elevation_down": round(-sum(c for c in climbs if c < 0), 2),
+        "metrics_version": METRICS_VERSION,
+        "source_format": "gpx",
+    }
+    return params, {"tour_id": tour_id, **encode_track(lats, lons, elevations, times)}
+
+
+def dataset_path(tours: int, seed: int = DEFAULT_SEED, points_scale: float = 1.0) -> str:
+    scale = "" if points_scale == 1.0 else f"-x{points_scale:g}"
+    return os.path.join(BENCH_DATA_DIR, f"tours-{tours}-seed{seed}{scale}-v{GENERATOR_VERSION}.db")
+
+
+def build_database(path: str, tours: int, seed: int = DEFAULT_SEED, points_scale: float = 1.0,
+                   batch_size: int = 1000) -> dict:
+    """
+    Creates a tour database with `tours` synthetic tours (tours and tour_tracks tables).
+
+    Returns:
+        dict: tours, points and seconds
+    """
+    from sqlalchemy import create_engine, text
+
+    from import_gpx import BULK_INSERT_TOUR_SQL
+    from utils.schema import TOUR_TRACKS_TABLE_SQL, TOURS_TABLE_SQL, create_tours_indexes
+    from utils.track_store import INSERT_TRACK_SQL
+
+    started = time.monotonic()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    partial = f"{path}.partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    engine = create_engine(f"sqlite:///{partial}")
+    points = 0
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA synchronous = OFF"))
+        with connection.begin():
+            connection.execute(text(TOURS_TABLE_SQL))
+            connection.execute(text(TOUR_TRACKS_TABLE_SQL))
+        for first in range(0, tours, batch_size):
+            rows, tracks = [], []
+            for index in range(first, min(first + batch_size, tours)):
+                tour = synthetic_tour(index, seed, points_scale)
+                points += len(tour["lats"])
+                row, track = tour_row(tour, index + 1)
+                rows.append(row)
+                tracks.append(track)
+            with connection.begin():
+                connection.execute(text(BULK_INSERT_TOUR_SQL), rows)
+                connection.execute(text(INSERT_TRACK_SQL), tracks)
+        with connection.begin():
+            create_tours_indexes(connection)
+        connection.execute(text("ANALYZE"))
+    engine.dispose()
+    # Renamed at the end, an interrupted run never leaves a half-built dataset
+    os.replace(partial, path)
+    return {"tours": tours, "points": points, "seconds": round(time.monotonic() - started, 1)}
+
+
+def cached_database(tours: int, seed: int = DEFAULT_SEED, points_scale: float = 1.0) -> str:
+    """Path of the dataset, built on first use."""
+    path = dataset_path(tours, seed, points_scale)
+    if not os.path.exists(path):
+        build_database(path, tours, seed, points_scale)
+    return path
+
+
+def gpx_document(tour: dict) -> bytes:
+    """GPX 1.1 file of a synthetic tour, like a Komoot export."""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<gpx version="1.1" creator="tourmanager-synthetic" xmlns="http://www.topografix.com/GPX/1/1">',
+        f'  <metadata><name>{tour["name"]}</name></metadata>',
+        f'  <trk><name>{tour["name"]}</name><link href="https://www.komoot.de/tour/{tour["komootid"]}"/><trkseg>',
+    ]
+    for lat, lon, elevation, moment in zip(tour["lats"], tour["lons"], tour["elevations"], tour["times"]):
+        lines.append(f'    <trkpt lat="{lat}" lon="{lon}"><ele>{elevation}</ele>'
+                     f'<time>{moment.strftime("%Y-%m-%dT%H:%M:%SZ")}</time></trkpt>')
+    lines.append("  </trkseg></trk>")
+    lines.append("</gpx>")
+    return "\n".join(lines).encode()
+
+
+def kml_document(tour: dict) -> bytes:
+    """KML file with a gx:Track, like the KML exports the KML import was written for."""
+    whens = "\n".join(f"        <when>{moment.strftime('%Y-%m-%dT%H:%M:%SZ')}</when>" for moment in tour["times"])
+    coords = "\n".join(f"        <gx:coord>{lon} {lat} {elevation}</gx:coord>"
+                       for lat, lon, elevation in zip(tour["lats"], tour["lons"], tour["elevations"]))
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+  <Document>
+    <name>{tour["name"]}</name>
+    <Placemark>
+      <name>{tour["name"]}</name>
+      <gx:Track>
+{whens}
+{coords}
+      </gx:Track>
+    </Placemark>
+  </Document>
+</kml>
+""".encode()
+
+
+def kmz_document(tours: list) -> bytes:
+    """KMZ archive with one KML document per tour."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for i, tour in enumerate(tours):
+            archive.writestr("doc.kml" if i == 0 else f"tours/tour{i}.kml", kml_document(tour))
+    return buffer.getvalue()
+
+
+def upload_file(kind: str, index: int, seed: int = DEFAULT_SEED, points_scale: float = 1.0):
+    """
+    (filename, content) of an upload file; index selects the tour(s), so
+    different indexes are different tours (distinct Komoot ids).
+    """
+    # Upload tours use their own id range, they never collide with a dataset
+    tour = synthetic_tour(10**6 + index, seed, points_scale)
+    if kind == "gpx":
+        return f"upload-{index}.gpx", gpx_document(tour)
+    if kind == "kml":
+        return f"upload-{index}.kml", kml_document(tour)
+    if kind == "kmz":
+        second = synthetic_tour(2 * 10**6 + index, seed, points_scale)
+        return f"upload-{index}.kmz", kmz_document([tour, second])
+    raise ValueError(f"Unknown upload file type: {kind}")
+
+
+def write_upload_files(directory: str, count: int, seed: int = DEFAULT_SEED, kinds=("gpx", "kml", "kmz")) -> list:
+    """Writes `count` upload files per type into directory and returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for kind in kinds:
+        for index in range(count):
+            name, content = upload_file(kind, index, seed)
+            path = os.path.join(directory, name)
+            with open(path, "wb") as upload:
+                upload.write(content)
+            paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic synthetic tour data")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--points-scale", type=float, default=1.0, help="Factor on the number of track points")
+    commands = parser.add_subparsers(dest="command", required=True)
+    database = commands.add_parser("database", help="Build (or rebuild) a tour database")
+    database.add_argument("--tours", default="1k", help="Number of tours or 1k / 10k / 100k")
+    database.add_argument("--out", help=f"Database file (default: cached dataset in {BENCH_DATA_DIR})")
+    files = commands.add_parser("files", help="Write GPX, KML and KMZ upload files")
+    files.add_argument("--count", type=int, default=10, help="Files per type")
+    files.add_argument("--out", required=True, help="Target directory")
+    args = parser.parse_args()
+
+    if args.command == "database":
+        tours = SIZES.get(args.tours) or int(args.tours)
+        path = args.out or dataset_path(tours, args.seed, args.points_scale)
+        result = build_database(path, tours, args.seed, args.points_scale)
+        with sqlite3.connect(path) as connection:
+            size_mb = connection.execute(
+                "SELECT page_count * page_size / 1048576.0 FROM pragma_page_count(), pragma_page_size()"
+            ).fetchone()[0]
+        print(f"{result['tours']} tours, {result['points']} track points, {size_mb:.0f} MB "
+              f"in {result['seconds']}s: {path}")
+    else:
+        paths = write_upload_files(args.out, args.count, args.seed)
+        print(f"{len(paths)} files written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,256 +1,377 @@
-import gpxpy
-import gpxpy.gpx
-import sqlite3
-import os
-import json
-from sqlalchemy import create_engine, text
-
-# --- Konfiguration ---
-GPX_FOLDER = '../touren'  # <-- HIER DEINEN PFAD EINFÜGEN
-
-# Set default database path based on environment
-if os.getenv("DOCKER_ENV") == "true":
-    DATABASE_FILE = "/app/data/tourmanager.db"
-else:
-    DATABASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tourmanager.db')
-
-# Allow override via environment variable
-DATABASE_FILE = os.getenv("DATABASE_PATH", DATABASE_FILE)
-
-engine = create_engine(f'sqlite:///{DATABASE_FILE}')
-
-def parse_and_store_gpx(file_path):
-    """Liest eine GPX-Datei, extrahiert die Daten und speichert sie in der DB."""
-    print(f"Verarbeite: {file_path}")
-    try:
-        with open(file_path, 'r', encoding='utf-8') as gpx_file:
-            gpx = gpxpy.parse(gpx_file)
-    except Exception as e:
-        print(f"Error parsing GPX file: {e}")
-        # Try with different encoding as a fallback
-        try:
-            with open(file_path, 'r', encoding='latin-1') as gpx_file:
-                gpx = gpxpy.parse(gpx_file)
-            print("Successfully parsed using latin-1 encoding")
-        except Exception as e2:
-            print(f"Failed with alternative encoding too: {e2}")
-            return "error"
-
-    # Metadaten auslesen
-    tour_name = gpx.name or os.path.splitext(os.path.basename(file_path))[0]
-    print(f"Tour name: {tour_name}")
-    
-    # Name bereinigen: '(Completed)' entfernen
-    if '(Completed)' in tour_name:
-        tour_name = tour_name.replace('(Completed)', '').strip()
-    
-    # Tour-Typ basierend auf Name bestimmen
-    tour_name_lower = tour_name.lower()
-    if 'fahrradtour' in tour_name_lower:
-        tour_type = 'Bike'
-    elif 'wanderung' in tour_name_lower:
-        tour_type = 'Hike'
-    elif 'inline' in tour_name_lower:
-        tour_type = 'Inline'
-    elif 'mountainbike' in tour_name_lower:
-        tour_type = 'Bike'
-    elif 'e-bike' in tour_name_lower:
-        tour_type = 'Bike'
-    else:
-        tour_type = 'Undefined'
-    
-    # E-Bike erkennen
-    is_ebike = 'e-bike' in tour_name_lower or 'ebike' in tour_name_lower or 'husq' in tour_name_lower
-    
-    moving_data = gpx.get_moving_data()
-    
-    # Höhendaten berechnen
-    uphill, downhill = gpx.get_uphill_downhill()
-    elevation_up = uphill if uphill else 0.0
-    elevation_down = downhill if downhill else 0.0
-    
-    # Geschwindigkeit berechnen (km/h)
-    speed_kmh = 0.0
-    distance_km = 0.0
-    if moving_data and moving_data.moving_time and moving_data.moving_time > 0:
-        # Geschwindigkeit = Distanz (km) / Zeit (h)
-        distance_km = moving_data.moving_distance / 1000
-        time_hours = moving_data.moving_time / 3600
-        speed_kmh = distance_km / time_hours
-    
-    # Tour-Typ korrigieren falls "Undefined" basierend auf Geschwindigkeit
-    if tour_type == 'Undefined' and speed_kmh > 0:
-        if speed_kmh < 8:
-            tour_type = 'Hike'
-        elif 8 <= speed_kmh < 15:
-            tour_type = 'Inline'
-        else:
-            tour_type = 'Bike'
-            
-    # Für KML Dateien: Wenn die Geschwindigkeit zwischen 8 und 15 km/h ist und der Typ nicht explizit definiert wurde,
-    # dann ist es wahrscheinlich eine Inline-Tour
-    file_ext = os.path.splitext(file_path.lower())[1]
-    if file_ext == '.kml' and 8 <= speed_kmh < 15 and tour_type not in ['Inline']:
-        print(f"KML file with speed {speed_kmh} km/h detected as Inline tour")
-        tour_type = 'Inline'
-    
-    # GeoJSON für die Karte erstellen und ersten Trackpunkt mit Timestamp finden
-    # Gleichzeitig Komoot ID und href aus Track-Link-Element extrahieren
-    points = []
-    first_point_time = None
-    first_waypoint_time = None
-    komoot_id = None
-    komoot_href = None
-    import re
-    
-    # First check waypoints for timestamps - prioritize these for KML imports
-    if gpx.waypoints:
-        for waypoint in gpx.waypoints:
-            if waypoint.time:
-                first_waypoint_time = waypoint.time
-                print(f"Found timestamp from waypoint: {first_waypoint_time.isoformat()}")
-                break
-    
-    for track in gpx.tracks:
-        # Komoot ID und href aus Link-Element im Track extrahieren
-        if komoot_id is None and hasattr(track, 'link') and track.link:
-            if isinstance(track.link, str) and 'komoot' in track.link.lower():
-                komoot_href = track.link  # Gesamte URL speichern
-                # Extrahiere ID aus URLs wie https://www.komoot.de/tour/123456789
-                match = re.search(r'/tour/(\d+)', track.link)
-                if match:
-                    komoot_id = match.group(1)
-        
-        for segment in track.segments:
-            for point in segment.points:
-                # Format: [Longitude, Latitude]
-                points.append([point.longitude, point.latitude])
-                
-                # Timestamp vom ersten Trackpunkt verwenden wenn kein Waypoint-Timestamp existiert
-                if first_point_time is None and point.time:
-                    first_point_time = point.time
-
-    if not points:
-        print(f"Warnung: Tour {tour_name} hat keine Trackpunkte und wird übersprungen.")
-        return "skipped"
-
-    # Prüfen ob Komoot ID bereits in der Datenbank existiert
-    if komoot_id:
-        with engine.connect() as connection:
-            check_stmt = text("SELECT COUNT(*) FROM tours WHERE komootid = :komootid")
-            result = connection.execute(check_stmt, {"komootid": komoot_id})
-            exists = result.fetchone()[0] > 0
-            
-            if exists:
-                print(f"Tour mit Komoot ID {komoot_id} existiert bereits - übersprungen")
-                return "exists"
-
-    # Tour-Datum: Verwende Timestamp vom ersten Waypoint (für KML), dann ersten Trackpunkt, sonst Fallback
-    if first_waypoint_time:
-        tour_date = first_waypoint_time.isoformat()
-        print(f"Using timestamp from first waypoint: {tour_date}")
-    else:
-        tour_date = first_point_time.isoformat() if first_point_time else (gpx.time.isoformat() if gpx.time else '1970-01-01T00:00:00Z')
-        print(f"Using timestamp from track point or fallback: {tour_date}")
-    
-    start_lon, start_lat = points[0]
-    
-    track_geojson_str = json.dumps({
-        "type": "LineString",
-        "coordinates": points
-    })
-    
-    # Print debugging information
-    print(f"Tour data to be inserted:")
-    print(f"- Name: {tour_name}")
-    print(f"- Type: {tour_type}")
-    print(f"- Date: {tour_date}")
-    print(f"- Komoot ID: {komoot_id}")
-    print(f"- Komoot URL: {komoot_href}")
-    print(f"- Points: {len(points)} track points")
-    print(f"- Distance: {distance_km} km")
-    print(f"- Database path: {DATABASE_FILE}")
-    
-    # In die Datenbank schreiben
-    try:
-        with engine.begin() as connection:
-            stmt = text("""
-                INSERT INTO tours (name, type, date, distance_km, duration_s, start_lat, start_lon, track_geojson, komootid, komoothref, ebike, speed_kmh, elevation_up, elevation_down)
-                VALUES (:name, :type, :date, :distance, :duration, :start_lat, :start_lon, :track_geojson, :komootid, :komoothref, :ebike, :speed_kmh, :elevation_up, :elevation_down)
-            """)
-            connection.execute(stmt, {
-                "name": tour_name,
-                "type": tour_type,
-                "date": tour_date,
-                "ebike": is_ebike,
-                "speed_kmh": round(speed_kmh, 2),
-                "distance": distance_km,
-                "duration": moving_data.moving_time if moving_data else 0,
-                "start_lat": start_lat,
-                "start_lon": start_lon,
-                "track_geojson": track_geojson_str,
-                "komootid": komoot_id,
-                "komoothref": komoot_href,
-                "elevation_up": round(elevation_up, 2),
-                "elevation_down": round(elevation_down, 2)
-            })
-            print("Tour successfully inserted into database")
-            return "imported"
-    except Exception as e:
-        print(f"Error inserting tour into database: {e}")
-        import traceback
-        print(traceback.format_exc())
-        return "error"
-
-if __name__ == '__main__':
-    # Initialisiere die Datenbank-Tabelle, falls sie nicht existiert
-    with engine.begin() as connection:
-        connection.execute(text("""
-            CREATE TABLE IF NOT EXISTS tours (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                name TEXT NOT NULL, 
-                type TEXT, 
-                date TEXT NOT NULL,
-                ebike BOOLEAN DEFAULT 0,
-                speed_kmh REAL DEFAULT 0,
-                distance_km REAL, 
-                duration_s REAL, 
-                elevation_up REAL DEFAULT 0,
-                elevation_down REAL DEFAULT 0,
-                start_lat REAL, 
-                start_lon REAL, 
-                komootid TEXT UNIQUE,
-                komoothref TEXT,
-                track_geojson TEXT NOT NULL
-            );
-        """))
-        
-        # Index auf komootid erstellen für bessere Performance
-        connection.execute(text("""
-            CREATE INDEX IF NOT EXISTS idx_komootid ON tours(komootid);
-        """))
-        
-        # connection.commit() -- not needed with begin()
-
-    # Alle GPX-Dateien im Ordner verarbeiten
-    imported_count = 0
-    existing_count = 0
-    skipped_count = 0
-    
-    for filename in os.listdir(GPX_FOLDER):
-        if filename.lower().endswith('.gpx'):
-            full_path = os.path.join(GPX_FOLDER, filename)
-            result = parse_and_store_gpx(full_path)
-            
-            if result == "imported":
-                imported_count += 1
-            elif result == "exists":
-                existing_count += 1
-            elif result == "skipped":
-                skipped_count += 1
-    
-    print(f"✅ Import abgeschlossen:")
-    print(f"   {imported_count} Touren importiert")
-    print(f"   {existing_count} Touren bereits vorhanden")
-    if skipped_count > 0:
-        print(f"   {skipped_count} Touren übersprungen (keine Trackpunkte)")
\ No newline at end of file
+import gpxpy
+import gpxpy.gpx
+import sqlite3
+import os
+import re
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import create_engine, text
+
+from utils.schema import create_tours_indexes, drop_tours_indexes, ensure_tours_schema
+from utils.tour_metrics import METRICS_VERSION, clean_tour_name, derive_metrics
+from utils.track_store import INSERT_TRACK_SQL, store_track, track_from_gpx
+
+# --- Konfiguration ---
+GPX_FOLDER = '../touren'  # <-- HIER DEINEN PFAD EINFÜGEN
+
+# Set default database path based on environment
+if os.getenv("DOCKER_ENV") == "true":
+    DATABASE_FILE = "/app/data/tourmanager.db"
+else:
+    DATABASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tourmanager.db')
+
+# Allow override via environment variable
+DATABASE_FILE = os.getenv("DATABASE_PATH", DATABASE_FILE)
+
+engine = create_engine(f'sqlite:///{DATABASE_FILE}')
+
+def read_gpx(file_path):
+    """Liest eine GPX-Datei (Pfad oder binäres Dateiobjekt) und gibt das gpxpy-Objekt zurück, None bei Fehlern."""
+    if hasattr(file_path, 'read'):
+        raw = file_path.read()
+    else:
+        with open(file_path, 'rb') as gpx_file:
+            raw = gpx_file.read()
+
+    try:
+        return gpxpy.parse(raw.decode('utf-8'))
+    except Exception as e:
+        print(f"Error parsing GPX file: {e}")
+        # Try with different encoding as a fallback
+        try:
+            gpx = gpxpy.parse(raw.decode('latin-1'))
+            print("Successfully parsed using latin-1 encoding")
+            return gpx
+        except Exception as e2:
+            print(f"Failed with alternative encoding too: {e2}")
+            return None
+
+def build_tour_record(gpx, source_name):
+    """Extrahiert Metadaten, abgeleitete Kennzahlen und Track einer Tour.
+
+    Gibt ein Dict mit den Spalten der tours-Tabelle zurück (plus 'points' mit den [lon, lat]-Paaren
+    und 'track' mit dem vollständigen, kodierten Track), oder None wenn die Tour keine Trackpunkte hat.
+    """
+    # Metadaten auslesen und Name bereinigen: '(Completed)' entfernen
+    tour_name = clean_tour_name(gpx.name or os.path.splitext(os.path.basename(source_name))[0])
+    file_ext = os.path.splitext(source_name.lower())[1]
+
+    # GeoJSON für die Karte erstellen und ersten Trackpunkt mit Timestamp finden
+    # Gleichzeitig Komoot ID und href aus Track-Link-Element extrahieren
+    points = []
+    first_point_time = None
+    first_waypoint_time = None
+    komoot_id = None
+    komoot_href = None
+
+    # First check waypoints for timestamps - prioritize these for KML imports
+    if gpx.waypoints:
+        for waypoint in gpx.waypoints:
+            if waypoint.time:
+                first_waypoint_time = waypoint.time
+                break
+
+    for track in gpx.tracks:
+        # Komoot ID und href aus Link-Element im Track extrahieren
+        if komoot_id is None and hasattr(track, 'link') and track.link:
+            if isinstance(track.link, str) and 'komoot' in track.link.lower():
+                komoot_href = track.link  # Gesamte URL speichern
+                # Extrahiere ID aus URLs wie https://www.komoot.de/tour/123456789
+                match = re.search(r'/tour/(\d+)', track.link)
+                if match:
+                    komoot_id = match.group(1)
+
+        for segment in track.segments:
+            for point in segment.points:
+                # Format: [Longitude, Latitude]
+                points.append([point.longitude, point.latitude])
+
+                # Timestamp vom ersten Trackpunkt verwenden wenn kein Waypoint-Timestamp existiert
+                if first_point_time is None and point.time:
+                    first_point_time = point.time
+
+    if not points:
+        print(f"Warnung: Tour {tour_name} hat keine Trackpunkte und wird übersprungen.")
+        return None
+
+    # Tour-Datum: Verwende Timestamp vom ersten Waypoint (für KML), dann ersten Trackpunkt, sonst Fallback
+    if first_waypoint_time:
+        tour_date = first_waypoint_time.isoformat()
+    else:
+        tour_date = first_point_time.isoformat() if first_point_time else (gpx.time.isoformat() if gpx.time else '1970-01-01T00:00:00Z')
+
+    start_lon, start_lat = points[0]
+
+    record = {
+        "name": tour_name,
+        "date": tour_date,
+        "start_lat": start_lat,
+        "start_lon": start_lon,
+        "komootid": komoot_id,
+        "komoothref": komoot_href,
+        "points": points,
+    }
+    record.update(derive_metrics(gpx, tour_name, file_ext))
+    record["metrics_version"] = METRICS_VERSION
+    # KML documents of a KMZ archive have their own .kml name, so this is "gpx" or "kml"
+    record["source_format"] = file_ext.lstrip('.') or None
+    record["track"] = track_from_gpx(gpx)
+    return record
+
+def tour_exists(connection, komoot_id):
+    """Prüft ob eine Tour mit dieser Komoot ID bereits in der Datenbank existiert."""
+    check_stmt = text("SELECT COUNT(*) FROM tours WHERE komootid = :komootid")
+    result = connection.execute(check_stmt, {"komootid": komoot_id})
+    return result.fetchone()[0] > 0
+
+def tour_insert_params(record):
+    """Parameter für INSERT_TOUR_SQL aus einem Tour-Record."""
+    return {
+        "name": record["name"],
+        "type": record["type"],
+        "date": record["date"],
+        "ebike": record["ebike"],
+        "speed_kmh": record["speed_kmh"],
+        "distance": record["distance_km"],
+        "duration": record["duration_s"],
+        "start_lat": record["start_lat"],
+        "start_lon": record["start_lon"],
+        "track_geojson": json.dumps({
+            "type": "LineString",
+            "coordinates": record["points"]
+        }),
+        "komootid": record["komootid"],
+        "komoothref": record["komoothref"],
+        "elevation_up": record["elevation_up"],
+        "elevation_down": record["elevation_down"],
+        "metrics_version": record["metrics_version"],
+        "source_format": record["source_format"],
+    }
+
+INSERT_TOUR_SQL = """
+    INSERT INTO tours (name, type, date, distance_km, duration_s, start_lat, start_lon, track_geojson, komootid, komoothref, ebike, speed_kmh, elevation_up, elevation_down, metrics_version, source_format)
+    VALUES (:name, :type, :date, :distance, :duration, :start_lat, :start_lon, :track_geojson, :komootid, :komoothref, :ebike, :speed_kmh, :elevation_up, :elevation_down, :metrics_version, :source_format)
+"""
+
+def parse_and_store_gpx(file_path, source_name=None):
+    """Liest eine GPX-Datei, extrahiert die Daten und speichert sie in der DB.
+
+    file_path kann ein Pfad oder ein binäres Dateiobjekt (z.B. ein gespoolter Upload) sein.
+    source_name ersetzt in diesem Fall den Dateinamen für Tour-Name und Dateiendung.
+    """
+    if source_name is None:
+        source_name = file_path if isinstance(file_path, str) else 'upload.gpx'
+    print(f"Verarbeite: {source_name}")
+
+    gpx = read_gpx(file_path)
+    if gpx is None:
+        return "error"
+
+    return store_tour(gpx, source_name)
+
+def store_tour(gpx, source_name):
+    """Speichert eine bereits geparste Tour (gpxpy-Objekt, z.B. aus kml_to_gpx) in der DB.
+
+    source_name ist der Name der Original-Datei; er liefert den Fallback-Namen der Tour und
+    die Dateiendung für die Typ-Heuristik. Gibt "imported", "exists", "skipped" oder "error" zurück.
+    """
+    record = build_tour_record(gpx, source_name)
+    if record is None:
+        return "skipped"
+
+    ensure_tours_schema(engine)
+
+    # Prüfen ob Komoot ID bereits in der Datenbank existiert
+    if record["komootid"]:
+        with engine.connect() as connection:
+            if tour_exists(connection, record["komootid"]):
+                print(f"Tour mit Komoot ID {record['komootid']} existiert bereits - übersprungen")
+                return "exists"
+
+    # Print debugging information
+    print(f"Tour data to be inserted:")
+    print(f"- Name: {record['name']}")
+    print(f"- Type: {record['type']}")
+    print(f"- Date: {record['date']}")
+    print(f"- Komoot ID: {record['komootid']}")
+    print(f"- Komoot URL: {record['komoothref']}")
+    print(f"- Points: {len(record['points'])} track points")
+    print(f"- Distance: {record['distance_km']} km")
+    print(f"- Database path: {DATABASE_FILE}")
+
+    # In die Datenbank schreiben
+    try:
+        with engine.begin() as connection:
+            result = connection.execute(text(INSERT_TOUR_SQL), tour_insert_params(record))
+            # Vollständigen Track (Zeit, Höhe, Lat, Lon) in tour_tracks speichern
+            store_track(connection, result.lastrowid, record["track"])
+            print("Tour successfully inserted into database")
+            return "imported"
+    except Exception as e:
+        print(f"Error inserting tour into database: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return "error"
+
+def import_folder(folder):
+    """Importiert alle GPX-Dateien eines Ordners einzeln (Standard-Modus)."""
+    # Initialisiere die Datenbank-Tabelle und Indizes, falls sie nicht existieren
+    ensure_tours_schema(engine)
+
+    # Alle GPX-Dateien im Ordner verarbeiten
+    imported_count = 0
+    existing_count = 0
+    skipped_count = 0
+
+    for filename in os.listdir(folder):
+        if filename.lower().endswith('.gpx'):
+            full_path = os.path.join(folder, filename)
+            result = parse_and_store_gpx(full_path)
+
+            if result == "imported":
+                imported_count += 1
+            elif result == "exists":
+                existing_count += 1
+            elif result == "skipped":
+                skipped_count += 1
+
+    print(f"✅ Import abgeschlossen:")
+    print(f"   {imported_count} Touren importiert")
+    print(f"   {existing_count} Touren bereits vorhanden")
+    if skipped_count > 0:
+        print(f"   {skipped_count} Touren übersprungen (keine Trackpunkte)")
+
+# --- Bulk-Load für den Erstimport grosser Archive ---
+
+BULK_INSERT_TOUR_SQL = """
+    INSERT INTO tours (id, name, type, date, distance_km, duration_s, start_lat, start_lon, track_geojson, komootid, komoothref, ebike, speed_kmh, elevation_up, elevation_down, metrics_version, source_format)
+    VALUES (:id, :name, :type, :date, :distance, :duration, :start_lat, :start_lon, :track_geojson, :komootid, :komoothref, :ebike, :speed_kmh, :elevation_up, :elevation_down, :metrics_version, :source_format)
+"""
+
+def load_for_bulk(file_path):
+    """Liest eine GPX-Datei für den Bulk-Load (läuft in den Worker-Prozessen).
+
+    Gibt (Status, Insert-Parameter, kodierter Track) zurück; Status ist "parsed", "skipped" oder "error".
+    """
+    gpx = read_gpx(file_path)
+    if gpx is None:
+        return "error", None, None
+    record = build_tour_record(gpx, file_path)
+    if record is None:
+        return "skipped", None, None
+    return "parsed", tour_insert_params(record), record["track"]
+
+def bulk_import(folder, batch_size=5000, workers=None):
+    """Importiert alle GPX-Dateien eines Ordners im Bulk-Load-Modus.
+
+    Die Sekundär-Indizes der tours-Tabelle werden während des Imports entfernt, die Touren
+    mit executemany in grossen Transaktionen bei PRAGMA synchronous = OFF geschrieben und
+    die Indizes am Ende neu aufgebaut. ANALYZE aktualisiert danach die Statistiken des
+    Query-Planers. Gibt ein Dict mit Zählern und Laufzeiten zurück.
+    """
+    ensure_tours_schema(engine)
+    files = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith('.gpx'))
+    counts = {"imported": 0, "exists": 0, "skipped": 0, "error": 0, "points": 0}
+    timings = {"insert": 0.0}
+    started = time.monotonic()
+    print(f"Bulk-Import von {len(files)} Dateien aus {folder} (Datenbank: {DATABASE_FILE})")
+
+    with engine.connect() as connection:
+        synchronous = connection.execute(text("PRAGMA synchronous")).scalar()
+        # Bei einem Absturz während des Erstimports wird einfach neu importiert
+        connection.execute(text("PRAGMA synchronous = OFF"))
+
+        # Duplikate werden im Speicher erkannt statt per Abfrage pro Tour
+        known_ids = {row[0] for row in connection.execute(
+            text("SELECT komootid FROM tours WHERE komootid IS NOT NULL"))}
+        # IDs selbst vergeben, damit die Tracks ohne lastrowid zugeordnet werden können;
+        # wie bei AUTOINCREMENT werden IDs gelöschter Touren nicht wiederverwendet
+        next_id = connection.execute(text("""
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'tours'), 0),
+                       COALESCE((SELECT MAX(id) FROM tours), 0))
+        """)).scalar() + 1
+
+        with connection.begin():
+            drop_tours_indexes(connection)
+
+        def flush(tours, tracks):
+            if not tours:
+                return
+            insert_started = time.monotonic()
+            with connection.begin():
+                connection.execute(text(BULK_INSERT_TOUR_SQL), tours)
+                connection.execute(text(INSERT_TRACK_SQL), tracks)
+            timings["insert"] += time.monotonic() - insert_started
+            counts["imported"] += len(tours)
+            elapsed = time.monotonic() - started
+            print(f"  {counts['imported']} Touren geschrieben ({counts['imported'] / elapsed:.0f} Touren/s)", flush=True)
+
+        try:
+            executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+            try:
+                results = executor.map(load_for_bulk, files, chunksize=16) if executor else map(load_for_bulk, files)
+                tours, tracks = [], []
+                for status, params, track in results:
+                    if status != "parsed":
+                        counts[status] += 1
+                        continue
+                    if params["komootid"]:
+                        if params["komootid"] in known_ids:
+                            counts["exists"] += 1
+                            continue
+                        known_ids.add(params["komootid"])
+
+                    tours.append({"id": next_id, **params})
+                    tracks.append({"tour_id": next_id, **track})
+                    counts["points"] += track["point_count"]
+                    next_id += 1
+
+                    if len(tours) >= batch_size:
+                        flush(tours, tracks)
+                        tours, tracks = [], []
+                flush(tours, tracks)
+            finally:
+                if executor:
+                    executor.shutdown()
+        finally:
+            # Indizes auch nach einem Fehler wiederherstellen
+            step_started = time.monotonic()
+            with connection.begin():
+                create_tours_indexes(connection)
+            timings["indexes"] = time.monotonic() - step_started
+
+            step_started = time.monotonic()
+            connection.execute(text("ANALYZE"))
+            timings["analyze"] = time.monotonic() - step_started
+
+            connection.execute(text(f"PRAGMA synchronous = {int(synchronous)}"))
+
+    timings["total"] = time.monotonic() - started
+    total = timings["total"] or 1e-9
+    insert = timings["insert"] or 1e-9
+    print(f"✅ Bulk-Import abgeschlossen in {timings['total']:.1f}s:")
+    print(f"   {counts['imported']} Touren importiert ({counts['imported'] / total:.0f} Touren/s gesamt, "
+          f"{counts['imported'] / insert:.0f} Touren/s und {counts['points'] / insert:.0f} Trackpunkte/s beim Schreiben)")
+    print(f"   {counts['exists']} Touren bereits vorhanden")
+    if counts["skipped"] > 0:
+        print(f"   {counts['skipped']} Touren übersprungen (keine Trackpunkte)")
+    if counts["error"] > 0:
+        print(f"   {counts['error']} Dateien fehlerhaft")
+    print(f"   Schreiben {timings['insert']:.1f}s, Indizes {timings['indexes']:.1f}s, ANALYZE {timings['analyze']:.1f}s")
+    return {**counts, "timings": timings}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Importiert GPX-Dateien in die Tour-Datenbank.")
+    parser.add_argument("folder", nargs="?", default=GPX_FOLDER, help="Ordner mit den GPX-Dateien")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Bulk-Load für den Erstimport grosser Archive (Indizes verzögert, grosse Transaktionen)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Touren pro Transaktion im Bulk-Load")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker-Prozesse zum Parsen im Bulk-Load")
+    args = parser.parse_args()
+
+    if args.bulk:
+        bulk_import(args.folder, args.batch_size, args.workers)
+    else:
+        import_folder(args.folder)
@@ -1,7 +1,9 @@
-from database import SessionLocal
+from database import SessionLocal, engine
 from auth import create_initial_admin
+from utils.migrations import run_migrations
 
 def init_db():
+    run_migrations(engine)
     db = SessionLocal()
     try:
         create_initial_admin(db)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"""
+Load test: replayed user sessions against the full API.
+
+Starts uvicorn with several worker processes on a copy of a synthetic tour
+dataset (benchmarks/synthetic.py) and lets concurrent virtual users replay
+sessions as the frontend sends them:
+
+    login, tour types, summary, map GeoJSON (sometimes filtered by type),
+    a few tour details, a nearby search and, now and then, a batch upload
+
+Every user runs sessions back to back, with a think time between the
+requests, until the duration is over. Everything runs locally, no request
+leaves the machine. The report shows the throughput and per route the
+number of requests, p50/p95/p99 latency and the error rate (HTTP status >= 400
+or no response).
+
+Usage:
+    python loadtest_api.py [--workers 2] [--users 20] [--duration 60] [--tours 1k]
+    python loadtest_api.py --url http://localhost:8000   # existing instance, writes uploads to its database
+
+Sessions are generated from --seed, so two runs send the same requests in
+the same order per user.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.synthetic import SIZES, cached_database, upload_file
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Session steps
+DETAILS_PER_SESSION = 3
+UPLOAD_FILES = ("gpx", "gpx", "kml", "kmz")
+NEARBY_RADIUS_KM = 10.0
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def prepare_database(directory, tours, seed):
+    """Copies the synthetic dataset and adds the user tables and the admin."""
+    count = SIZES.get(tours) or int(tours)
+    path = os.path.join(directory, "tourmanager.db")
+    started = time.monotonic()
+    shutil.copyfile(cached_database(count, seed), path)
+    # In a child process: database.py reads DATABASE_PATH when it is imported
+    setup = "import database, init_db; database.init_db(); init_db.init_db()"
+    subprocess.run([sys.executable, "-c", setup], cwd=BACKEND_DIR, check=True,
+                   env={**os.environ, "DATABASE_PATH": path, "LOG_LEVEL": "WARNING"})
+    print(f"Dataset: {count} tours (seed {seed}), prepared in {time.monotonic() - started:.1f} s")
+    return path
+
+
+def start_server(database_path, workers, port, log_path):
+    env = {**os.environ, "DATABASE_PATH": database_path, "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING")}
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    log_file = open(log_path, "w")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(base_url, server, timeout):
+    """Waits until /health/ready answers 200 several times in a row (every worker has started)."""
+    deadline = time.monotonic() + timeout
+    ready = 0
+    async with httpx.AsyncClient(base_url=base_url, trust_env=False, timeout=5) as client:
+        while ready < 10:
+            if server is not None and server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{base_url} not ready after {timeout:.0f} s")
+            try:
+                ready = ready + 1 if (await client.get("/health/ready")).status_code == 200 else 0
+            except httpx.TransportError:
+                ready = 0
+            await asyncio.sleep(0.2)
+
+
+class Recorder:
+    """Latency and status of every request, per route."""
+
+    def __init__(self):
+        self.requests = []
+        self.sessions = 0
+        self.stop = False
+
+    async def request(self, client, route, method, url, **kwargs):
+        """Sends and records a request; returns the response if it succeeded, otherwise None."""
+        if self.stop:
+            return None
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response = None
+            status = type(e).__name__
+        self.requests.append((route, status, time.perf_counter() - started))
+        return response if response is not None and response.status_code < 400 else None
+
+
+class Session:
+    """One replayed user session; all random choices come from rng."""
+
+    def __init__(self, client, recorder, rng, args, username, password, session_id):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.args = args
+        self.username = username
+        self.password = password
+        self.session_id = session_id
+
+    async def think(self):
+        if self.args.think > 0 and not self.recorder.stop:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.args.think)
+
+    def upload_files(self):
+        # Unique per session and file, so every upload is a new tour
+        return [("files", upload_file(kind, self.session_id * len(UPLOAD_FILES) + i, self.args.seed))
+                for i, kind in enumerate(UPLOAD_FILES)]
+
+    async def run(self):
+        record = self.recorder.request
+        response = await record(self.client, "POST /token", "POST", "/token",
+                                data={"username": self.username, "password": self.password})
+        if response is None:
+            return
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        await self.think()
+
+        response = await record(self.client, "GET /api/tours/types", "GET", "/api/tours/types")
+        types = response.json()["types"] if response is not None else []
+        await self.think()
+        await record(self.client, "GET /api/tours/summary", "GET", "/api/tours/summary")
+        await self.think()
+
+        # The map loads all tours, or the tours of one type when the filter is set
+        params = {"limit": 999999}
+        if types and self.rng.random() < self.args.filter_probability:
+            params["tour_type"] = self.rng.choice(types)
+        response = await record(self.client, "GET /api/tours/geojson", "GET", "/api/tours/geojson", params=params)
+        features = response.json().get("features", []) if response is not None else []
+        await self.think()
+
+        for feature in self.rng.sample(features, min(DETAILS_PER_SESSION, len(features))):
+            await record(self.client, "GET /api/tours/{id}", "GET", f"/api/tours/{feature['properties']['id']}")
+            await self.think()
+
+        if features:
+            lon, lat = self.rng.choice(features)["geometry"]["coordinates"][0]
+        else:
+            lat, lon = 46.8, 8.2
+        await record(self.client, "POST /api/tours/nearby", "POST", "/api/tours/nearby",
+                     json={"latitude": lat, "longitude": lon, "radius_km": NEARBY_RADIUS_KM})
+
+        if self.rng.random() < self.args.upload_probability:
+            await self.think()
+            files = await asyncio.to_thread(self.upload_files)
+            await record(self.client, "POST /api/tours/upload/batch", "POST", "/api/tours/upload/batch",
+                         files=files, headers=headers)
+
+
+async def virtual_user(user, client, recorder, args, username, password):
+    rng = random.Random(f"{args.seed}:user:{user}")
+    # Users start spread over the first think times, not all at once
+    await asyncio.sleep(rng.uniform(0, max(args.think, 0.1)))
+    session = 0
+    while not recorder.stop:
+        session_id = user * 100000 + session
+        await Session(client, recorder, rng, args, username, password, session_id).run()
+        if not recorder.stop:
+            recorder.sessions += 1
+        session += 1
+        if args.sessions and session >= args.sessions:
+            return
+
+
+def summarize(recorder, seconds):
+    routes = {}
+    for route, status, latency in recorder.requests:
+        routes.setdefault(route, []).append((status, latency))
+    summary = {
+        "seconds": round(seconds, 1),
+        "sessions": recorder.sessions,
+        "requests": len(recorder.requests),
+        "throughput_rps": round(len(recorder.requests) / seconds, 2) if seconds else 0.0,
+        "routes": {},
+    }
+    for route, results in sorted(routes.items()):
+        latencies_ms = [latency * 1000 for _, latency in results]
+        errors = {}
+        for status, _ in results:
+            if not isinstance(status, int) or status >= 400:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        summary["routes"][route] = {
+            "requests": len(results),
+            "rps": round(len(results) / seconds, 2) if seconds else 0.0,
+            "p50_ms": round(percentile(latencies_ms, 0.50), 1),
+            "p95_ms": round(percentile(latencies_ms, 0.95), 1),
+            "p99_ms": round(percentile(latencies_ms, 0.99), 1),
+            "max_ms": round(max(latencies_ms), 1),
+            "error_rate": round(sum(errors.values()) / len(results), 4),
+            "errors": errors,
+        }
+    return summary
+
+
+def report(summary):
+    print(f"\n{summary['requests']} requests in {summary['seconds']} s ({summary['throughput_rps']} req/s), "
+          f"{summary['sessions']} completed sessions")
+    print(f"{'Route':<30} {'n':>6} {'req/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    for route, stats in summary["routes"].items():
+        print(f"{route:<30} {stats['requests']:>6} {stats['rps']:>7.2f} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f} "
+              f"{stats['error_rate']:>7.1%}")
+        if stats["errors"]:
+            print(f"{'':<30} status codes: {stats['errors']}")
+
+
+async def main(args):
+    username = os.getenv("ADMIN_USERNAME", "admin")
+    password = os.getenv("ADMIN_PASSWORD", "admin123")
+
+    server = None
+    directory = None
+    base_url = args.url
+    if base_url is None:
+        directory = tempfile.mkdtemp(prefix="tourmanager-loadtest-")
+        database_path = prepare_database(directory, args.tours, args.seed)
+        port = args.port or free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(directory, "uvicorn.log")
+        server = start_server(database_path, args.workers, port, log_path)
+        print(f"uvicorn with {args.workers} workers on {base_url}, log: {log_path}")
+
+    try:
+        await wait_until_ready(base_url, server, args.startup_timeout)
+        recorder = Recorder()
+        limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+        async with httpx.AsyncClient(base_url=base_url, trust_env=False, timeout=args.timeout,
+                                     limits=limits) as client:
+            print(f"{args.users} users, {args.duration:.0f} s, think time {args.think} s")
+            started = time.perf_counter()
+            users = [asyncio.create_task(virtual_user(user, client, recorder, args, username, password))
+                     for user in range(args.users)]
+            await asyncio.wait(users, timeout=args.duration)
+            # Requests in flight are finished and counted, no new ones are sent
+            recorder.stop = True
+            await asyncio.gather(*users)
+            seconds = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    summary = summarize(recorder, seconds)
+    summary.update({"workers": args.workers if args.url is None else None, "users": args.users,
+                    "tours": args.tours if args.url is None else None, "seed": args.seed, "url": base_url})
+    report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(summary, json_file, indent=2)
+        print(f"Report written to {args.json}")
+    if directory and not args.keep:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay user sessions against the API under concurrent load")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds until no new requests are sent")
+    parser.add_argument("--sessions", type=int, default=0, help="Sessions per user (0: until the duration is over)")
+    parser.add_argument("--think", type=float, default=0.5, help="Mean think time between requests in seconds")
+    parser.add_argument("--upload-probability", type=float, default=0.1, help="Share of sessions with a batch upload")
+    parser.add_argument("--filter-probability", type=float, default=0.3,
+                        help="Share of map loads filtered by a tour type")
+    parser.add_argument("--tours", default="1k", help="Synthetic dataset: 1k, 10k, 100k or a number of tours")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the dataset and the sessions")
+    parser.add_argument("--url", help="Test a running instance instead of starting one")
+    parser.add_argument("--port", type=int, default=0, help="Port of the started instance (default: a free port)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Request timeout in seconds")
+    parser.add_argument("--startup-timeout", type=float, default=120.0, help="Seconds to wait for the instance")
+    parser.add_argument("--json", help="Also write the report as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary database and uvicorn log")
+    asyncio.run(main(parser.parse_args()))
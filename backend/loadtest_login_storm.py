@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Load test: latency of a read endpoint during a login storm.
+
+Runs the API in-process (httpx ASGI transport, one event loop like a uvicorn
+worker) against a temporary database. Readers call GET /api/tours/types in a
+loop, first alone and then while many logins are sent at once. With bcrypt on
+the event loop every login stalls the readers for the duration of a hash;
+with the password hashing pool the read latency stays close to the baseline.
+
+Usage:
+    python loadtest_login_storm.py [--logins 50] [--readers 4] [--inline]
+
+--inline verifies passwords on the event loop (the old behaviour) for comparison.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="tourmanager-loadtest-"), "loadtest.db"))
+
+import logging
+logging.disable(logging.WARNING)
+
+import httpx
+
+READ_URL = "/api/tours/types"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def report(label, latencies):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    print(f"{label:<24} n={len(latencies_ms):<5} "
+          f"p50={statistics.median(latencies_ms):7.1f} ms  "
+          f"p95={percentile(latencies_ms, 0.95):7.1f} ms  "
+          f"max={max(latencies_ms):7.1f} ms")
+
+
+async def reader(client, latencies, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get(READ_URL)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.005)
+
+
+async def run_readers(client, readers, until):
+    latencies = []
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(reader(client, latencies, stop)) for _ in range(readers)]
+    await until
+    stop.set()
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def login_storm(client, logins, username, password):
+    async def login():
+        started = time.perf_counter()
+        response = await client.post("/token", data={"username": username, "password": password})
+        return response.status_code, time.perf_counter() - started
+
+    return await asyncio.gather(*(login() for _ in range(logins)))
+
+
+async def main(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import auth
+    import database
+    import main as app_module
+    import models.activity  # noqa: F401 (registers the table for init_db)
+    from utils.schema import ensure_tours_schema
+
+    database.init_db()
+    ensure_tours_schema(database.engine)
+    auth.create_initial_admin()
+    username = os.getenv("ADMIN_USERNAME", "admin")
+    password = os.getenv("ADMIN_PASSWORD", "admin123")
+
+    if args.inline:
+        async def verify_inline(plain_password, hashed_password):
+            return auth.pwd_context.verify(plain_password, hashed_password)
+        auth.password_hasher.verify = verify_inline
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        baseline = await run_readers(client, args.readers, asyncio.sleep(args.baseline_seconds))
+
+        storm_started = time.perf_counter()
+        storm = asyncio.ensure_future(login_storm(client, args.logins, username, password))
+        during_storm = await run_readers(client, args.readers, storm)
+        results = storm.result()
+        storm_seconds = time.perf_counter() - storm_started
+
+    mode = "inline on the event loop" if args.inline else f"pool with {auth.password_hasher.workers} workers"
+    print(f"Password verification: {mode}")
+    report("reads, baseline", baseline)
+    report("reads, during logins", during_storm)
+    statuses = {}
+    for status_code, _ in results:
+        statuses[status_code] = statuses.get(status_code, 0) + 1
+    report("logins", [latency for _, latency in results])
+    print(f"{args.logins} logins in {storm_seconds:.1f} s, status codes: {statuses}")
+    if not args.inline:
+        print(f"Pool statistics: {auth.password_hasher.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read latency during a login storm")
+    parser.add_argument("--logins", type=int, default=50, help="Number of concurrent logins")
+    parser.add_argument("--readers", type=int, default=4, help="Number of concurrent readers")
+    parser.add_argument("--baseline-seconds", type=float, default=2.0, help="Duration of the baseline phase")
+    parser.add_argument("--inline", action="store_true", help="Verify passwords on the event loop for comparison")
+    asyncio.run(main(parser.parse_args()))
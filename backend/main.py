@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException, Query, Depends, Request, status, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import create_engine, text, func
 from models.users import User as UserModel, UserRole, UserStatus
@@ -14,22 +15,23 @@ import os
 import sys
 import logging
 import tempfile
+import time
 import traceback
-import uvicorn
 
-# Configure logging
+# Configure logging (queue-based, see utils/logger.py)
+from utils.logger import setup_logging
+setup_logging()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s | %(levelname)s: %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
 
 from database import SessionLocal, engine, get_db
 from auth import (
     create_access_token,
+    access_token_claims,
+    create_refresh_token,
+    rotate_refresh_token,
     get_current_active_user,
+    get_current_user_record,
+    revoke_user_tokens,
     authenticate_user,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_initial_admin,
@@ -37,59 +39,43 @@ from auth import (
     UserResponse,
     UserCreate,
     PasswordChangeRequest,
+    RefreshRequest,
     get_user,
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
+    password_hasher,
+    rehash_password_if_needed,
+    BCRYPT_ROUNDS,
     change_password
 )
 
 from routers.users import router as users_router, create_user
+from schemas.auth import TokenData
 from auth import get_user_by_email
 
-# Import database fix utility
-from utils.db_fixes import fix_user_role_case_sensitivity
 from utils.logger import get_logger
+from utils.uploads import UploadSizeLimitMiddleware, UploadTooLargeError, check_file_size
+from utils.user_cache import token_versions, user_cache
+from utils.tour_export import EXPORT_FORMATS, EXPORT_TOUR_SQL, export_filename, export_tour, export_zip, iter_export_rows
+from utils.migrations import run_migrations
+from utils import activity
+from utils.activity import activity_recorder
+from utils.activity_retention import get_activity_summary
+from utils.email_outbox import email_sender, outbox_status_counts
+from utils.health import health_monitor
+from utils.profiling import REQUEST_PROFILING, ProfilingMiddleware, profile_store
+from utils import metrics, slow_queries
+from utils.logger import dropped_records
 
 # Configure logger for main module
 main_logger = get_logger(__name__)
 
-# Import database fix utility
-from utils.db_fixes import fix_user_role_case_sensitivity
-from utils.logger import get_logger
-
-# Configure logger for main module
-main_logger = get_logger(__name__)
-async def startup_event():
-    create_initial_admin()
-    
-    # Fix user role case sensitivity issues
-    try:
-        with SessionLocal() as db:
-            updated = fix_user_role_case_sensitivity(db)
-            if updated > 0:
-                main_logger.info(f"Fixed {updated} user role records with case sensitivity issues")
-    except Exception as e:
-        main_logger.error(f"Failed to fix user role case sensitivity: {str(e)}", exc_info=True)
-
-# --- Lifespan Events ---
-from contextlib import asynccontextmanager
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Lifespan events für FastAPI"""
-    # Startup
-    try:
-        with engine.connect() as connection:
-            result = connection.execute(text("SELECT COUNT(*) FROM tours"))
-            count = result.fetchone()[0]
-            print(f"✅ Datenbankverbindung erfolgreich. {count} Touren verfügbar.")
-    except Exception as e:
-        print(f"❌ Datenbankverbindung fehlgeschlagen: {e}")
-    
-    yield
-    
-    # Shutdown (falls benötigt)
-    print("🔽 Backend wird heruntergefahren...")
+# Apply the schema migrations not recorded in the database yet (see utils/migrations.py)
+run_migrations(engine)
+# Send messages left in the outbox by a previous run
+email_sender.start()
+# First readiness check in the background, /health/ready answers 503 until it is done
+health_monitor.start()
 
 # FastAPI App initialisieren
 app = FastAPI(
@@ -106,11 +92,12 @@ async def log_requests(request: Request, call_next):
     # Get client information
     client_host = request.client.host if request.client else "unknown"
     
-    # Log the request
-    logger.info(f"Request {request.method} {request.url.path} from {client_host}")
+    # Log the request; health probes of the orchestrator only at debug level
+    level = logging.DEBUG if request.url.path.startswith("/health") else logging.INFO
+    logger.log(level, f"Request {request.method} {request.url.path} from {client_host}")
     
     # Log headers in debug mode
-    if logger.level <= logging.DEBUG:
+    if logger.isEnabledFor(logging.DEBUG):
         for name, value in request.headers.items():
             # Don't log sensitive headers like Authorization
             if name.lower() not in ['authorization', 'cookie']:
@@ -119,12 +106,28 @@ async def log_requests(request: Request, call_next):
     # Process the request and log the response
     try:
         response = await call_next(request)
-        logger.info(f"Response {request.method} {request.url.path}: {response.status_code}")
+        logger.log(level, f"Response {request.method} {request.url.path}: {response.status_code}")
         return response
     except Exception as e:
         logger.error(f"Request {request.method} {request.url.path} failed: {str(e)}")
         raise
 
+# Upload request bodies are limited while they are received, before the multipart parser spools them
+app.add_middleware(UploadSizeLimitMiddleware)
+# Opt-in profiling of single requests by admins (X-Profile: 1), see utils/profiling.py
+if REQUEST_PROFILING:
+    app.add_middleware(ProfilingMiddleware)
+metrics.instrument_engine(engine, "app")
+slow_queries.instrument_engine(engine, "app")
+metrics.CallbackGauge("activity_queue_length", "Activity events waiting to be written",
+                      lambda: activity_recorder.stats()["queued"])
+metrics.CallbackGauge("password_hash_waiting", "Password hashes waiting for a worker thread",
+                      lambda: password_hasher.stats()["waiting"])
+metrics.CallbackGauge("app_ready", "1 if the last readiness check passed",
+                      lambda: int(health_monitor.ready))
+metrics.CallbackGauge("log_records_dropped_total", "Log records dropped because the log queue was full",
+                      dropped_records)
+
 # Include the users router
 app.include_router(users_router, prefix="/api", tags=["users"])
 
@@ -149,6 +152,10 @@ app.add_middleware(
     expose_headers=["Content-Disposition", "Content-Type"]  # Expose headers for downloads
 )
 
+# Request counts and latency per route template for GET /metrics. Added last, so it is the
+# outermost middleware and also counts CORS preflights and rejections (route "<unmatched>")
+app.add_middleware(metrics.MetricsMiddleware)
+
 # --- Konfiguration ---
 # Database configuration is handled in database.py
 
@@ -245,36 +252,30 @@ async def root():
     """Health Check Endpoint"""
     return {"message": "Tour Manager API is running", "version": "1.0.0"}
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process answers requests (no database access)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: cached result of the background checks, 503 if not ready (see utils/health.py)"""
+    result = health_monitor.readiness()
+    return JSONResponse(status_code=200 if result["ready"] else 503, content=result)
+
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
-    """Health check endpoint for Docker"""
-    # Also print database information
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    try:
-        users = db.query(UserModel).all()
-        user_info = []
-        for user in users:
-            user_info.append({
-                "id": user.id,
-                "username": user.username,
-                "hash_prefix": user.hashed_password[:15]
-            })
-        logger.error(f"USERS DB: {user_info}")
-        
-        # Check database file
-        import os
-        db_path = os.getenv("DATABASE_PATH", "unknown")
-        logger.error(f"DATABASE PATH: {db_path}")
-        if os.path.exists(db_path):
-            logger.error(f"DATABASE FILE EXISTS: Yes, size={os.path.getsize(db_path)}")
-        else:
-            logger.error(f"DATABASE FILE EXISTS: No")
-    except Exception as e:
-        logger.error(f"DATABASE ERROR: {str(e)}")
-    
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+async def health_check():
+    """Health check endpoint for Docker, same as /health/ready"""
+    return await readiness_check()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Request, database and upload metrics in Prometheus text format"""
+    # Optional shared secret for the scraper; without METRICS_TOKEN the endpoint is open
+    metrics_token = os.getenv("METRICS_TOKEN")
+    if metrics_token and request.headers.get("authorization") != f"Bearer {metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/api/tours", response_model=List[TourBase])
 async def get_tours(
@@ -534,6 +535,55 @@ async def get_tours_geojson(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Fehler beim Generieren des GeoJSON: {str(e)}")
 
+@app.get("/api/tours/export")
+async def export_tours(
+    format: str = Query("gpx", description="Exportformat: gpx, geojson oder kml"),
+    tour_type: Optional[str] = Query(None, description="Filter nach Tour-Typ"),
+    date_from: Optional[str] = Query(None, description="Startdatum (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="Enddatum (YYYY-MM-DD)"),
+    ebike_only: Optional[bool] = Query(None, description="Nur E-Bike Touren exportieren"),
+    current_user: TokenData = Depends(get_current_active_user)
+):
+    """Exportiert alle (gefilterten) Touren als ZIP, das beim Senden aus den gespeicherten Tracks erzeugt wird"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unbekanntes Exportformat: {format}")
+
+    where = ""
+    params = {}
+    if tour_type and tour_type.strip():
+        where += " AND LOWER(t.type) = LOWER(:tour_type)"
+        params["tour_type"] = tour_type
+    
+    if date_from and date_from.strip():
+        try:
+            # Validate date format
+            datetime.fromisoformat(date_from)
+            where += " AND t.date >= :date_from"
+            params["date_from"] = date_from
+        except ValueError:
+            pass  # Ignore invalid date format
+    
+    if date_to and date_to.strip():
+        try:
+            # Validate date format
+            datetime.fromisoformat(date_to)
+            where += " AND t.date <= :date_to"
+            params["date_to"] = date_to
+        except ValueError:
+            pass  # Ignore invalid date format
+    
+    if ebike_only is not None:
+        where += " AND t.ebike = :ebike_only"
+        params["ebike_only"] = ebike_only
+
+    logger.info(f"Bulk export of tours as {format} requested by {current_user.username}")
+    filename = f"tours_{format}_{datetime.now().strftime('%Y%m%d')}.zip"
+    return StreamingResponse(
+        export_zip(iter_export_rows(engine, where, params), format),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.get("/api/tours/{tour_id}", response_model=TourDetail)
 async def get_tour_detail(tour_id: int):
     """Holt eine spezifische Tour mit vollständigen Details inkl. Track-Daten"""
@@ -585,6 +635,31 @@ async def get_tour_detail(tour_id: int):
         logger.error(f"Error in get_tour_detail for tour {tour_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Datenbankfehler: {str(e)}")
 
+@app.get("/api/tours/{tour_id}/export")
+async def export_single_tour(
+    tour_id: int,
+    format: str = Query("gpx", description="Exportformat: gpx, geojson oder kml")
+):
+    """Exportiert eine Tour mit vollständigem Track als GPX, GeoJSON oder KML"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unbekanntes Exportformat: {format}")
+
+    try:
+        with engine.connect() as connection:
+            row = connection.execute(text(f"{EXPORT_TOUR_SQL} WHERE t.id = :tour_id"), {"tour_id": tour_id}).fetchone()
+    except Exception as e:
+        logger.error(f"Error in export_single_tour for tour {tour_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Datenbankfehler: {str(e)}")
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Tour nicht gefunden")
+
+    return StreamingResponse(
+        export_tour(row, format),
+        media_type=EXPORT_FORMATS[format][1],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(row._mapping, format)}"'}
+    )
+
 @app.post("/api/tours/nearby", response_model=List[TourBase])
 async def get_nearby_tours(location: LocationFilter):
     """Findet Touren in der Nähe eines bestimmten Standorts"""
@@ -673,10 +748,10 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verify password
-    from auth import verify_password
-    if not verify_password(form_data.password, user.hashed_password):
+    # Verify password (in the password hashing pool, not on the event loop)
+    if not await verify_password_async(form_data.password, user.hashed_password):
         logger.warning(f"Login failed - Incorrect password for user: {form_data.username}")
+        activity_recorder.record(user.username, activity.LOGIN_FAILED)
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
@@ -712,22 +787,33 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Update last login time
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Upgrade the hash if the bcrypt cost changed, committed together with the refresh token
+    await rehash_password_if_needed(user, form_data.password)
+    # The login event and last_login are written in the background
+    activity_recorder.record(user.username, activity.LOGIN)
     
     logger.info(f"Login successful for user: {form_data.username}")
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=access_token_claims(user), expires_delta=access_token_expires
     )
+    refresh_token = create_refresh_token(db, user)
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(refresh: RefreshRequest, db: Session = Depends(get_db)):
+    """Issues a new access token for a refresh token, without a password check; the refresh token is rotated"""
+    user, refresh_token = rotate_refresh_token(db, refresh.refresh_token)
+    access_token = create_access_token(
+        data=access_token_claims(user), expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 @app.get("/users/me", response_model=UserResponse)
-async def read_users_me(current_user: UserModel = Depends(get_current_active_user)):
+async def read_users_me(current_user: UserModel = Depends(get_current_user_record)):
     return current_user
 
 @app.post("/api/auth/register", response_model=UserResponse)
@@ -760,7 +846,7 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     verification_token = secrets.token_urlsafe(32)
     
     # Create user with PENDING status and verification token
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = UserModel(
         username=user.username,
         email=user.email,
@@ -776,6 +862,7 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     
     logger.info(f"User created: {db_user.username}, status: PENDING, awaiting email verification and admin approval")
+    activity_recorder.record(db_user.username, activity.REGISTER)
     
     # Send verification email
     try:
@@ -784,8 +871,8 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         
         # Log the detailed result from the email function
         if email_result and email_result.get("success"):
-            logger.info(f"Verification email successfully sent to {db_user.email}")
-            logger.info(f"Email details: took {email_result.get('duration_seconds', 'unknown')} seconds")
+            logger.info(f"Verification email queued for {db_user.email}")
+            logger.info(f"Email details: outbox id {email_result.get('outbox_id')}")
         else:
             logger.warning(f"Verification email not sent successfully to {db_user.email}")
             if email_result:
@@ -797,35 +884,11 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     
     return db_user
 
-@app.get("/api/users", response_model=List[UserResponse])
-async def list_users(
-    current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """List all users (admin only)"""
-    if current_user.role != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=403,
-            detail="Not authorized to view user list"
-        )
-    
-    try:
-        # Use a safer query approach with error handling
-        users = db.query(UserModel).all()
-        main_logger.info(f"Successfully fetched {len(users)} users")
-        return users
-    except Exception as e:
-        main_logger.error(f"Error fetching users: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Internal server error while fetching users: {str(e)}"
-        )
-
 @app.patch("/api/users/{username}/status")
 async def update_user_status_endpoint(
     username: str,
     status_update: UserStatusUpdate,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Update a user's status (admin only)"""
@@ -867,6 +930,9 @@ async def update_user_status_endpoint(
         user.status = UserStatus(status_update.status)
         db.commit()
         db.refresh(user)
+        revoke_user_tokens(db, username)
+        activity_recorder.record(current_user.username, activity.STATUS_CHANGE,
+                                 {"username": username, "status": user.status.value})
         return user.to_dict()
     except ValueError as e:
         raise HTTPException(
@@ -876,7 +942,7 @@ async def update_user_status_endpoint(
 
 @app.get("/api/users/pending", response_model=List[UserResponse])
 async def list_pending_users(
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """List all pending users (admin only)"""
@@ -885,12 +951,12 @@ async def list_pending_users(
             status_code=403,
             detail="Not authorized to view pending users"
         )
-    return db.query(UserModel).filter(UserModel.status == UserStatus.PENDING).all()
+    return db.query(UserModel).filter(UserModel.status == UserStatus.PENDING).order_by(UserModel.created_at).all()
 
 @app.delete("/api/users/{username}")
 async def delete_user(
     username: str,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Delete a user (admin only)"""
@@ -921,33 +987,30 @@ async def delete_user(
     
     db.delete(user)
     db.commit()
+    revoke_user_tokens(db, username)
+    activity_recorder.record(current_user.username, activity.USER_DELETE, {"username": username})
     
     return {"message": f"User {username} has been deleted"}
 
 @app.post("/api/auth/change-password")
 async def change_password_endpoint(
     password_change: PasswordChangeRequest,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: UserModel = Depends(get_current_user_record),
     db: Session = Depends(get_db)
 ):
     try:
-        # Import directly here to avoid any circular import issues
-        from passlib.context import CryptContext
         import sqlite3
         import os
         
-        # Setup password context
-        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-        
         # Check current password
-        if not pwd_context.verify(password_change.current_password, current_user.hashed_password):
+        if not await verify_password_async(password_change.current_password, current_user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Current password is incorrect"
             )
         
         # Generate new hash
-        new_hash = pwd_context.hash(password_change.new_password)
+        new_hash = await get_password_hash_async(password_change.new_password)
         
         # Get database path from environment
         if os.getenv("DOCKER_ENV") == "true":
@@ -974,11 +1037,26 @@ async def change_password_endpoint(
         # Also update in memory
         current_user.hashed_password = new_hash
         
+        # Revoke all tokens issued with the old password, the caller gets a new one
+        revoke_user_tokens(db, current_user.username)
+        user = get_user(db, current_user.username)
+        access_token = create_access_token(
+            data=access_token_claims(user),
+            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        refresh_token = create_refresh_token(db, user)
+        activity_recorder.record(current_user.username, activity.PASSWORD_CHANGE)
+        
         # Log results
         print(f"Updated password for {current_user.username}. Rows updated: {rows_updated}")
         print(f"New hash matches stored hash: {stored_hash == new_hash}")
         
-        return {"message": "Password updated successfully"}
+        return {
+            "message": "Password updated successfully",
+            "access_token": access_token,
+            "token_type": "bearer",
+            "refresh_token": refresh_token,
+        }
     except Exception as e:
         import traceback
         traceback_text = traceback.format_exc()
@@ -1006,18 +1084,182 @@ async def test_users(db: Session = Depends(get_db)):
                 "email": user.email,
                 "hashed_password": user.hashed_password[:10] + "...",
             })
-        logger.error(f"TOTAL USERS: {len(result)}")
-        logger.error(f"USERS: {result}")
+        logger.debug(f"Test endpoint listed {len(result)} users")
         return result
     except Exception as e:
         logger.error(f"ERROR: {str(e)}")
         return {"error": str(e)}
 
 # --- GPX Upload Functionality ---
+_import_gpx_module = None
+
+def _get_import_gpx():
+    """Locates and loads import_gpx.py once per process"""
+    global _import_gpx_module
+    if _import_gpx_module is not None:
+        return _import_gpx_module
+
+    import importlib.util
+
+    # Try several possible script paths
+    possible_script_paths = [
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "../scripts"),  # Development environment
+        "/app/scripts",  # Docker container standard path
+        "/app",  # Root of the Docker container 
+        os.path.abspath("scripts"),  # Relative to current directory
+        os.path.abspath("../scripts"),  # One level up
+        ".",  # Current directory
+    ]
+    
+    # Search for the script in all possible locations
+    import_gpx_path = None
+    for path in possible_script_paths:
+        script_path = os.path.join(path, "import_gpx.py")
+        if os.path.exists(script_path):
+            import_gpx_path = script_path
+            logger.info(f"Loading import_gpx.py from {import_gpx_path}")
+            break
+    
+    if not import_gpx_path:
+        logger.error(f"import_gpx.py not found in {possible_script_paths} (cwd {os.getcwd()})")
+        raise FileNotFoundError("GPX import script not found in any of the expected locations")
+        
+    # Add all possible paths to sys.path
+    for path in possible_script_paths:
+        if path not in sys.path and os.path.exists(path):
+            sys.path.append(path)
+        
+    # Import module using spec
+    spec = importlib.util.spec_from_file_location("import_gpx", import_gpx_path)
+    import_gpx = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(import_gpx)
+    
+    # import_gpx.py writes the tours through its own engine
+    if hasattr(import_gpx, "engine"):
+        metrics.instrument_engine(import_gpx.engine, "import")
+        slow_queries.instrument_engine(import_gpx.engine, "import")
+    
+    _import_gpx_module = import_gpx
+    return import_gpx
+
+def _import_result_message(result: str) -> Dict[str, str]:
+    """Maps the result of parse_and_store_gpx to the status/message of the upload endpoints"""
+    if result == "imported":
+        return {"status": "success", "message": "Tour imported successfully"}
+    elif result == "exists":
+        return {"status": "warning", "message": "Tour already exists (same Komoot ID)"}
+    elif result == "skipped":
+        return {"status": "warning", "message": "Tour skipped - no track points found"}
+    else:
+        return {"status": "error", "message": f"Unknown error: {result}"}
+
+def _import_results_message(results: List[str]) -> Dict[str, str]:
+    """Combines the import results of a KMZ archive with several KML documents"""
+    if len(results) == 1:
+        return _import_result_message(results[0])
+    imported = results.count("imported")
+    existing = results.count("exists")
+    skipped = results.count("skipped")
+    failed = len(results) - imported - existing - skipped
+    message = f"{imported} of {len(results)} tours imported"
+    if existing:
+        message += f", {existing} already exist"
+    if skipped:
+        message += f", {skipped} skipped"
+    if failed:
+        message += f", {failed} failed"
+    if imported:
+        status = "success"
+    elif failed == len(results):
+        status = "error"
+    else:
+        status = "warning"
+    return {"status": status, "message": message}
+
+async def _ingest_upload(file: UploadFile) -> Dict[str, str]:
+    """Imports one uploaded file (see _store_upload) and records it in the upload metrics"""
+    file_type = os.path.splitext(file.filename.lower())[1].lstrip(".")
+    size = 0
+    started = time.perf_counter()
+    status = "error"
+    try:
+        size = check_file_size(file)
+        # Parsing, conversion and the database writes block, keep them off the event loop
+        result = await run_in_threadpool(_store_upload, file)
+        status = result.get("status", "error")
+        return result
+    except UploadTooLargeError:
+        status = "too_large"
+        raise
+    finally:
+        metrics.record_upload(file_type, status, size, time.perf_counter() - started)
+
+def _store_upload(file: UploadFile) -> Dict[str, str]:
+    """
+    Converts KML/KMZ in memory and imports the tour of one uploaded file.
+
+    The parsers read the file object the multipart parser already spooled
+    (UploadFile.file); every file is parsed exactly once and no intermediate
+    files are written. Runs in the thread pool and converts in-process: the
+    API process runs several threads, so it must not fork worker processes.
+    Raises UploadTooLargeError when a KMZ archive exceeds its decompression
+    limits.
+    """
+    file_ext = os.path.splitext(file.filename.lower())[1]
+    import_gpx = _get_import_gpx()
+    spool = file.file
+
+    # If it's a KML or KMZ file, convert it to an in-memory GPX object
+    if file_ext == '.kml':
+        try:
+            logger.info(f"Converting KML file to GPX: {file.filename}")
+            logger.debug(f"KML file content start: {spool.read(100)}")
+            spool.seek(0)
+            
+            from utils.kml_converter import kml_to_gpx
+            gpx = kml_to_gpx(spool, source_name=file.filename)
+        except Exception as e:
+            logger.error(f"Exception during KML conversion: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return {"status": "error", "message": f"Error converting KML file: {str(e)}"}
+        
+        if gpx is None:
+            logger.error(f"KML conversion failed for file: {file.filename}")
+            return {"status": "error", "message": "Failed to convert KML file to GPX format. The KML file may be invalid or corrupted."}
+        
+        logger.info(f"KML file successfully converted to GPX: {file.filename}")
+        result = import_gpx.store_tour(gpx, file.filename)
+    
+    elif file_ext == '.kmz':
+        try:
+            logger.info(f"Converting KMZ file to GPX: {file.filename}")
+            
+            from utils.kmz_converter import kmz_to_gpx
+            tours = kmz_to_gpx(spool, parallel=False)
+        except UploadTooLargeError:
+            raise
+        except Exception as e:
+            logger.error(f"Exception during KMZ conversion: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return {"status": "error", "message": f"Error converting KMZ file: {str(e)}"}
+        
+        if tours is None:
+            logger.error(f"KMZ conversion failed for file: {file.filename}")
+            return {"status": "error", "message": "Failed to convert KMZ file to GPX format. The KMZ file may be invalid or corrupted."}
+        
+        logger.info(f"KMZ file successfully converted to GPX: {file.filename} ({len(tours)} KML documents)")
+        # Every KML document in the archive is imported as its own tour
+        return _import_results_message([import_gpx.store_tour(gpx, name) for name, gpx in tours])
+    
+    else:
+        result = import_gpx.parse_and_store_gpx(spool, source_name=file.filename)
+
+    return _import_result_message(result)
+
 @app.post("/api/tours/upload")
 async def upload_gpx_file(
     file: UploadFile = File(...),
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
@@ -1026,10 +1268,6 @@ async def upload_gpx_file(
     # Any authenticated user can upload files
     # Authorization is handled by get_current_active_user dependency
     
-    # Import necessary modules to ensure they're available in this scope
-    import os
-    import tempfile
-    
     # Check if the file is a GPX, KML or KMZ file
     file_ext = os.path.splitext(file.filename.lower())[1]
     logger.debug(f"Detected file extension: '{file_ext}' for file: {file.filename}")
@@ -1042,129 +1280,16 @@ async def upload_gpx_file(
         )
     
     try:
-        # Create a temporary file to store the uploaded file with correct extension
-        file_ext = os.path.splitext(file.filename.lower())[1]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-            contents = await file.read()
-            temp_file.write(contents)
-            temp_file_path = temp_file.name
-        
-        # If it's a KML or KMZ file, convert it to GPX
-        if file_ext == '.kml':
-            try:
-                logger.info(f"Converting KML file to GPX: {file.filename}")
-                
-                # Check the file content before conversion
-                with open(temp_file_path, 'rb') as check_file:
-                    file_start = check_file.read(100)
-                    logger.debug(f"KML file content start: {file_start}")
-                
-                from utils.kml_converter import kml_to_gpx
-                gpx_path = kml_to_gpx(temp_file_path)
-                
-                if not gpx_path:
-                    logger.error(f"KML conversion failed for file: {file.filename}")
-                    return {"status": "error", "message": "Failed to convert KML file to GPX format. The KML file may be invalid or corrupted."}
-                
-                logger.info(f"KML file successfully converted to GPX: {file.filename}")
-                
-                # Clean up the original KML file
-                os.unlink(temp_file_path)
-                temp_file_path = gpx_path
-            except Exception as e:
-                logger.error(f"Exception during KML conversion: {str(e)}")
-                error_trace = traceback.format_exc()
-                logger.error(f"Traceback: {error_trace}")
-                return {"status": "error", "message": f"Error converting KML file: {str(e)}"}
-        
-        # Handle KMZ files
-        elif file_ext == '.kmz':
-            try:
-                logger.info(f"Converting KMZ file to GPX: {file.filename}")
-                
-                from utils.kmz_converter import kmz_to_gpx
-                gpx_path = kmz_to_gpx(temp_file_path)
-                
-                if not gpx_path:
-                    logger.error(f"KMZ conversion failed for file: {file.filename}")
-                    return {"status": "error", "message": "Failed to convert KMZ file to GPX format. The KMZ file may be invalid or corrupted."}
-                
-                logger.info(f"KMZ file successfully converted to GPX: {file.filename}")
-                
-                # Clean up the original KMZ file
-                os.unlink(temp_file_path)
-                temp_file_path = gpx_path
-            except Exception as e:
-                logger.error(f"Exception during KMZ conversion: {str(e)}")
-                error_trace = traceback.format_exc()
-                logger.error(f"Traceback: {error_trace}")
-                return {"status": "error", "message": f"Error converting KMZ file: {str(e)}"}
-        
-        # Import the GPX processing function from our script
-        import sys as _sys  # Renamed to avoid conflicts
-        import importlib.util
-        
-        # Try several possible script paths
-        possible_script_paths = [
-            os.path.join(os.path.dirname(os.path.abspath(__file__)), "../scripts"),  # Development environment
-            "/app/scripts",  # Docker container standard path
-            "/app",  # Root of the Docker container 
-            os.path.abspath("scripts"),  # Relative to current directory
-            os.path.abspath("../scripts"),  # One level up
-            ".",  # Current directory
-        ]
-        
-        # Log debugging information
-        logger.error(f"Current working directory: {os.getcwd()}")
-        logger.error(f"Searching for import_gpx.py in these directories: {possible_script_paths}")
-        
-        # Search for the script in all possible locations
-        import_gpx_path = None
-        for path in possible_script_paths:
-            script_path = os.path.join(path, "import_gpx.py")
-            if os.path.exists(script_path):
-                import_gpx_path = script_path
-                logger.error(f"Found script at: {import_gpx_path}")
-                break
-            else:
-                if os.path.exists(path):
-                    logger.error(f"Directory exists but script not found. Files in {path}: {os.listdir(path)}")
-                else:
-                    logger.error(f"Directory does not exist: {path}")
-        
-        if not import_gpx_path:
-            logger.error("import_gpx.py not found in any of the expected locations")
-            raise FileNotFoundError("GPX import script not found in any of the expected locations")
-            
-        # Add all possible paths to sys.path
-        for path in possible_script_paths:
-            if path not in sys.path and os.path.exists(path):
-                sys.path.append(path)
-            
-        # Import module using spec
-        spec = importlib.util.spec_from_file_location("import_gpx", import_gpx_path)
-        import_gpx = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(import_gpx)
-        
-        # Access the function
-        parse_and_store_gpx = import_gpx.parse_and_store_gpx
-        
-        # Process the GPX file
-        result = parse_and_store_gpx(temp_file_path)
-        
-        # Clean up the temporary file
-        os.unlink(temp_file_path)
-        
-        # Return appropriate response based on the result
-        if result == "imported":
-            return {"status": "success", "message": "Tour imported successfully"}
-        elif result == "exists":
-            return {"status": "warning", "message": "Tour already exists (same Komoot ID)"}
-        elif result == "skipped":
-            return {"status": "warning", "message": "Tour skipped - no track points found"}
-        else:
-            return {"status": "error", "message": f"Unknown error: {result}"}
-            
+        result = await _ingest_upload(file)
+        activity_recorder.record(current_user.username, activity.UPLOAD,
+                                 {"filename": file.filename, "status": result.get("status")})
+        return result
+    except UploadTooLargeError as e:
+        logger.warning(f"Rejected upload {file.filename}: {str(e)}")
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error processing GPX file: {str(e)}")
         raise HTTPException(
@@ -1176,7 +1301,7 @@ async def upload_gpx_file(
 @app.post("/api/tours/upload/batch")
 async def upload_multiple_gpx_files(
     files: list[UploadFile] = File(...),
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
@@ -1185,12 +1310,7 @@ async def upload_multiple_gpx_files(
     # Any authenticated user can upload files
     # Authorization is handled by get_current_active_user dependency
     
-    # Import necessary modules to ensure they're available in this scope
-    import os
-    import tempfile
-    
     results = []
-    
     for file in files:
         # Check if the file is a GPX or KML file
         file_ext = os.path.splitext(file.filename.lower())[1]
@@ -1206,177 +1326,17 @@ async def upload_multiple_gpx_files(
             continue
         
         try:
-            # Create a temporary file to store the uploaded file with correct extension
-            file_ext = os.path.splitext(file.filename.lower())[1]
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-                contents = await file.read()
-                temp_file.write(contents)
-                temp_file_path = temp_file.name
-            
-            # If it's a KML file, convert it to GPX
-            if file_ext == '.kml':
-                try:
-                    logger.info(f"Converting KML file to GPX: {file.filename}")
-                    
-                    # Check the file content before conversion
-                    with open(temp_file_path, 'rb') as check_file:
-                        file_start = check_file.read(100)
-                        logger.debug(f"KML file content start: {file_start}")
-                    
-                    from utils.kml_converter import kml_to_gpx
-                    gpx_path = kml_to_gpx(temp_file_path)
-                    
-                    if not gpx_path:
-                        logger.error(f"KML conversion failed for file: {file.filename}")
-                        results.append({
-                            "filename": file.filename,
-                            "status": "error",
-                            "message": "Failed to convert KML file to GPX format. The KML file may be invalid or corrupted."
-                        })
-                        # Clean up the original KML file
-                        os.unlink(temp_file_path)
-                        continue
-                    
-                    logger.info(f"KML file successfully converted to GPX: {file.filename}")
-                    
-                    # Clean up the original KML file
-                    os.unlink(temp_file_path)
-                    temp_file_path = gpx_path
-                except Exception as e:
-                    logger.error(f"Exception during KML conversion: {str(e)}")
-                    error_trace = traceback.format_exc()
-                    logger.error(f"Traceback: {error_trace}")
-                    results.append({
-                        "filename": file.filename,
-                        "status": "error",
-                        "message": f"Error converting KML file: {str(e)}"
-                    })
-                    
-                    # Clean up the original KML file if it still exists
-                    if os.path.exists(temp_file_path):
-                        os.unlink(temp_file_path)
-                    continue
-            
-            # If it's a KMZ file, convert it to GPX
-            elif file_ext == '.kmz':
-                try:
-                    logger.info(f"Converting KMZ file to GPX: {file.filename}")
-                    
-                    from utils.kmz_converter import kmz_to_gpx
-                    gpx_path = kmz_to_gpx(temp_file_path)
-                    
-                    if not gpx_path:
-                        logger.error(f"KMZ conversion failed for file: {file.filename}")
-                        results.append({
-                            "filename": file.filename,
-                            "status": "error",
-                            "message": "Failed to convert KMZ file to GPX format. The KMZ file may be invalid or corrupted."
-                        })
-                        # Clean up the original KMZ file
-                        os.unlink(temp_file_path)
-                        continue
-                    
-                    logger.info(f"KMZ file successfully converted to GPX: {file.filename}")
-                    
-                    # Clean up the original KMZ file
-                    os.unlink(temp_file_path)
-                    temp_file_path = gpx_path
-                except Exception as e:
-                    logger.error(f"Exception during KMZ conversion: {str(e)}")
-                    error_trace = traceback.format_exc()
-                    logger.error(f"Traceback: {error_trace}")
-                    results.append({
-                        "filename": file.filename,
-                        "status": "error",
-                        "message": f"Error converting KMZ file: {str(e)}"
-                    })
-                    
-                    # Clean up the original KMZ file if it still exists
-                    if os.path.exists(temp_file_path):
-                        os.unlink(temp_file_path)
-                    continue
-            
-            # Import the GPX processing function from our script
-            import sys
-            import os
-            import importlib.util
-            
-            # Try several possible script paths
-            possible_script_paths = [
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), "../scripts"),  # Development environment
-                "/app/scripts",  # Docker container standard path
-                os.path.abspath("scripts"),  # Relative to current directory
-                os.path.abspath("../scripts"),  # One level up
-                os.path.abspath("./"),  # base level
-            ]
-            
-            # Log debugging information
-            logger.error(f"Batch upload - Current working directory: {os.getcwd()}")
-            logger.error(f"Batch upload - Searching for import_gpx.py in these directories: {possible_script_paths}")
-            
-            # Search for the script in all possible locations
-            import_gpx_path = None
-            for path in possible_script_paths:
-                script_path = os.path.join(path, "import_gpx.py")
-                if os.path.exists(script_path):
-                    import_gpx_path = script_path
-                    logger.error(f"Batch upload - Found script at: {import_gpx_path}")
-                    break
-                else:
-                    if os.path.exists(path):
-                        logger.error(f"Batch upload - Directory exists but script not found. Files in {path}: {os.listdir(path)}")
-                    else:
-                        logger.error(f"Batch upload - Directory does not exist: {path}")
-            
-            if not import_gpx_path:
-                logger.error("Batch upload - import_gpx.py not found in any of the expected locations")
-                raise FileNotFoundError("Batch upload - GPX import script not found in any of the expected locations")
-                
-            # Add all possible paths to sys.path
-            for path in possible_script_paths:
-                if path not in sys.path and os.path.exists(path):
-                    sys.path.append(path)
-            
-            # Import module using spec
-            spec = importlib.util.spec_from_file_location("import_gpx", import_gpx_path)
-            import_gpx = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(import_gpx)
-            
-            # Access the function
-            parse_and_store_gpx = import_gpx.parse_and_store_gpx
-            
-            # Process the GPX file
-            result = parse_and_store_gpx(temp_file_path)
-            
-            # Clean up the temporary file
-            os.unlink(temp_file_path)
-            
-            # Add result to the results list
-            if result == "imported":
-                results.append({
-                    "filename": file.filename,
-                    "status": "success",
-                    "message": "Tour imported successfully"
-                })
-            elif result == "exists":
-                results.append({
-                    "filename": file.filename,
-                    "status": "warning",
-                    "message": "Tour already exists (same Komoot ID)"
-                })
-            elif result == "skipped":
-                results.append({
-                    "filename": file.filename,
-                    "status": "warning",
-                    "message": "Tour skipped - no track points found"
-                })
-            else:
-                results.append({
-                    "filename": file.filename,
-                    "status": "error",
-                    "message": f"Unknown error: {result}"
-                })
-                
+            result = await _ingest_upload(file)
+            results.append({"filename": file.filename, **result})
+            activity_recorder.record(current_user.username, activity.UPLOAD,
+                                     {"filename": file.filename, "status": result.get("status")})
+        except UploadTooLargeError as e:
+            logger.warning(f"Batch upload - Rejected upload {file.filename}: {str(e)}")
+            results.append({
+                "filename": file.filename,
+                "status": "error",
+                "message": str(e)
+            })
         except Exception as e:
             logger.error(f"Error processing GPX file {file.filename}: {str(e)}")
             results.append({
@@ -1392,7 +1352,7 @@ async def upload_multiple_gpx_files(
 @app.post("/api/admin/approve-user/{username}", response_model=UserResponse)
 async def approve_user(
     username: str,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Approve a pending user (admin only)"""
@@ -1440,13 +1400,16 @@ async def approve_user(
     user.status = UserStatus.ACTIVE
     db.commit()
     db.refresh(user)
+    revoke_user_tokens(db, username)
+    activity_recorder.record(current_user.username, activity.STATUS_CHANGE,
+                             {"username": username, "status": UserStatus.ACTIVE.value})
     
     logger.info(f"Admin {current_user.username} approved user {username}")
     
     # Notify the user that their account was approved
     try:
         await send_account_approved_email(user.email)
-        logger.info(f"Account approval notification sent to {user.email}")
+        logger.info(f"Account approval notification queued for {user.email}")
     except Exception as e:
         logger.error(f"Failed to send approval notification to {user.email}: {str(e)}")
     
@@ -1454,7 +1417,7 @@ async def approve_user(
 
 @app.get("/api/admin/pending-users", response_model=List[UserResponse])
 async def list_pending_users(
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """List all pending users awaiting approval (admin only)"""
@@ -1471,11 +1434,111 @@ async def list_pending_users(
         )
     
     # Query pending users
-    pending_users = db.query(UserModel).filter(UserModel.status == UserStatus.PENDING).all()
+    pending_users = db.query(UserModel).filter(UserModel.status == UserStatus.PENDING).order_by(UserModel.created_at).all()
     logger.info(f"Admin {current_user.username} viewed list of {len(pending_users)} pending users")
     
     return pending_users
 
+@app.get("/api/admin/user-cache")
+async def get_user_cache_stats(current_user: TokenData = Depends(get_current_active_user)):
+    """Hit/miss counters of the user record and token version caches (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to view cache statistics"
+        )
+    return {"users": user_cache.stats(), "token_versions": token_versions.stats()}
+
+@app.get("/api/admin/password-hashing")
+async def get_password_hashing_stats(current_user: TokenData = Depends(get_current_active_user)):
+    """Queue and run times of the password hashing pool (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to view password hashing statistics"
+        )
+    return {**password_hasher.stats(), "bcrypt_rounds": BCRYPT_ROUNDS}
+
+@app.get("/api/admin/activity-recorder")
+async def get_activity_recorder_stats(current_user: TokenData = Depends(get_current_active_user)):
+    """Queue length and flush statistics of the buffered activity writer (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to view activity statistics"
+        )
+    return activity_recorder.stats()
+
+@app.get("/api/admin/activity")
+async def get_activity_summary_endpoint(
+    days: int = Query(30, ge=1, le=3650),
+    username: Optional[str] = None,
+    action: Optional[str] = None,
+    current_user: TokenData = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Daily activity counts per user and action from the rollup table (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to view user activity"
+        )
+    return get_activity_summary(db, days=days, username=username, action=action)
+
+@app.get("/api/admin/slow-queries")
+async def get_slow_query_stats(
+    sort: str = Query("total_ms", pattern="^(total_ms|max_ms|mean_ms|count|slow)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: TokenData = Depends(get_current_active_user)
+):
+    """Duration statistics and query plans per SQL statement fingerprint (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to view query statistics"
+        )
+    return {
+        "threshold_ms": slow_queries.slow_query_log.threshold_ms,
+        "statements": slow_queries.slow_query_log.statements(sort=sort, limit=limit),
+    }
+
+@app.get("/api/admin/profiles")
+async def list_request_profiles(current_user: TokenData = Depends(get_current_active_user)):
+    """Stored request profiles, newest first (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to view request profiles"
+        )
+    return {"profiles": profile_store.list(), "max_reports": profile_store.max_reports}
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_request_profile(profile_id: str, current_user: TokenData = Depends(get_current_active_user)):
+    """Report of a profiled request: pyinstrument HTML or cProfile text (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to view request profiles"
+        )
+    report = profile_store.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path, media_type = report
+    return FileResponse(path, media_type=media_type)
+
+@app.get("/api/admin/email-outbox")
+async def get_email_outbox_stats(
+    current_user: TokenData = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Delivery status of the email outbox and counters of the background sender (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to view the email outbox"
+        )
+    return {"messages": outbox_status_counts(db), "sender": email_sender.stats()}
+
 # Protect your existing endpoints with authentication
 # Example:
 # @app.get("/protected-route")
@@ -1566,4 +1629,5 @@ async def test_batch_file_upload(files: list[UploadFile] = File(...)):
         }
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,4 +1,7 @@
 from models.users import User
-from models.activity import UserActivity
+from models.activity import UserActivity, UserActivityDaily
+from models.tokens import RefreshToken
+from models.outbox import OutboxEmail
+from models.locks import MaintenanceLock
 
-__all__ = ["User", "UserActivity"]
+__all__ = ["User", "UserActivity", "UserActivityDaily", "RefreshToken", "OutboxEmail", "MaintenanceLock"]
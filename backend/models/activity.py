@@ -1,10 +1,14 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
 
 class UserActivity(Base):
     __tablename__ = "user_activities"
+    __table_args__ = (
+        # Range scans of the rollup and the retention pruning
+        Index("ix_user_activities_timestamp", "timestamp"),
+    )
 
     id = Column(String, primary_key=True)
     user_id = Column(String, ForeignKey("users.username"))
@@ -14,3 +18,20 @@ class UserActivity(Base):
 
     # Relationship
     user = relationship("User", back_populates="activities")
+
+class UserActivityDaily(Base):
+    """
+    Number of activities per day, user and action, see utils/activity_retention.py.
+
+    Kept after the raw events have been pruned. Events of deleted users are
+    counted with an empty user_id.
+    """
+    __tablename__ = "user_activity_daily"
+    __table_args__ = (
+        Index("ix_user_activity_daily_user_day", "user_id", "day"),
+    )
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(String, primary_key=True)
+    action = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
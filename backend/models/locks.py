@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, DateTime
+from database import Base
+
+class MaintenanceLock(Base):
+    """
+    Lease on a periodic maintenance job, see utils/maintenance_lock.py.
+
+    Every worker process runs the maintenance jobs; the one holding the lease
+    does the work, the others skip the run. A lease of a crashed process ends
+    at expires_at.
+    """
+    __tablename__ = "maintenance_locks"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from datetime import datetime
+from database import Base
+
+class RefreshToken(Base):
+    """
+    Issued refresh token, stored as HMAC of the token value (see auth.hash_refresh_token).
+
+    Every refresh replaces the token with a new one of the same family. A token
+    that is presented again after it was used revokes its whole family.
+    """
+    __tablename__ = "refresh_tokens"
+
+    token_hash = Column(String, primary_key=True)
+    family_id = Column(String, nullable=False, index=True)
+    username = Column(String, ForeignKey("users.username"), nullable=False, index=True)
+    token_version = Column(Integer, nullable=False, default=0)  # users.token_version at issue time
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True)  # Set when the token was rotated
+    revoked_at = Column(DateTime, nullable=True)
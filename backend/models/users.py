@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, String, DateTime, Enum, JSON
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Enum, Index, JSON, text
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
@@ -27,6 +27,12 @@ class UserStatus(enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    # Admin listing: newest first with the username as tie-breaker, optionally by status (see routers/users.py);
+    # created_at is nullable, users without one sort last
+    __table_args__ = (
+        Index("ix_users_listing", text("COALESCE(created_at, '')"), "username"),
+        Index("ix_users_status_listing", "status", text("COALESCE(created_at, '')"), "username"),
+    )
 
     username = Column(String, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -39,6 +45,8 @@ class User(Base):
     verification_token = Column(String, nullable=True)
     reset_token = Column(String, nullable=True)
     reset_token_expires = Column(DateTime, nullable=True)
+    # Bumped to revoke all access tokens of the user, see auth.revoke_user_tokens
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     # Profile fields
     full_name = Column(String, nullable=True)
     bio = Column(String, nullable=True)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from auth import get_db, pwd_context, get_user_by_email, UserResponse
+from auth import get_db, get_password_hash_async, get_user_by_email, revoke_user_tokens, UserResponse
 from utils.email import (
     create_verification_token,
     create_password_reset_token,
@@ -10,6 +10,8 @@ from utils.email import (
     send_password_reset_email
 )
 from models.users import UserStatus
+from utils import activity
+from utils.activity import activity_recorder
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
@@ -54,8 +56,8 @@ async def request_verification(
         
         # Log detailed results
         if email_result and email_result.get("success"):
-            logger.info(f"Verification email successfully re-sent to {user.email}")
-            logger.info(f"Email details: took {email_result.get('duration_seconds', 'unknown')} seconds")
+            logger.info(f"Verification email queued again for {user.email}")
+            logger.info(f"Email details: outbox id {email_result.get('outbox_id')}")
         else:
             logger.warning(f"Verification email not sent successfully to {user.email}")
             if email_result:
@@ -100,6 +102,8 @@ async def verify_email(
     user.email_verified = True
     user.verification_token = None
     db.commit()
+    revoke_user_tokens(db, user.username)
+    activity_recorder.record(user.username, activity.EMAIL_VERIFIED)
 
     return {"message": "Email verified successfully"}
 
@@ -146,9 +150,11 @@ async def reset_password(
             detail="Reset token has expired"
         )
 
-    user.hashed_password = pwd_context.hash(reset_req.new_password)
+    user.hashed_password = await get_password_hash_async(reset_req.new_password)
     user.reset_token = None
     user.reset_token_expires = None
     db.commit()
+    revoke_user_tokens(db, user.username)
+    activity_recorder.record(user.username, activity.PASSWORD_RESET)
 
     return {"message": "Password reset successfully"}
@@ -1,18 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+import json
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import and_, func, literal_column, or_, select
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from auth import (
     get_db,
     get_current_active_user,
     get_user,
-    get_password_hash,
+    get_current_user_record,
+    get_password_hash_async,
+    revoke_user_tokens,
 )
 from models.users import User, UserRole, UserStatus
-from schemas.users import UserCreate, UserResponse, UserUpdate, UserStatusUpdate
+from utils import activity
+from utils.activity import activity_recorder
+from schemas.auth import TokenData
+from schemas.users import UserCreate, UserPage, UserResponse, UserUpdate, UserStatusUpdate
 
 router = APIRouter()
 
-def create_user(db: Session, user: UserCreate):
+def create_user(db: Session, user: UserCreate, hashed_password: str):
     import secrets
     from utils.logger import get_logger
     
@@ -22,7 +31,6 @@ def create_user(db: Session, user: UserCreate):
     # Generate verification token
     verification_token = secrets.token_urlsafe(32)
     
-    hashed_password = get_password_hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -40,8 +48,76 @@ def create_user(db: Session, user: UserCreate):
     db.refresh(db_user)
     return db_user
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(User).offset(skip).limit(limit).all()
+def _encode_cursor(user: User) -> str:
+    value = json.dumps([user.created_at.isoformat() if user.created_at else None, user.username])
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, username = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return (datetime.fromisoformat(created_at) if created_at else None), str(username)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse_enum(enum_class, value: str, name: str):
+    try:
+        return enum_class(value.lower())
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid {name}. Must be one of: {', '.join(member.value for member in enum_class)}"
+        )
+
+def get_users_page(db: Session, status_filter: Optional[UserStatus] = None, role: Optional[UserRole] = None,
+                   email_verified: Optional[bool] = None, search: Optional[str] = None,
+                   cursor: Optional[str] = None, limit: int = 50):
+    """
+    One page of users, newest first, with the total number of matching users.
+
+    Keyset pagination on (COALESCE(created_at, ''), username) served by
+    ix_users_listing and ix_users_status_listing, so later pages cost the same
+    as the first. Users without created_at sort last and are still reached by
+    the cursor. The total is a scalar subquery of the same statement, one round
+    trip per page.
+
+    Returns:
+        dict: items, total and next_cursor (None on the last page)
+    """
+    filters = []
+    if status_filter is not None:
+        filters.append(User.status == status_filter)
+    if role is not None:
+        filters.append(User.role == role)
+    if email_verified is not None:
+        filters.append(User.email_verified == email_verified)
+    if search:
+        pattern = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        filters.append(or_(User.username.like(pattern, escape="\\"), User.email.like(pattern, escape="\\")))
+
+    total = select(func.count()).select_from(User).where(*filters).scalar_subquery()
+    query = db.query(User, total.label("total")).filter(*filters)
+    # Same expression as in the indexes; the '' must be inlined for SQLite to match them
+    created = func.coalesce(User.created_at, literal_column("''"))
+    if cursor:
+        created_at, username = _decode_cursor(cursor)
+        if created_at is None:
+            created_at = literal_column("''")
+        query = query.filter(or_(
+            created < created_at,
+            and_(created == created_at, User.username < username)
+        ))
+    rows = query.order_by(created.desc(), User.username.desc()).limit(limit + 1).all()
+
+    items = [user for user, _ in rows[:limit]]
+    if rows:
+        count = rows[0][1]
+    elif cursor:
+        # Past the last page: the statement returned no row to carry the total
+        count = db.query(func.count(User.username)).filter(*filters).scalar()
+    else:
+        count = 0
+    next_cursor = _encode_cursor(items[-1]) if len(rows) > limit else None
+    return {"items": items, "total": count, "next_cursor": next_cursor}
 
 def update_user_status(db: Session, username: str, status: UserStatus):
     user = get_user(db, username)
@@ -49,6 +125,7 @@ def update_user_status(db: Session, username: str, status: UserStatus):
         user.status = status
         db.commit()
         db.refresh(user)
+        revoke_user_tokens(db, username)
     return user
 
 @router.post("/register", response_model=UserResponse)
@@ -78,8 +155,10 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create user with pending status
-    db_user = create_user(db=db, user=user)
+    hashed_password = await get_password_hash_async(user.password)
+    db_user = create_user(db=db, user=user, hashed_password=hashed_password)
     logger.info(f"User registered: {user.username}, awaiting email verification and admin approval")
+    activity_recorder.record(db_user.username, activity.REGISTER)
     
     # Send verification email
     try:
@@ -88,8 +167,8 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         
         # Log the detailed result from the email function
         if email_result and email_result.get("success"):
-            logger.info(f"Verification email successfully sent to {db_user.email}")
-            logger.info(f"Email details: took {email_result.get('duration_seconds', 'unknown')} seconds")
+            logger.info(f"Verification email queued for {db_user.email}")
+            logger.info(f"Email details: outbox id {email_result.get('outbox_id')}")
         else:
             logger.warning(f"Verification email not sent successfully to {db_user.email}")
             if email_result:
@@ -102,30 +181,42 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     
     return db_user
 
-@router.get("/users", response_model=List[UserResponse])
+@router.get("/users", response_model=UserPage)
 async def read_users(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: User = Depends(get_current_active_user),
+    status_filter: Optional[str] = Query(None, alias="status", description="pending, active or disabled"),
+    role: Optional[str] = Query(None, description="admin or user"),
+    email_verified: Optional[bool] = Query(None),
+    q: Optional[str] = Query(None, description="Prefix of the username or email"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
+    """Paginated user list with filters, newest users first (admin only)"""
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(
             status_code=403,
             detail="Not authorized to view all users"
         )
-    users = get_users(db, skip=skip, limit=limit)
-    return users
+    return get_users_page(
+        db,
+        status_filter=_parse_enum(UserStatus, status_filter, "status") if status_filter else None,
+        role=_parse_enum(UserRole, role, "role") if role else None,
+        email_verified=email_verified,
+        search=q,
+        cursor=cursor,
+        limit=limit,
+    )
 
 @router.get("/users/me", response_model=UserResponse)
-async def read_user_me(current_user: User = Depends(get_current_active_user)):
+async def read_user_me(current_user: User = Depends(get_current_user_record)):
     return current_user
 
 @router.patch("/users/{username}/status", response_model=UserResponse)
 async def update_user_status_endpoint(
     username: str,
     status_update: UserStatusUpdate,
-    current_user: User = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if current_user.role != UserRole.ADMIN:
@@ -148,12 +239,14 @@ async def update_user_status_endpoint(
             status_code=404,
             detail="User not found"
         )
+    activity_recorder.record(current_user.username, activity.STATUS_CHANGE,
+                             {"username": username, "status": new_status.value})
     return updated_user
 
 @router.delete("/users/{username}")
 async def delete_user(
     username: str,
-    current_user: User = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
@@ -185,6 +278,8 @@ async def delete_user(
     try:
         db.delete(user_to_delete)
         db.commit()
+        revoke_user_tokens(db, username)
+        activity_recorder.record(current_user.username, activity.USER_DELETE, {"username": username})
         return {"message": f"User {username} has been deleted"}
     except Exception as e:
         db.rollback()
@@ -219,12 +314,14 @@ async def verify_email(token: str, db: Session = Depends(get_db)):
     
     db.commit()
     db.refresh(user)
+    revoke_user_tokens(db, user.username)
+    activity_recorder.record(user.username, activity.EMAIL_VERIFIED)
     
     return user
 
 @router.get("/admin/pending-users", response_model=List[UserResponse])
 async def list_pending_users(
-    current_user: User = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     from utils.logger import get_logger
@@ -240,7 +337,7 @@ async def list_pending_users(
         )
     
     # Query pending users
-    pending_users = db.query(User).filter(User.status == UserStatus.PENDING).all()
+    pending_users = db.query(User).filter(User.status == UserStatus.PENDING).order_by(User.created_at).all()
     logger.info(f"Admin {current_user.username} viewed list of {len(pending_users)} pending users")
     
     return pending_users
@@ -248,7 +345,7 @@ async def list_pending_users(
 @router.post("/admin/approve-user/{username}", response_model=UserResponse)
 async def approve_user(
     username: str,
-    current_user: User = Depends(get_current_active_user),
+    current_user: TokenData = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     from utils.logger import get_logger
@@ -292,6 +389,9 @@ async def approve_user(
     user.status = UserStatus.ACTIVE
     db.commit()
     db.refresh(user)
+    revoke_user_tokens(db, username)
+    activity_recorder.record(current_user.username, activity.STATUS_CHANGE,
+                             {"username": username, "status": UserStatus.ACTIVE.value})
     
     logger.info(f"Admin {current_user.username} approved user {username}")
     
@@ -299,7 +399,7 @@ async def approve_user(
     try:
         from utils.email import send_account_approved_email
         await send_account_approved_email(user.email)
-        logger.info(f"Account approval notification sent to {user.email}")
+        logger.info(f"Account approval notification queued for {user.email}")
     except Exception as e:
         logger.error(f"Failed to send approval notification to {user.email}: {str(e)}")
     
@@ -1,12 +1,22 @@
 from typing import Optional
 from pydantic import BaseModel
+from models.users import UserRole, UserStatus
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
+    """Claims of an access token, used as the authenticated user of a request"""
     username: Optional[str] = None
+    token_version: Optional[int] = None
+    role: Optional[UserRole] = None
+    status: Optional[UserStatus] = None
+    email_verified: bool = False
 
 class PasswordChangeRequest(BaseModel):
     current_password: str
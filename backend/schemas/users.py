@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from pydantic import BaseModel, EmailStr
 from enum import Enum
 
@@ -50,6 +50,13 @@ class UserResponse(UserBase):
         }
 
 
+class UserPage(BaseModel):
+    """One page of the admin user listing; next_cursor is None on the last page"""
+    items: List[UserResponse]
+    total: int
+    next_cursor: Optional[str] = None
+
+
 class UserInDB(UserBase):
     hashed_password: str
     role: UserRole
@@ -0,0 +1,114 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models.activity import UserActivity
+from models.users import User
+from utils import activity, activity_retention
+from utils.activity import ActivityRecorder
+from utils.maintenance_lock import acquire_lock, release_lock
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(username="anna", email="anna@example.com", hashed_password="x",
+                     last_login=datetime(2030, 1, 1)))
+    session.add(User(username="ben", email="ben@example.com", hashed_password="x"))
+    session.commit()
+    session.close()
+    return engine
+
+
+def test_events_and_last_login_are_written_in_one_flush(engine):
+    # A long interval keeps the background thread out of the way, flush() writes
+    recorder = ActivityRecorder(engine, flush_interval=3600)
+    recorder.record("ben", activity.LOGIN)
+    recorder.record("ben", activity.UPLOAD, {"filename": "tour.gpx", "status": "success"})
+    recorder.record("ben", activity.LOGIN)
+    recorder.record("anna", activity.LOGIN)
+
+    assert recorder.stats()["queued"] == 4
+    assert recorder.flush() == 4
+    assert recorder.stats()["written"] == 4
+    assert recorder.flush() == 0
+
+    session = sessionmaker(bind=engine)()
+    actions = [a.action for a in session.query(UserActivity).order_by(UserActivity.timestamp)]
+    assert actions.count(activity.LOGIN) == 3
+    upload = session.query(UserActivity).filter_by(action=activity.UPLOAD).one()
+    assert upload.details == {"filename": "tour.gpx", "status": "success"}
+
+    ben = session.get(User, "ben")
+    assert ben.last_login is not None
+    # A newer stored login time is not overwritten by an older event
+    assert session.get(User, "anna").last_login == datetime(2030, 1, 1)
+
+
+def test_full_queue_drops_events(engine):
+    recorder = ActivityRecorder(engine, flush_interval=3600, max_queue=2)
+    for _ in range(3):
+        recorder.record("ben", activity.LOGIN_FAILED)
+
+    assert recorder.stats()["dropped"] == 1
+    assert recorder.flush() == 2
+
+
+def test_rollup_is_idempotent_and_pruning_keeps_recent_events(engine):
+    recorder = ActivityRecorder(engine, flush_interval=3600)
+    recorder.record("ben", activity.LOGIN)
+    recorder.record("ben", activity.LOGIN)
+    recorder.flush()
+    old = datetime.combine(datetime.utcnow().date() - timedelta(days=100), datetime.min.time())
+    with engine.begin() as connection:
+        connection.execute(UserActivity.__table__.insert(), [
+            {"id": f"old{i}", "user_id": "anna", "action": activity.LOGIN, "timestamp": old} for i in range(5)
+        ])
+
+    assert activity_retention.rollup_activities(engine) == 2
+    activity_retention.rollup_activities(engine)
+    session = sessionmaker(bind=engine)()
+    summary = activity_retention.get_activity_summary(session, days=365)
+    assert [(row["user_id"], row["count"]) for row in summary] == [("ben", 2), ("anna", 5)]
+
+    assert activity_retention.prune_activities(engine, retention_days=90, batch_size=2) == 5
+    assert session.query(UserActivity).count() == 2
+    # The summary outlives the raw events
+    assert len(activity_retention.get_activity_summary(session, days=365)) == 2
+
+
+def test_late_events_are_rolled_up_and_not_pruned(engine):
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    with engine.begin() as connection:
+        connection.execute(UserActivity.__table__.insert(), {"id": "today", "user_id": "ben",
+                                                             "action": activity.LOGIN, "timestamp": today})
+    activity_retention.rollup_activities(engine)
+
+    # Another worker flushes an event of yesterday after the rollup moved on to today
+    with engine.begin() as connection:
+        connection.execute(UserActivity.__table__.insert(), {"id": "late", "user_id": "ben",
+                                                             "action": activity.LOGIN,
+                                                             "timestamp": today - timedelta(hours=1)})
+    assert activity_retention.prune_activities(engine, retention_days=0) == 0
+    activity_retention.rollup_activities(engine)
+
+    session = sessionmaker(bind=engine)()
+    days = {row["day"] for row in activity_retention.get_activity_summary(session, days=2)}
+    assert (today - timedelta(days=1)).date().isoformat() in days
+
+
+def test_maintenance_runs_in_one_process_at_a_time(engine):
+    assert acquire_lock(engine, "maintenance", owner="other-worker")
+    assert activity_retention.run_maintenance(engine)["skipped"]
+
+    release_lock(engine, "maintenance", owner="other-worker")
+    assert "skipped" not in activity_retention.run_maintenance(engine)
+    # An expired lease of a crashed process is taken over
+    assert acquire_lock(engine, "maintenance", ttl=-1, owner="crashed-worker")
+    assert "skipped" not in activity_retention.run_maintenance(engine)
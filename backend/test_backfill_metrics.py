@@ -0,0 +1,50 @@
+import json
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+import backfill_metrics
+from utils.schema import ensure_tours_schema
+from utils.tour_metrics import METRICS_VERSION
+
+TRACK = json.dumps({"type": "LineString", "coordinates": [[8.5, 47.3, 400.0], [8.51, 47.31, 420.0]]})
+
+
+def stored_row(source_format, current_type="Inline"):
+    # id, name, track_geojson, speed_kmh, type, source_format and an empty tour_tracks join
+    return (1, "Wanderung Albis", TRACK, 10.0, current_type, source_format) + (None,) * 7
+
+
+def test_stored_backfill_keeps_the_kml_tour_type():
+    # A "Wanderung" at 10 km/h is Inline when imported from KML, Hike from GPX
+    _, metrics = backfill_metrics.derive_from_stored(stored_row("kml"))
+    assert metrics["type"] == "Inline"
+    _, metrics = backfill_metrics.derive_from_stored(stored_row("gpx"))
+    assert metrics["type"] == "Hike"
+    # Without a stored format the KML classification is recognized and the format stored
+    _, metrics = backfill_metrics.derive_from_stored(stored_row(None))
+    assert (metrics["type"], metrics["source_format"]) == ("Inline", "kml")
+    _, metrics = backfill_metrics.derive_from_stored(stored_row(None, current_type="Hike"))
+    assert metrics["type"] == "Hike"
+    assert "source_format" not in metrics
+
+
+def test_partial_updates_are_stamped_but_stay_open_for_the_archive(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    ensure_tours_schema(engine)
+    monkeypatch.setattr(backfill_metrics, "engine", engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO tours (id, name, type, date, track_geojson, komootid, metrics_version) "
+            "VALUES (1, 'Wanderung Albis', 'Undefined', '2024-05-01', :track, '42', 0)"
+        ), {"track": TRACK})
+
+    _, metrics = backfill_metrics.derive_from_stored(stored_row(None))
+    assert backfill_metrics.write_batch([{"id": 1, **metrics}], "id = :id", force=True) == 1
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT metrics_version FROM tours")).scalar() == METRICS_VERSION
+
+    # The archive run still updates the stamped tour, it has no full-fidelity track yet
+    archive_metrics = {"komootid": "42", "type": "Hike", "ebike": False, "speed_kmh": 4.5, "distance_km": 9.0,
+                       "duration_s": 7200, "elevation_up": 300.0, "elevation_down": 280.0, "source_format": "gpx"}
+    assert backfill_metrics.write_batch([archive_metrics], "komootid = :komootid", force=False) == 1
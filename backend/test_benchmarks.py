@@ -0,0 +1,38 @@
+import sqlite3
+
+from benchmarks.compare import compare
+from benchmarks.synthetic import build_database, synthetic_tour, upload_file
+
+
+def test_synthetic_tours_are_deterministic():
+    first = synthetic_tour(7, seed=1)
+    assert synthetic_tour(7, seed=1) == first
+    assert synthetic_tour(8, seed=1)["lats"] != first["lats"]
+    assert synthetic_tour(7, seed=2)["lats"] != first["lats"]
+    assert upload_file("kmz", 3) == upload_file("kmz", 3)
+
+
+def test_build_database_writes_tours_and_tracks(tmp_path):
+    path = str(tmp_path / "tours.db")
+    result = build_database(path, 20, seed=1, points_scale=0.1)
+
+    with sqlite3.connect(path) as connection:
+        tours = connection.execute("SELECT COUNT(*), COUNT(DISTINCT komootid), MIN(distance_km) FROM tours").fetchone()
+        points = connection.execute("SELECT SUM(point_count) FROM tour_tracks").fetchone()[0]
+        types = {row[0] for row in connection.execute("SELECT DISTINCT type FROM tours")}
+    assert tours[:2] == (20, 20)
+    assert tours[2] > 0
+    assert points == result["points"]
+    assert types <= {"Bike", "Hike", "Inline"}
+
+
+def test_compare_ignores_noise_within_the_rounds():
+    def run(**medians):
+        return {"benchmarks": {name: {"group": "tours", "median_ms": median, "min_ms": low}
+                               for name, (median, low) in medians.items()}}
+
+    baseline = run(a=(10.0, 9.0), b=(10.0, 9.0), c=(10.0, 9.0), gone=(1.0, 1.0))
+    current = run(a=(15.0, 11.0), b=(15.0, 9.5), c=(5.0, 4.0), new=(1.0, 1.0))
+    status = {row["name"]: row["status"] for row in compare(baseline, current, threshold=0.2)}
+    # b is slower by median, but its fastest round is as fast as the baseline
+    assert status == {"a": "slower", "b": "ok", "c": "faster", "gone": "missing", "new": "new"}
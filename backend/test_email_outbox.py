@@ -0,0 +1,158 @@
+import socket
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models.outbox import OutboxEmail
+from utils import email_outbox
+from utils.email_outbox import EmailSender, enqueue_email
+
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+
+class Mailbox:
+    """aiosmtpd handler that keeps the messages and rejects addresses starting with 'unknown'."""
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("unknown"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.content))
+        return "250 Message accepted"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def settings(port):
+    return {"host": "127.0.0.1", "port": port, "starttls": False, "ssl": False,
+            "username": None, "password": None, "sender": "noreply@example.com"}
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def smtp_server():
+    mailbox = Mailbox()
+    port = free_port()
+    controller = controller_module.Controller(mailbox, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield mailbox, port
+    controller.stop()
+
+
+def outbox_rows(engine):
+    with engine.connect() as connection:
+        return {row.recipient: row for row in connection.execute(select(OutboxEmail.__table__))}
+
+
+def test_batch_is_sent_over_one_connection(engine, smtp_server):
+    mailbox, port = smtp_server
+    for i in range(5):
+        enqueue_email(f"user{i}@example.com", "Hello", "<p>Hi</p>", engine=engine)
+    enqueue_email("unknown@example.com", "Hello", "<p>Hi</p>", engine=engine)
+    sender = EmailSender(engine, settings(port), batch_size=10)
+
+    assert sender.send_pending() == 6
+    sender._close()
+
+    assert len(mailbox.messages) == 5
+    assert mailbox.connections == 1
+    rows = outbox_rows(engine)
+    assert {row.status for name, row in rows.items() if name.startswith("user")} == {email_outbox.SENT}
+    # A 5xx rejection is not retried
+    assert rows["unknown@example.com"].status == email_outbox.FAILED
+    assert sender.send_pending() == 0
+    # Delivered bodies (with their links) are not kept
+    assert {row.body for name, row in rows.items() if name.startswith("user")} == {""}
+    assert rows["unknown@example.com"].body == "<p>Hi</p>"
+
+
+def test_unreachable_server_is_retried_with_backoff(engine):
+    enqueue_email("anna@example.com", "Hello", "<p>Hi</p>", engine=engine)
+    sender = EmailSender(engine, settings(free_port()), max_attempts=2, backoff_seconds=60)
+
+    assert sender.send_pending() == 1
+    row = outbox_rows(engine)["anna@example.com"]
+    assert (row.status, row.attempts) == (email_outbox.PENDING, 1)
+    assert (row.next_attempt_at - datetime.utcnow()).total_seconds() > 50
+    # Not due yet
+    assert sender.send_pending() == 0
+
+    with engine.begin() as connection:
+        connection.execute(OutboxEmail.__table__.update().values(next_attempt_at=datetime.utcnow()))
+    sender.send_pending()
+    row = outbox_rows(engine)["anna@example.com"]
+    assert (row.status, row.attempts) == (email_outbox.FAILED, 2)
+    assert row.last_error
+
+
+def test_sent_and_failed_messages_are_pruned_after_the_retention(engine):
+    old = datetime.utcnow() - timedelta(days=40)
+    for recipient, status in (("sent@example.com", email_outbox.SENT), ("failed@example.com", email_outbox.FAILED),
+                              ("pending@example.com", email_outbox.PENDING), ("new@example.com", email_outbox.SENT)):
+        enqueue_email(recipient, "Hello", "<p>Hi</p>", engine=engine)
+        with engine.begin() as connection:
+            connection.execute(OutboxEmail.__table__.update().where(OutboxEmail.recipient == recipient).values(
+                status=status, next_attempt_at=old if recipient != "new@example.com" else datetime.utcnow(),
+                sent_at=old if recipient == "sent@example.com" else None))
+
+    assert email_outbox.prune_outbox(engine, retention_days=30) == 2
+    assert set(outbox_rows(engine)) == {"pending@example.com", "new@example.com"}
+
+
+def test_batch_in_flight_is_not_reclaimed_by_another_sender(engine, monkeypatch):
+    monkeypatch.setattr(email_outbox, "MAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS", 0.2)
+    for i in range(4):
+        enqueue_email(f"user{i}@example.com", "Hello", "<p>Hi</p>", engine=engine)
+    sender = EmailSender(engine, settings(free_port()), batch_size=10)
+    other = EmailSender(engine, settings(free_port()), batch_size=10)
+    reclaimed = []
+
+    def slow_send(row):
+        # Every message waits for a slow server; the whole batch takes longer than the claim timeout
+        time.sleep(0.1)
+        if row["recipient"] == "user3@example.com":
+            reclaimed.extend(other._claim())
+
+    monkeypatch.setattr(sender, "_send", slow_send)
+    assert sender.send_pending() == 4
+    assert reclaimed == []
+    assert {row.status for row in outbox_rows(engine).values()} == {email_outbox.SENT}
+
+
+def test_configuration_test_mail_is_sent_directly(smtp_server):
+    mailbox, port = smtp_server
+    email_outbox.send_email_now("anna@example.com", "Test", "<p>Hi</p>", settings(port))
+    assert mailbox.messages[0][0] == ["anna@example.com"]
+
+    with pytest.raises(Exception):
+        email_outbox.send_email_now("unknown@example.com", "Test", "<p>Hi</p>", settings(port))
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    assert [email_outbox.backoff_delay(n, 30, 200) for n in range(1, 6)] == [30, 60, 120, 200, 200]
@@ -0,0 +1,65 @@
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from utils.health import HealthMonitor
+from utils.migrations import run_migrations
+
+
+class FakeWriter:
+    max_queue = 100
+
+    def __init__(self, queued):
+        self.queued = queued
+
+    def stats(self):
+        return {"queued": self.queued}
+
+
+def make_engine():
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+def test_ready_after_migrations_and_checks_pass():
+    engine = make_engine()
+    monitor = HealthMonitor(engine, writer=FakeWriter(10))
+
+    result = monitor.check()
+    assert not result["ready"]
+    assert "error" in result["checks"]["migrations"]
+
+    run_migrations(engine)
+    result = monitor.check()
+    assert result["ready"], result
+    assert result["checks"]["writer_queue"]["queued"] == 10
+
+
+def test_full_writer_queue_and_low_disk_are_not_ready(tmp_path):
+    engine = make_engine()
+    run_migrations(engine)
+    monitor = HealthMonitor(engine, str(tmp_path / "app.db"), FakeWriter(95), min_free_disk_mb=0)
+    checks = monitor.check()["checks"]
+    assert not checks["writer_queue"]["ok"]
+    assert checks["disk"]["ok"]
+
+    monitor = HealthMonitor(engine, str(tmp_path / "app.db"), min_free_disk_mb=float("inf"))
+    assert not monitor.check()["checks"]["disk"]["ok"]
+
+
+def test_readiness_serves_the_cached_result():
+    engine = make_engine()
+    run_migrations(engine)
+    monitor = HealthMonitor(engine, interval=60)
+    # Not started yet: no result
+    monitor._thread = object()
+    assert monitor.readiness()["status"] == "starting"
+
+    monitor.check()
+    assert monitor.readiness()["status"] == "ready"
+
+    # A check that hangs makes the result stale
+    monitor._checked_at = time.monotonic() - 60 * 4
+    result = monitor.readiness()
+    assert result["status"] == "stale"
+    assert not result["ready"]
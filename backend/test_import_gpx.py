@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, text
+
+import import_gpx
+from benchmarks.synthetic import build_database, gpx_document, synthetic_tour, write_upload_files
+from utils.schema import TOURS_INDEXES
+
+SEED = 7
+
+
+def test_bulk_import_appends_to_existing_tours(tmp_path, monkeypatch):
+    database = str(tmp_path / "tours.db")
+    build_database(database, tours=3, seed=SEED)
+    engine = create_engine(f"sqlite:///{database}")
+    monkeypatch.setattr(import_gpx, "engine", engine)
+    monkeypatch.setattr(import_gpx, "DATABASE_FILE", database)
+
+    folder = tmp_path / "gpx"
+    write_upload_files(str(folder), 4, seed=SEED, kinds=("gpx",))
+    # Export of a tour that is already in the database, and a second copy of a new one
+    (folder / "existing.gpx").write_bytes(gpx_document(synthetic_tour(1, SEED)))
+    (folder / "upload-0-copy.gpx").write_bytes((folder / "upload-0.gpx").read_bytes())
+
+    result = import_gpx.bulk_import(str(folder), batch_size=2, workers=1)
+
+    assert (result["imported"], result["exists"], result["error"]) == (4, 2, 0)
+    with engine.connect() as connection:
+        ids = [row[0] for row in connection.execute(text("SELECT id FROM tours ORDER BY id"))]
+        assert ids == [1, 2, 3, 4, 5, 6, 7]
+        assert connection.execute(text(
+            "SELECT COUNT(*), COUNT(DISTINCT komootid) FROM tours")).fetchone() == (7, 7)
+        # Every new tour got its track under its own id
+        assert [row[0] for row in connection.execute(text("SELECT tour_id FROM tour_tracks ORDER BY tour_id"))] == ids
+        indexes = {row[1] for row in connection.execute(text("PRAGMA index_list(tours)"))}
+        assert set(TOURS_INDEXES) <= indexes
+    engine.dispose()
@@ -0,0 +1,103 @@
+import io
+import zipfile
+
+import pytest
+
+from utils import kmz_converter
+from utils.kml_converter import kml_to_gpx, parse_timestamps
+from utils.kmz_converter import kmz_to_gpx
+from utils.uploads import UploadTooLargeError
+
+KML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+  <Document>
+    <name>Inline am See</name>
+    <Placemark>
+      <name>Track</name>
+      <gx:Track>
+        <when>2024-05-01T08:00:00Z</when>
+        <when>2024-05-01T08:00:10Z</when>
+        <when>2024-05-01T08:00:20Z</when>
+        <gx:coord>8.7 47.5 400</gx:coord>
+        <gx:coord>8.7005 47.5005 401</gx:coord>
+        <gx:coord>8.701 47.501 402</gx:coord>
+      </gx:Track>
+    </Placemark>
+  </Document>
+</kml>
+"""
+
+
+def make_kmz(*documents):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in documents:
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_kml_is_converted_in_memory():
+    gpx = kml_to_gpx(io.BytesIO(KML), source_name="tour.kml")
+
+    assert gpx.name == "Inline am See"
+    points = gpx.tracks[0].segments[0].points
+    assert [(p.latitude, p.longitude, p.elevation) for p in points[:2]] == [(47.5, 8.7, 400.0), (47.5005, 8.7005, 401.0)]
+    assert points[2].time.isoformat() == "2024-05-01T08:00:20+00:00"
+
+
+def test_kmz_is_read_without_extracting():
+    [(name, gpx)] = kmz_to_gpx(make_kmz(("doc.kml", KML), ("files/photo.jpg", b"\xff\xd8")))
+    assert name == "doc.kml"
+    assert len(gpx.tracks[0].segments[0].points) == 3
+
+
+@pytest.mark.parametrize("parallel_min_size", [None, 0])
+def test_every_kml_document_is_a_tour(monkeypatch, parallel_min_size):
+    if parallel_min_size is not None:
+        monkeypatch.setattr(kmz_converter, "KMZ_PARALLEL_MIN_SIZE", parallel_min_size)
+    second = KML.replace(b"Inline am See", b"Zweite Tour")
+    tours = kmz_to_gpx(make_kmz(("doc.kml", KML), ("tours/second.kml", second)))
+    assert [(name, gpx.name) for name, gpx in tours] == [("doc.kml", "Inline am See"), ("tours/second.kml", "Zweite Tour")]
+
+
+def test_kmz_decompression_limits(monkeypatch):
+    bomb = make_kmz(("doc.kml", KML + b" " * (2 * 1024 * 1024)))
+    with pytest.raises(UploadTooLargeError, match="compression ratio"):
+        kmz_to_gpx(bomb)
+
+    monkeypatch.setattr(kmz_converter, "KMZ_MAX_TOTAL_SIZE", len(KML) + 1)
+    with pytest.raises(UploadTooLargeError, match="decompressed size"):
+        kmz_to_gpx(make_kmz(("a.kml", KML), ("b.kml", KML)))
+
+
+def test_invalid_kmz_returns_none():
+    assert kmz_to_gpx(io.BytesIO(b"not a zip archive")) is None
+
+
+def test_linestring_points_and_waypoints():
+    kml = b"""<kml xmlns="http://www.opengis.net/kml/2.2">
+      <Document>
+        <Placemark>
+          <name>Route</name>
+          <TimeStamp><when>2024-05-01T08:00:00Z</when></TimeStamp>
+          <LineString><coordinates>8.7,47.5,400 8.71,47.51,410</coordinates></LineString>
+        </Placemark>
+        <Placemark>
+          <name>Start</name>
+          <Point><coordinates>8.7,47.5</coordinates></Point>
+        </Placemark>
+      </Document>
+    </kml>"""
+    gpx = kml_to_gpx(io.BytesIO(kml), source_name="route.kml")
+
+    assert gpx.name == "route"
+    assert gpx.tracks[0].name == "Route"
+    points = gpx.tracks[0].segments[0].points
+    assert [(p.latitude, p.elevation) for p in points] == [(47.5, 400.0), (47.51, 410.0)]
+    assert all(p.time.isoformat() == "2024-05-01T08:00:00+00:00" for p in points)
+    assert [(w.name, w.latitude, w.elevation) for w in gpx.waypoints] == [("Start", 47.5, None)]
+
+
+def test_invalid_timestamps_are_skipped():
+    assert parse_timestamps(["2024-05-01T08:00:00Z", "gestern", None])[1:] == [None, None]
@@ -0,0 +1,48 @@
+import json
+import logging
+import queue
+
+from utils.logger import DroppingQueueHandler, JsonFormatter, RateLimitFilter, parse_levels
+
+
+def make_record(message, name="test", level=logging.INFO, **extra):
+    record = logging.LogRecord(name, level, __file__, 1, message, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_records_carry_extra_fields():
+    entry = json.loads(JsonFormatter().format(make_record("Upload done", tour_id=7)))
+
+    assert entry["message"] == "Upload done"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "test"
+    assert entry["tour_id"] == 7
+
+
+def test_repeated_messages_are_rate_limited():
+    rate_limit = RateLimitFilter(limit=2, window=60)
+    passed = [rate_limit.filter(make_record("Disk full")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    # Other messages have their own budget
+    assert rate_limit.filter(make_record("Other message"))
+
+    # After the window the next record reports what was suppressed
+    rate_limit.window = 0
+    record = make_record("Disk full")
+    assert rate_limit.filter(record)
+    assert record.suppressed == 3
+
+
+def test_full_queue_drops_records():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    handler.handle(make_record("first"))
+    handler.handle(make_record("second"))
+    assert handler.dropped == 1
+
+
+def test_per_module_levels():
+    assert parse_levels("utils.email=debug, sqlalchemy.engine=WARNING,broken,x=LOUD") == {
+        "utils.email": logging.DEBUG,
+        "sqlalchemy.engine": logging.WARNING,
+    }
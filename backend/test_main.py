@@ -48,3 +48,12 @@ def client():
 def test_read_main(client):
     response = client.get("/")
     assert response.status_code == 200
+
+def test_cors_preflights_are_counted_in_the_metrics(client):
+    from utils import metrics
+
+    before = metrics.HTTP_REQUESTS.value("OPTIONS", metrics.UNMATCHED_ROUTE, "200")
+    response = client.options("/api/tours", headers={"Origin": "http://localhost:3000",
+                                                     "Access-Control-Request-Method": "GET"})
+    assert response.status_code == 200
+    assert metrics.HTTP_REQUESTS.value("OPTIONS", metrics.UNMATCHED_ROUTE, "200") == before + 1
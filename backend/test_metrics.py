@@ -0,0 +1,59 @@
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from utils import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = []
+    latency = metrics.Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 0.7, 3.0):
+        latency.observe(value, "/a")
+
+    lines = metrics.render(registry).splitlines()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+    assert "# TYPE latency_seconds histogram" in lines
+
+
+def test_requests_are_labelled_with_the_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=503)
+        return {"id": item_id}
+
+    client = TestClient(app)
+    before = metrics.HTTP_LATENCY.count("GET", "/items/{item_id}")
+    for item_id in (1, 2, 0):
+        client.get(f"/items/{item_id}")
+    client.get("/nothing/here")
+
+    assert metrics.HTTP_LATENCY.count("GET", "/items/{item_id}") == before + 3
+    assert metrics.HTTP_REQUESTS.value("GET", "/items/{item_id}", "503") >= 1
+    assert metrics.HTTP_ERRORS.value("GET", "/items/{item_id}") >= 1
+    assert metrics.HTTP_REQUESTS.value("GET", metrics.UNMATCHED_ROUTE, "404") >= 1
+    assert metrics.HTTP_IN_FLIGHT.value() == 0
+
+
+def test_sql_statements_are_counted_per_operation():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine, "test")
+    metrics.instrument_engine(engine, "test")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.execute(text("select 2"))
+        try:
+            connection.execute(text("SELECT * FROM missing"))
+        except Exception:
+            pass
+
+    assert metrics.DB_QUERIES.value("test", "SELECT") == 2
+    assert metrics.DB_QUERY_ERRORS.value("test") == 1
+    assert metrics.DB_LATENCY.count("test", "SELECT") == 2
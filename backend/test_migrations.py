@@ -0,0 +1,86 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from utils.migrations import MIGRATIONS, run_migrations
+
+
+def make_engine():
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+def test_migrations_upgrade_an_old_users_table_once():
+    engine = make_engine()
+    with engine.begin() as connection:
+        # users table of an early version: no token_version, roles in lower case
+        connection.execute(text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, email TEXT, hashed_password TEXT, "
+            "role TEXT, status TEXT, email_verified BOOLEAN, created_at TIMESTAMP)"
+        ))
+        connection.execute(text("INSERT INTO users (username, role) VALUES ('old', 'admin'), ('new', 'USER')"))
+        connection.execute(text("CREATE TABLE user_activities (id INTEGER PRIMARY KEY, timestamp TIMESTAMP)"))
+
+    assert run_migrations(engine) == [name for name, _ in MIGRATIONS]
+
+    with engine.connect() as connection:
+        columns = {row[1] for row in connection.execute(text("PRAGMA table_info(users)"))}
+        roles = dict(connection.execute(text("SELECT username, role FROM users")).all())
+        tables = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        indexes = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    assert "token_version" in columns
+    assert {"ix_users_listing", "ix_users_status_listing"} <= indexes
+    assert not {"ix_users_created_at", "ix_users_status_created_at"} & indexes
+    assert roles == {"old": "ADMIN", "new": "USER"}
+    assert {"refresh_tokens", "user_activity_daily", "email_outbox", "maintenance_locks", "schema_migrations"} <= tables
+
+    # A restart only reads schema_migrations
+    assert run_migrations(engine) == []
+
+
+def test_only_new_migrations_run():
+    engine = make_engine()
+    calls = []
+    first = [("a", lambda connection: calls.append("a"))]
+    run_migrations(engine, first)
+    run_migrations(engine, first + [("b", lambda connection: calls.append("b"))])
+    assert calls == ["a", "b"]
+
+
+def test_failed_migration_is_not_recorded():
+    engine = make_engine()
+
+    def broken(connection):
+        raise RuntimeError("boom")
+
+    try:
+        run_migrations(engine, [("broken", broken)])
+    except RuntimeError:
+        pass
+
+    # The next start runs it again
+    calls = []
+    assert run_migrations(engine, [("broken", lambda connection: calls.append(1))]) == ["broken"]
+    assert calls == [1]
+
+
+def test_new_database_gets_the_base_schema_before_the_migrations():
+    engine = make_engine()
+    assert run_migrations(engine) == [name for name, _ in MIGRATIONS]
+
+    with engine.connect() as connection:
+        columns = {row[1] for row in connection.execute(text("PRAGMA table_info(users)"))}
+        indexes = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    assert "token_version" in columns
+    assert {"ix_users_listing", "ix_users_status_listing", "ix_user_activities_timestamp"} <= indexes
+
+
+def test_deferred_migration_is_not_recorded():
+    engine = make_engine()
+    calls = []
+
+    def needs_table(connection):
+        calls.append(1)
+        return False
+
+    assert run_migrations(engine, [("deferred", needs_table)]) == []
+    assert run_migrations(engine, [("deferred", lambda connection: calls.append(2))]) == ["deferred"]
+    assert calls == [1, 2]
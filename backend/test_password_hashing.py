@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from passlib.context import CryptContext
+
+from utils import password_hashing
+from utils.password_hashing import PasswordHasher, PasswordHashingBusyError
+
+
+class SlowContext:
+    """Stands in for CryptContext; blocks until released like a long bcrypt round."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def hash(self, password):
+        self.release.wait(5)
+        return "hashed-" + password
+
+    def verify(self, password, hashed_password):
+        self.release.wait(5)
+        return hashed_password == "hashed-" + password
+
+
+def test_hash_and_verify_run_in_the_pool():
+    context = SlowContext()
+    context.release.set()
+    hasher = PasswordHasher(context, workers=2, max_queue=4)
+
+    async def run():
+        hashed = await hasher.hash("geheim")
+        return hashed, await hasher.verify("geheim", hashed), await hasher.verify("falsch", hashed)
+
+    assert asyncio.run(run()) == ("hashed-geheim", True, False)
+    stats = hasher.stats()
+    assert stats["completed"] == 3
+    assert stats["waiting"] == stats["running"] == 0
+
+
+def test_calls_beyond_the_queue_limit_are_rejected():
+    context = SlowContext()
+    hasher = PasswordHasher(context, workers=1, max_queue=1)
+
+    async def run():
+        first = asyncio.ensure_future(hasher.verify("a", "hashed-a"))
+        second = asyncio.ensure_future(hasher.verify("b", "hashed-b"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PasswordHashingBusyError):
+            await hasher.verify("c", "hashed-c")
+        context.release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == [True, True]
+    stats = hasher.stats()
+    assert stats["rejected"] == 1
+    assert stats["queue_time_max_ms"] > 0
+
+
+def test_cancelled_queued_call_is_no_longer_waiting():
+    context = SlowContext()
+    hasher = PasswordHasher(context, workers=1, max_queue=1)
+
+    async def run():
+        first = asyncio.ensure_future(hasher.verify("a", "hashed-a"))
+        queued = asyncio.ensure_future(hasher.verify("b", "hashed-b"))
+        await asyncio.sleep(0.05)
+        assert hasher.stats()["waiting"] == 1
+        # The client disconnects while its call is still queued
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        waiting = hasher.stats()["waiting"]
+        context.release.set()
+        return waiting, await first
+
+    assert asyncio.run(run()) == (0, True)
+    # The queue has room again
+    assert asyncio.run(hasher.verify("c", "hashed-c"))
+    assert hasher.stats()["waiting"] == hasher.stats()["running"] == 0
+
+
+def test_calibration_picks_the_highest_cost_within_the_target(monkeypatch, tmp_path):
+    # 10 rounds take 60 ms, every round doubles
+    monkeypatch.setattr(password_hashing, "measure_bcrypt", lambda rounds: 0.06 * 2 ** (rounds - 10))
+    assert password_hashing.calibrate_bcrypt_rounds(250, 10, 15) == (12, 240.0)
+    assert password_hashing.calibrate_bcrypt_rounds(30, 10, 15)[0] == 10
+    assert password_hashing.calibrate_bcrypt_rounds(10000, 10, 13)[0] == 13
+
+    path = str(tmp_path / "calibration.json")
+    assert password_hashing.read_calibration(path) is None
+    password_hashing.write_calibration(12, 240.0, path)
+    assert password_hashing.read_calibration(path) == 12
+
+
+def test_outdated_hashes_are_replaced_on_login(monkeypatch):
+    import auth
+
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4)
+    monkeypatch.setattr(auth, "pwd_context", context)
+    monkeypatch.setattr(auth, "password_hasher", PasswordHasher(context, workers=1))
+    user = SimpleNamespace(username="anna", hashed_password=context.handler().using(rounds=5).hash("geheim"))
+
+    assert asyncio.run(auth.rehash_password_if_needed(user, "geheim"))
+    assert user.hashed_password.startswith("$2b$04$")
+    assert context.verify("geheim", user.hashed_password)
+    assert not asyncio.run(auth.rehash_password_if_needed(user, "geheim"))
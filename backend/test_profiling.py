@@ -0,0 +1,55 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils.profiling import ProfileStore, ProfilingMiddleware
+
+
+def make_client(store, username="admin"):
+    app = FastAPI()
+
+    async def authorize(scope):
+        return username
+
+    app.add_middleware(ProfilingMiddleware, store=store, authorize=authorize)
+
+    @app.get("/tours")
+    async def tours():
+        return [sum(range(1000))]
+
+    return TestClient(app)
+
+
+def test_only_flagged_requests_of_admins_are_profiled(tmp_path):
+    store = ProfileStore(str(tmp_path), max_reports=10)
+    client = make_client(store)
+
+    assert "x-profile-id" not in client.get("/tours").headers
+    profile_id = client.get("/tours", headers={"X-Profile": "1"}).headers["x-profile-id"]
+    client.get("/tours?profile=1")
+
+    reports = store.list()
+    assert len(reports) == 2
+    assert reports[-1]["id"] == profile_id
+    assert reports[-1]["path"] == "/tours"
+    assert reports[-1]["status"] == 200
+    assert reports[-1]["user"] == "admin"
+    assert store.get(profile_id) is not None
+
+    other = make_client(store, username=None)
+    assert "x-profile-id" not in other.get("/tours", headers={"X-Profile": "1"}).headers
+    assert len(store.list()) == 2
+
+
+def test_ring_buffer_keeps_the_newest_reports(tmp_path):
+    store = ProfileStore(str(tmp_path), max_reports=2)
+    ids = []
+    for i in range(4):
+        ids.append(store.new_id())
+        store.save(ids[-1], f"report {i}", "txt", {"path": f"/{i}"})
+
+    assert [report["id"] for report in store.list()] == [ids[3], ids[2]]
+    assert store.get(ids[0]) is None
+    path, media_type = store.get(ids[3])
+    assert open(path).read() == "report 3"
+    assert media_type.startswith("text/plain")
+    assert store.get("../../etc/passwd") is None
@@ -0,0 +1,76 @@
+import logging
+
+from sqlalchemy import create_engine, text
+
+from utils.slow_queries import SlowQueryLog, fingerprint, parameter_shape
+
+
+def test_fingerprint_normalizes_literals_and_lists():
+    assert fingerprint("SELECT * FROM tours  WHERE id = 5 AND name = 'it''s'\n LIMIT :limit") == \
+        "SELECT * FROM tours WHERE id = ? AND name = ? LIMIT ?"
+    assert fingerprint("SELECT * FROM t1 WHERE id IN (?, ?, ?) -- comment") == "SELECT * FROM t1 WHERE id IN (...)"
+    assert fingerprint("INSERT INTO a (x, y) VALUES (?, ?), (?, ?)") == "INSERT INTO a (x, y) VALUES (...)"
+    assert parameter_shape({"username": "bob", "limit": 5}) == "{limit: int, username: str}"
+    assert parameter_shape([(1,), (2,)], executemany=True) == "2 x (int)"
+
+
+def test_slow_statements_are_logged_with_their_plan(caplog):
+    engine = create_engine("sqlite://")
+    log = SlowQueryLog(threshold_ms=0)
+    log.instrument(engine, "test")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE tours (id INTEGER PRIMARY KEY, name TEXT)"))
+    with engine.connect() as connection:
+        with caplog.at_level(logging.WARNING, logger="utils.slow_queries"):
+            for tour_id in (1, 2):
+                connection.execute(text("SELECT name FROM tours WHERE name = :name"), {"name": f"tour {tour_id}"})
+
+    record = [r for r in caplog.records if r.fingerprint.startswith("SELECT name")][0]
+    assert record.parameters == "{name: str}"
+    assert record.plan == ["SCAN tours"]
+    assert "tour 1" not in record.getMessage()
+
+    stats = {entry["fingerprint"]: entry for entry in log.statements()}
+    select = stats["SELECT name FROM tours WHERE name = ?"]
+    assert select["count"] == 2
+    assert select["slow"] == 2
+    assert select["plan"] == ["SCAN tours"]
+    # DDL is counted but not explained
+    assert stats["CREATE TABLE tours (id INTEGER PRIMARY KEY, name TEXT)"]["plan"] is None
+
+
+def test_fast_statements_are_only_counted(caplog):
+    log = SlowQueryLog(threshold_ms=100, max_fingerprints=1)
+    explained = []
+    with caplog.at_level(logging.WARNING, logger="utils.slow_queries"):
+        log.record("test", "SELECT 1", 2.0, explain=lambda: explained.append(1))
+        log.record("test", "SELECT 2", 3.0)
+    assert not caplog.records
+    assert not explained
+    # Beyond max_fingerprints statements are counted together
+    assert [(entry["fingerprint"], entry["count"]) for entry in log.statements(sort="count")] == \
+        [("SELECT ?", 2)]
+
+
+def test_concurrent_slow_statements_explain_a_fingerprint_once():
+    log = SlowQueryLog(threshold_ms=0)
+    explained = []
+
+    def explain():
+        explained.append(1)
+        # A second slow call while the first one is still explaining
+        log.record("test", "SELECT 1", 5.0, explain=lambda: explained.append(2) or ["nested"])
+        return ["SCAN t"]
+
+    log.record("test", "SELECT 1", 5.0, explain=explain)
+    assert explained == [1]
+    assert log.statements()[0]["plan"] == ["SCAN t"]
+
+
+def test_plans_can_be_disabled():
+    engine = create_engine("sqlite://")
+    log = SlowQueryLog(threshold_ms=0, explain_plans=False)
+    log.instrument(engine, "test")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert log.statements()[0]["plan"] is None
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import auth
+import models.activity  # noqa: F401 (registers the table referenced by User)
+from database import Base
+from models.users import User, UserRole, UserStatus
+from utils.user_cache import token_versions, user_cache
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(username="anna", email="anna@example.com", hashed_password="x",
+                     role=UserRole.USER, status=UserStatus.ACTIVE, email_verified=True))
+    session.commit()
+    token_versions.clear()
+    yield session
+    session.close()
+    token_versions.clear()
+
+
+def current_user(token, db):
+    return asyncio.run(auth.get_current_user(token=token, db=db))
+
+
+def test_claims_are_taken_from_the_token(db):
+    token = auth.create_access_token(auth.access_token_claims(auth.get_user(db, "anna")))
+    user = current_user(token, db)
+
+    assert (user.username, user.role, user.status, user.email_verified) == ("anna", UserRole.USER, UserStatus.ACTIVE, True)
+    assert token_versions.get("anna") == 0
+
+
+def test_revoked_tokens_are_rejected(db):
+    old_token = auth.create_access_token(auth.access_token_claims(auth.get_user(db, "anna")))
+    current_user(old_token, db)
+
+    auth.revoke_user_tokens(db, "anna")
+    with pytest.raises(HTTPException) as error:
+        current_user(old_token, db)
+    assert error.value.status_code == 401
+
+    new_token = auth.create_access_token(auth.access_token_claims(auth.get_user(db, "anna")))
+    assert current_user(new_token, db).token_version == 1
+
+
+def test_tokens_without_claims_are_rejected(db):
+    with pytest.raises(HTTPException):
+        current_user(auth.create_access_token({"sub": "anna"}), db)
+
+
+def test_refresh_tokens_rotate(db):
+    first = auth.create_refresh_token(db, auth.get_user(db, "anna"))
+    user, second = auth.rotate_refresh_token(db, first)
+
+    assert user.username == "anna"
+    assert second != first
+    assert auth.rotate_refresh_token(db, second)[0].username == "anna"
+
+
+def test_reused_refresh_token_revokes_the_family(db):
+    first = auth.create_refresh_token(db, auth.get_user(db, "anna"))
+    _, second = auth.rotate_refresh_token(db, first)
+
+    with pytest.raises(HTTPException):
+        auth.rotate_refresh_token(db, first)
+    # The legitimate successor is revoked as well
+    with pytest.raises(HTTPException):
+        auth.rotate_refresh_token(db, second)
+
+
+def test_refresh_tokens_are_revoked_with_the_access_tokens(db):
+    token = auth.create_refresh_token(db, auth.get_user(db, "anna"))
+    auth.revoke_user_tokens(db, "anna")
+    with pytest.raises(HTTPException):
+        auth.rotate_refresh_token(db, token)
+
+
+def test_cached_record_is_tied_to_the_token_version(db):
+    user_cache.clear()
+    token_data = current_user(auth.create_access_token(auth.access_token_claims(auth.get_user(db, "anna"))), db)
+    assert asyncio.run(auth.get_current_user_record(token_data, db)).role == UserRole.USER
+
+    # Another worker changes the role and bumps the version; this process still caches version 0
+    db.execute(text("UPDATE users SET role = 'ADMIN', token_version = 1 WHERE username = 'anna'"))
+    db.commit()
+    new_token = auth.create_access_token({**auth.access_token_claims(auth.get_user(db, "anna")), "ver": 1})
+    token_data = current_user(new_token, db)
+    assert user_cache.get("anna") is None
+    assert asyncio.run(auth.get_current_user_record(token_data, db)).role == UserRole.ADMIN
+    user_cache.clear()
@@ -0,0 +1,57 @@
+import io
+import json
+import zipfile
+from datetime import datetime, timezone
+
+import gpxpy
+
+from utils.kml_converter import kml_to_gpx
+from utils.tour_export import export_tour, export_zip
+from utils.track_store import encode_track
+
+START = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def make_row(tour_id=1, name="Fahrradtour <Rhein>", with_track=True):
+    row = {
+        "id": tour_id, "name": name, "type": "Bike", "date": START.isoformat(),
+        "distance_km": 1.2, "duration_s": 300.0, "speed_kmh": 14.4, "elevation_up": 2.0, "elevation_down": 0.0,
+        "ebike": 0, "komootid": "123", "komoothref": "https://www.komoot.de/tour/123",
+        "track_geojson": json.dumps({"type": "LineString", "coordinates": [[8.7, 47.5], [8.71, 47.51]]}),
+        "point_count": None, "codec": None, "lat": None, "lon": None, "elevation": None, "time": None,
+    }
+    if with_track:
+        row.update(encode_track([47.5, 47.51], [8.7, 8.71], [400.0, 402.0], [START, START.replace(minute=5)]))
+    return row
+
+
+def test_gpx_export_can_be_reimported():
+    gpx = gpxpy.parse(b"".join(export_tour(make_row(), "gpx")).decode("utf-8"))
+
+    assert gpx.name == "Fahrradtour <Rhein>"
+    assert gpx.tracks[0].link == "https://www.komoot.de/tour/123"
+    points = gpx.tracks[0].segments[0].points
+    assert [(p.latitude, p.elevation, p.time) for p in points] == [(47.5, 400.0, START), (47.51, 402.0, START.replace(minute=5))]
+
+
+def test_geojson_export_falls_back_to_track_geojson():
+    feature = json.loads(b"".join(export_tour(make_row(with_track=False), "geojson")))
+    assert feature["geometry"]["coordinates"] == [[8.7, 47.5], [8.71, 47.51]]
+    assert feature["properties"]["ebike"] is False
+    assert "coordTimes" not in feature["properties"]
+
+
+def test_kml_export_uses_gx_track():
+    gpx = kml_to_gpx(io.BytesIO(b"".join(export_tour(make_row(), "kml"))))
+    assert [p.time for p in gpx.tracks[0].segments[0].points] == [START, START.replace(minute=5)]
+
+
+def test_zip_is_streamed_in_chunks():
+    rows = [make_row(tour_id, name=f"Tour {tour_id}") for tour_id in range(1, 4)]
+    chunks = list(export_zip(rows, "gpx"))
+
+    assert len(chunks) > 3
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    assert archive.namelist() == ["1_Tour_1.gpx", "2_Tour_2.gpx", "3_Tour_3.gpx"]
+    assert archive.getinfo("2_Tour_2.gpx").date_time == (2024, 5, 1, 8, 0, 0)
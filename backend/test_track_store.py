@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+
+import gpxpy.gpx
+
+from backfill_metrics import _gpx_from_track
+from utils.tour_metrics import derive_metrics
+from utils.track_store import as_arrays, decode_track, encode_track, iter_points, iter_segments, track_from_gpx
+
+
+def test_round_trip_keeps_all_columns():
+    times = [datetime(2024, 5, 1, 8, 0, second, 250000, tzinfo=timezone.utc) for second in range(3)]
+    row = encode_track([47.5, 47.50001, 47.50002], [8.7, 8.70001, 8.70002], [400.0, None, 401.5], times)
+
+    columns = decode_track(row)
+    points = list(iter_points(columns))
+
+    assert columns.point_count == 3
+    assert points[0] == (47.5, 8.7, 400.0, times[0].timestamp())
+    assert points[1][2] is None
+    assert points[2][3] == times[2].timestamp()
+
+
+def test_missing_columns_are_stored_as_null():
+    row = encode_track([47.5, 47.6], [8.7, 8.8], [None, None], [None, None])
+    assert row["elevation"] is None
+    assert row["time"] is None
+
+    arrays = as_arrays(decode_track(row))
+    assert list(arrays["lat"]) == [47.5, 47.6]
+    assert arrays["elevation"] is None
+    assert list(iter_points(decode_track(row)))[1] == (47.6, 8.8, None, None)
+
+
+def test_track_from_gpx_collects_all_segments():
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack()
+    gpx.tracks.append(track)
+    for offset in (0, 1):
+        segment = gpxpy.gpx.GPXTrackSegment()
+        segment.points.append(gpxpy.gpx.GPXTrackPoint(47.0 + offset, 8.0, elevation=500.0))
+        track.segments.append(segment)
+
+    columns = decode_track(track_from_gpx(gpx))
+    assert [point[0] for point in iter_points(columns)] == [47.0, 48.0]
+    assert columns.segments == ((0, 0), (1, 0))
+
+
+def test_single_segment_is_stored_without_segments():
+    row = encode_track([47.5, 47.6], [8.7, 8.8], [None, None], [None, None], segments=[(0, 0)])
+    assert row["segments"] is None
+    assert [len(points) for _, points in iter_segments(decode_track(row))] == [2]
+
+
+def test_segments_round_trip_to_identical_metrics():
+    # Two segments of one track and a second track, with a long pause and a gap between them
+    start = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+    gpx = gpxpy.gpx.GPX()
+    for track_segments in ((0, 1), (2,)):
+        track = gpxpy.gpx.GPXTrack()
+        gpx.tracks.append(track)
+        for number in track_segments:
+            segment = gpxpy.gpx.GPXTrackSegment()
+            for i in range(20):
+                segment.points.append(gpxpy.gpx.GPXTrackPoint(
+                    47.0 + number * 0.05 + i * 0.0005, 8.0 + number * 0.05, elevation=500.0 + number * 80 + i,
+                    time=start + timedelta(hours=number * 2, seconds=i * 20)))
+            track.segments.append(segment)
+
+    rebuilt = _gpx_from_track(decode_track(track_from_gpx(gpx)))
+
+    assert [len(track.segments) for track in rebuilt.tracks] == [2, 1]
+    assert derive_metrics(rebuilt, "Velotour") == derive_metrics(gpx, "Velotour")
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile as StarletteUploadFile
+
+from utils.uploads import UploadSizeLimitMiddleware, UploadTooLargeError, check_file_size
+
+
+def make_client(max_bytes):
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload"], max_bytes=max_bytes)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": check_file_size(file), "start": file.file.read(5).decode()}
+
+    @app.post("/other")
+    async def other(file: UploadFile = File(...)):
+        return {"size": check_file_size(file)}
+
+    return TestClient(app)
+
+
+def test_upload_below_the_limit_is_handed_to_the_handler():
+    response = make_client(4096).post("/upload", files={"file": ("tour.gpx", b"<gpx/>" * 10)})
+    assert response.status_code == 200
+    assert response.json() == {"size": 60, "start": "<gpx/"}
+
+
+def test_request_above_the_limit_is_rejected_by_content_length():
+    client = make_client(1024)
+    response = client.post("/upload", files={"file": ("tour.gpx", b"x" * 4096)})
+    assert response.status_code == 413
+    # Other routes are not limited
+    assert client.post("/other", files={"file": ("tour.gpx", b"x" * 4096)}).status_code == 200
+
+
+def test_streamed_body_is_cut_off_at_the_limit():
+    def chunks():
+        yield b"--boundary\r\nContent-Disposition: form-data; name=\"file\"; filename=\"t.gpx\"\r\n\r\n"
+        for _ in range(10):
+            yield b"x" * 512
+
+    # A generator body is sent chunked, without Content-Length
+    response = make_client(2048).post("/upload", content=chunks(),
+                                      headers={"Content-Type": "multipart/form-data; boundary=boundary"})
+    assert response.status_code == 413
+
+
+def test_file_size_limit_is_checked_on_the_parsed_file():
+    upload = StarletteUploadFile(file=io.BytesIO(b"x" * 2048), filename="tour.gpx")
+    with pytest.raises(UploadTooLargeError):
+        check_file_size(upload, max_file_size=1024)
+    assert check_file_size(upload, max_file_size=4096) == 2048
+    assert upload.file.tell() == 0
@@ -0,0 +1,36 @@
+import time
+
+from utils.user_cache import UserCache
+
+
+def test_hits_misses_and_invalidation():
+    cache = UserCache(max_size=10, ttl=60)
+    assert cache.get("anna") is None
+    cache.put("anna", "user-anna")
+    assert cache.get("anna") == "user-anna"
+
+    cache.invalidate("anna")
+    assert cache.get("anna") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_expire(monkeypatch):
+    cache = UserCache(max_size=10, ttl=30)
+    cache.put("anna", "user-anna")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 31)
+    assert cache.get("anna") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = UserCache(max_size=2, ttl=60)
+    cache.put("anna", 1)
+    cache.put("ben", 2)
+    cache.get("anna")
+    cache.put("carla", 3)
+
+    assert cache.get("ben") is None
+    assert cache.get("anna") == 1
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models.users import User, UserRole, UserStatus
+from routers.users import get_users_page
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    start = datetime(2024, 1, 1)
+    for i in range(7):
+        session.add(User(
+            username=f"user{i}", email=f"user{i}@example.com", hashed_password="x",
+            role=UserRole.ADMIN if i == 0 else UserRole.USER,
+            status=UserStatus.PENDING if i % 2 else UserStatus.ACTIVE,
+            email_verified=i < 3,
+            # user5 and user6 registered at the same time
+            created_at=start + timedelta(days=min(i, 5)),
+        ))
+    session.add(User(username="under_score", email="u@example.com", hashed_password="x",
+                     status=UserStatus.ACTIVE, created_at=start))
+    session.commit()
+    yield session
+    session.close()
+
+
+def usernames(page):
+    return [user.username for user in page["items"]]
+
+
+def test_pages_are_ordered_newest_first_with_total(db):
+    first = get_users_page(db, limit=3)
+    assert usernames(first) == ["user6", "user5", "user4"]
+    assert first["total"] == 8
+
+    second = get_users_page(db, cursor=first["next_cursor"], limit=3)
+    assert usernames(second) == ["user3", "user2", "user1"]
+    last = get_users_page(db, cursor=second["next_cursor"], limit=3)
+    assert usernames(last) == ["user0", "under_score"]
+    assert last["next_cursor"] is None
+    assert last["total"] == 8
+
+
+def test_filters_and_prefix_search(db):
+    pending = get_users_page(db, status_filter=UserStatus.PENDING)
+    assert usernames(pending) == ["user5", "user3", "user1"]
+    assert pending["total"] == 3
+
+    assert usernames(get_users_page(db, role=UserRole.ADMIN)) == ["user0"]
+    assert get_users_page(db, email_verified=True)["total"] == 3
+    assert usernames(get_users_page(db, search="user1")) == ["user1"]
+    # '_' is matched literally, not as a LIKE wildcard
+    assert usernames(get_users_page(db, search="under_")) == ["under_score"]
+    assert get_users_page(db, search="user_")["total"] == 0
+
+
+def test_invalid_cursor_is_rejected(db):
+    with pytest.raises(HTTPException) as error:
+        get_users_page(db, cursor="not-a-cursor")
+    assert error.value.status_code == 400
+
+
+def all_pages(db, **filters):
+    pages, cursor = [], None
+    while True:
+        page = get_users_page(db, cursor=cursor, limit=3, **filters)
+        pages.append(usernames(page))
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages, page["total"]
+
+
+def test_users_without_created_at_are_paged_last(db):
+    for name in ("nodate_a", "nodate_b"):
+        db.add(User(username=name, email=f"{name}@example.com", hashed_password="x", status=UserStatus.ACTIVE))
+    db.flush()
+    db.query(User).filter(User.username.like("nodate%")).update({"created_at": None}, synchronize_session=False)
+    db.commit()
+
+    pages, total = all_pages(db)
+    # The third page ends with a user without created_at, the cursor continues after it
+    assert pages[2:] == [["user0", "under_score", "nodate_b"], ["nodate_a"]]
+    assert total == 10
+
+    pages, total = all_pages(db, status_filter=UserStatus.ACTIVE)
+    assert pages == [["user6", "user4", "user2"], ["user0", "under_score", "nodate_b"], ["nodate_a"]]
+    assert total == 7
@@ -0,0 +1,205 @@
+"""
+Buffered writer for user activity events (audit trail) and last_login.
+
+Request handlers call activity_recorder.record(...), which only appends the
+event to an in-memory queue. A background thread writes the queued events to
+user_activities and the newest login time per user to users.last_login, in
+one transaction per batch, every ACTIVITY_FLUSH_INTERVAL_SECONDS or as soon as
+ACTIVITY_BATCH_SIZE events are waiting. Logins therefore no longer wait for a
+commit of their own.
+
+The same thread rolls the log up and prunes old events every
+ACTIVITY_MAINTENANCE_INTERVAL_SECONDS, see utils/activity_retention.py.
+
+Events still queued when the process exits are written by an atexit hook.
+If the queue grows beyond ACTIVITY_QUEUE_MAX (e.g. the database is locked for
+a long time), new events are dropped and counted instead of growing memory.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import bindparam, or_, update
+
+from models.activity import UserActivity
+from models.users import User
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two flushes
+ACTIVITY_FLUSH_INTERVAL_SECONDS = float(os.getenv("ACTIVITY_FLUSH_INTERVAL_SECONDS", "2"))
+# Number of waiting events that triggers a flush before the interval is over
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", "500"))
+# Maximum number of waiting events, further events are dropped
+ACTIVITY_QUEUE_MAX = int(os.getenv("ACTIVITY_QUEUE_MAX", "50000"))
+# Seconds between two rollup/retention runs, 0 disables them (e.g. when run by cron)
+ACTIVITY_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("ACTIVITY_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+
+# Actions written by the API
+LOGIN = "LOGIN"
+LOGIN_FAILED = "LOGIN_FAILED"
+REGISTER = "REGISTER"
+UPLOAD = "UPLOAD"
+PASSWORD_CHANGE = "PASSWORD_CHANGE"
+PASSWORD_RESET = "PASSWORD_RESET"
+EMAIL_VERIFIED = "EMAIL_VERIFIED"
+STATUS_CHANGE = "STATUS_CHANGE"
+USER_DELETE = "USER_DELETE"
+
+_UPDATE_LAST_LOGIN = (
+    update(User.__table__)
+    .where(User.__table__.c.username == bindparam("b_username"))
+    .where(or_(User.__table__.c.last_login.is_(None), User.__table__.c.last_login < bindparam("b_last_login")))
+    .values(last_login=bindparam("b_last_login"))
+)
+
+
+class ActivityRecorder:
+    """
+    Queues activity events and writes them in batches from a background thread.
+
+    Args:
+        engine: SQLAlchemy engine of the user database
+        flush_interval (float): Seconds between two flushes
+        batch_size (int): Waiting events that trigger an early flush
+        max_queue (int): Maximum number of waiting events
+        maintenance_interval (float): Seconds between two rollup/retention runs, 0 disables them
+    """
+
+    def __init__(self, engine, flush_interval: float = ACTIVITY_FLUSH_INTERVAL_SECONDS,
+                 batch_size: int = ACTIVITY_BATCH_SIZE, max_queue: int = ACTIVITY_QUEUE_MAX,
+                 maintenance_interval: float = ACTIVITY_MAINTENANCE_INTERVAL_SECONDS):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.maintenance_interval = maintenance_interval
+        self._next_maintenance = time.monotonic() + maintenance_interval
+        self.last_maintenance = None
+        self._events = deque()
+        # username -> newest login time, several logins of a user become one update
+        self._logins = {}
+        self._lock = threading.Lock()
+        # Serializes flushes of the background thread and explicit flush() calls
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def record(self, username: str, action: str, details: dict = None):
+        """Queues an event; never blocks on the database."""
+        now = datetime.utcnow()
+        with self._lock:
+            if len(self._events) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._events.append({
+                "id": uuid.uuid4().hex,
+                "user_id": username,
+                "action": action,
+                "timestamp": now,
+                "details": details,
+            })
+            if action == LOGIN:
+                self._logins[username] = now
+            pending = len(self._events)
+        self._ensure_thread()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Writes all queued events now; returns the number of events written."""
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._events)
+                self._events.clear()
+                logins = self._logins
+                self._logins = {}
+            if not events:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(UserActivity.__table__.insert(), events)
+                    if logins:
+                        connection.execute(_UPDATE_LAST_LOGIN, [
+                            {"b_username": username, "b_last_login": login_time}
+                            for username, login_time in logins.items()
+                        ])
+            except Exception as e:
+                # Keep the events for the next attempt, in their original order
+                with self._lock:
+                    self._events.extendleft(reversed(events))
+                    for username, login_time in logins.items():
+                        if self._logins.get(username, login_time) <= login_time:
+                            self._logins[username] = login_time
+                    self.failed_flushes += 1
+                logger.error(f"Writing {len(events)} activity events failed: {str(e)}")
+                return 0
+
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.written += len(events)
+                self.flushes += 1
+            return len(events)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="activity-recorder", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self.maintenance_interval and time.monotonic() >= self._next_maintenance:
+                self._next_maintenance = time.monotonic() + self.maintenance_interval
+                self.run_maintenance()
+
+    def run_maintenance(self):
+        """Writes queued events, then rolls up and prunes the activity log."""
+        from utils.activity_retention import run_maintenance
+
+        self.flush()
+        try:
+            self.last_maintenance = {"finished_at": datetime.utcnow().isoformat(), **run_maintenance(self.engine)}
+        except Exception as e:
+            logger.error(f"Activity maintenance failed: {str(e)}")
+        return self.last_maintenance
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": len(self._events),
+                "written": self.written,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+                "last_maintenance": self.last_maintenance,
+            }
+
+
+def _create_recorder():
+    from database import engine
+
+    recorder = ActivityRecorder(engine)
+    atexit.register(recorder.flush)
+    return recorder
+
+
+activity_recorder = _create_recorder()
@@ -0,0 +1,197 @@
+"""
+Rollup and retention of the user activity log.
+
+user_activities receives one row per event (see utils/activity.py) and would
+grow without bound. The maintenance job
+
+1. rolls the raw events up into user_activity_daily (count per day, user and
+   action). The days from the rollup start on are aggregated again: the
+   newest day already in the summary minus ACTIVITY_ROLLUP_GRACE_DAYS and the
+   writer's flush interval, because other worker processes buffer their
+   events and may write a day's events after it was summarized here. A day's
+   count is recomputed from its raw rows, so running the rollup twice does
+   not count anything twice.
+2. deletes raw events older than ACTIVITY_RETENTION_DAYS in batches of
+   ACTIVITY_PRUNE_BATCH_SIZE rows, each batch in its own short transaction so
+   the activity writer and logins are not blocked by one long delete. Only
+   days before the rollup start are deleted, the days that are recomputed
+   keep all their raw rows.
+3. deletes SENT and FAILED emails older than MAIL_OUTBOX_RETENTION_DAYS from
+   the outbox (see utils/email_outbox.py).
+
+Reports over longer periods are served from user_activity_daily.
+
+Run it with `python -m utils.activity_retention`; the activity writer of every
+worker process also runs it every ACTIVITY_MAINTENANCE_INTERVAL_SECONDS. A
+lease in maintenance_locks (see utils/maintenance_lock.py) lets only one
+process at a time do the work.
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from utils.activity import ACTIVITY_FLUSH_INTERVAL_SECONDS
+from utils.maintenance_lock import maintenance_lock
+
+logger = logging.getLogger(__name__)
+
+# Days for which raw events are kept
+ACTIVITY_RETENTION_DAYS = int(os.getenv("ACTIVITY_RETENTION_DAYS", "90"))
+# Raw events deleted per transaction
+ACTIVITY_PRUNE_BATCH_SIZE = int(os.getenv("ACTIVITY_PRUNE_BATCH_SIZE", "1000"))
+# Days before the newest summarized day that are rolled up again, for events written late by other workers
+ACTIVITY_ROLLUP_GRACE_DAYS = max(int(os.getenv("ACTIVITY_ROLLUP_GRACE_DAYS", "1")), 1)
+
+# Deleted users are counted under '' (user_id is part of the primary key)
+ROLLUP_SQL = """
+    INSERT INTO user_activity_daily (day, user_id, action, count)
+    SELECT date(timestamp), COALESCE(user_id, ''), action, COUNT(*)
+    FROM user_activities
+    WHERE timestamp >= :start
+    GROUP BY date(timestamp), COALESCE(user_id, ''), action
+    ON CONFLICT (day, user_id, action) DO UPDATE SET count = excluded.count
+"""
+
+PRUNE_BATCH_SQL = """
+    DELETE FROM user_activities WHERE rowid IN (
+        SELECT rowid FROM user_activities WHERE timestamp < :cutoff LIMIT :batch_size
+    )
+"""
+
+
+def _rollup_start(connection):
+    """First day the rollup recomputes, None if nothing is summarized yet."""
+    day = connection.execute(text("SELECT MAX(day) FROM user_activity_daily")).scalar()
+    if not day:
+        return None
+    # The newest summarized days may have received events since the last run
+    start = datetime.combine(date.fromisoformat(day), datetime.min.time()) \
+        - timedelta(days=ACTIVITY_ROLLUP_GRACE_DAYS, seconds=ACTIVITY_FLUSH_INTERVAL_SECONDS)
+    return start.date()
+
+
+def rollup_activities(engine) -> int:
+    """
+    Aggregates new raw events into user_activity_daily.
+
+    Returns:
+        int: Number of (day, user, action) rows inserted or updated
+    """
+    with engine.begin() as connection:
+        start = _rollup_start(connection)
+        return connection.execute(text(ROLLUP_SQL), {"start": start.isoformat() if start else ""}).rowcount
+
+
+def prune_activities(engine, retention_days: int = ACTIVITY_RETENTION_DAYS,
+                     batch_size: int = ACTIVITY_PRUNE_BATCH_SIZE, pause: float = 0.0) -> int:
+    """
+    Deletes raw events older than the retention period in batches.
+
+    Args:
+        engine: SQLAlchemy engine of the user database
+        retention_days (int): Days of raw events to keep (counted from midnight UTC)
+        batch_size (int): Rows deleted per transaction
+        pause (float): Seconds to sleep between two batches
+
+    Returns:
+        int: Number of deleted events
+    """
+    cutoff = datetime.utcnow().date() - timedelta(days=retention_days)
+    with engine.connect() as connection:
+        rollup_start = _rollup_start(connection)
+    if rollup_start is None:
+        return 0
+    # Never delete days the rollup recomputes, their counts come from the raw rows
+    cutoff = min(cutoff, rollup_start)
+    cutoff = datetime.combine(cutoff, datetime.min.time()).isoformat(sep=" ")
+
+    deleted = 0
+    while True:
+        with engine.begin() as connection:
+            count = connection.execute(text(PRUNE_BATCH_SQL), {"cutoff": cutoff, "batch_size": batch_size}).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def run_maintenance(engine, retention_days: int = ACTIVITY_RETENTION_DAYS,
+                    batch_size: int = ACTIVITY_PRUNE_BATCH_SIZE, pause: float = 0.0) -> dict:
+    """
+    Rolls up and prunes the activity log and prunes the email outbox unless
+    another process does; returns what was done.
+    """
+    from utils.email_outbox import prune_outbox
+
+    started = time.perf_counter()
+    with maintenance_lock(engine, "maintenance") as acquired:
+        if not acquired:
+            return {"rolled_up": 0, "pruned": 0, "outbox_pruned": 0, "skipped": True}
+        rolled_up = rollup_activities(engine)
+        pruned = prune_activities(engine, retention_days, batch_size, pause)
+        outbox_pruned = prune_outbox(engine)
+    duration_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Activity maintenance: {rolled_up} summary rows updated, {pruned} events pruned, "
+                f"{outbox_pruned} outbox emails deleted in {duration_ms:.0f} ms")
+    return {"rolled_up": rolled_up, "pruned": pruned, "outbox_pruned": outbox_pruned,
+            "duration_ms": round(duration_ms, 2)}
+
+
+def get_activity_summary(db, days: int = 30, username: str = None, action: str = None) -> list:
+    """
+    Reads daily activity counts from the summary table, newest day first.
+
+    Args:
+        db: SQLAlchemy session
+        days (int): Number of days back from today
+        username (str): Only this user
+        action (str): Only this action
+
+    Returns:
+        list: Dicts with day, user_id, action and count
+    """
+    conditions = ["day >= :since"]
+    params = {"since": (datetime.utcnow().date() - timedelta(days=days)).isoformat()}
+    if username is not None:
+        conditions.append("user_id = :username")
+        params["username"] = username
+    if action is not None:
+        conditions.append("action = :action")
+        params["action"] = action
+    rows = db.execute(text(f"""
+        SELECT day, user_id, action, count FROM user_activity_daily
+        WHERE {' AND '.join(conditions)}
+        ORDER BY day DESC, user_id, action
+    """), params)
+    return [dict(row._mapping) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll up and prune the user activity log and the email outbox")
+    parser.add_argument("--retention-days", type=int, default=ACTIVITY_RETENTION_DAYS,
+                        help="Days of raw events to keep")
+    parser.add_argument("--batch-size", type=int, default=ACTIVITY_PRUNE_BATCH_SIZE,
+                        help="Raw events deleted per transaction")
+    parser.add_argument("--pause", type=float, default=0.05,
+                        help="Seconds between two delete batches")
+    args = parser.parse_args()
+
+    from database import engine
+    from models.activity import UserActivityDaily
+    from models.locks import MaintenanceLock
+    from models.outbox import OutboxEmail
+
+    logging.basicConfig(level=logging.INFO)
+    UserActivityDaily.__table__.create(bind=engine, checkfirst=True)
+    MaintenanceLock.__table__.create(bind=engine, checkfirst=True)
+    OutboxEmail.__table__.create(bind=engine, checkfirst=True)
+    print(run_maintenance(engine, args.retention_days, args.batch_size, args.pause))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,6 @@ from models.users import UserRole, User as UserModel
 import logging
 import os
 import asyncio
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 
 logger = logging.getLogger(__name__)
 
@@ -107,27 +106,10 @@ async def test_email_configuration(recipient_email: str = None):
         logger.info(f"No recipient specified, using sender address: {recipient_email}")
     
     try:
-        # Create mail configuration
-        conf = ConnectionConfig(
-            MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
-            MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-            MAIL_FROM=os.getenv("MAIL_FROM"),
-            MAIL_PORT=int(os.getenv("MAIL_PORT", "587")),
-            MAIL_SERVER=os.getenv("MAIL_SERVER"),
-            MAIL_STARTTLS=os.getenv("MAIL_STARTTLS", "True").lower() == "true",
-            MAIL_SSL_TLS=os.getenv("MAIL_SSL_TLS", "False").lower() == "true",
-            USE_CREDENTIALS=os.getenv("USE_CREDENTIALS", "True").lower() == "true"
-        )
-        
-        # Create FastMail client
-        logger.info(f"Initializing FastMail with server {os.getenv('MAIL_SERVER')}:{os.getenv('MAIL_PORT', '587')}")
-        fastmail = FastMail(conf)
-        
-        # Create message
-        message = MessageSchema(
-            subject="Test Email from Tour Manager",
-            recipients=[recipient_email],
-            body=f"""
+        from utils.email_outbox import send_email_now
+
+        subject = "Test Email from Tour Manager"
+        body = f"""
             <html>
                 <body>
                     <h1>Email Configuration Test</h1>
@@ -142,13 +124,11 @@ async def test_email_configuration(recipient_email: str = None):
                     <p>You can now use these settings for your application.</p>
                 </body>
             </html>
-            """,
-            subtype="html"
-        )
+            """
         
-        # Send test email
-        logger.info(f"Sending test email to {recipient_email}...")
-        await fastmail.send_message(message)
+        # Send the test email directly, not through the outbox: the caller wants the server's answer
+        logger.info(f"Sending test email to {recipient_email} via {os.getenv('MAIL_SERVER')}:{os.getenv('MAIL_PORT', '587')}...")
+        await asyncio.to_thread(send_email_now, recipient_email, subject, body)
         
         success_msg = f"Test email sent successfully to {recipient_email}"
         logger.info(success_msg)
@@ -1,80 +1,19 @@
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 import os
 from typing import List
 import jwt
 from datetime import datetime, timedelta
 from auth import SECRET_KEY, ALGORITHM
+from utils.email_outbox import email_sender, enqueue_email
 
-# Email configuration
-def get_mail_config() -> ConnectionConfig:
-    from utils.logger import get_logger
-    logger = get_logger(__name__)
-    
-    logger.info("==== INITIALIZING EMAIL CONFIGURATION ====")
-    
-    required_settings = ["MAIL_USERNAME", "MAIL_PASSWORD", "MAIL_FROM"]
-    missing_settings = [setting for setting in required_settings if not os.getenv(setting)]
-    
-    # Log environment variables (safely)
-    logger.info("Email environment variables:")
-    logger.info(f"  - MAIL_USERNAME: {'✓ Set' if os.getenv('MAIL_USERNAME') else '✗ Missing'}")
-    logger.info(f"  - MAIL_PASSWORD: {'✓ Set (hidden)' if os.getenv('MAIL_PASSWORD') else '✗ Missing'}")
-    logger.info(f"  - MAIL_FROM: {os.getenv('MAIL_FROM') or '✗ Missing'}")
-    logger.info(f"  - MAIL_PORT: {os.getenv('MAIL_PORT', '587 (default)')}")
-    logger.info(f"  - MAIL_SERVER: {os.getenv('MAIL_SERVER', 'smtp.gmail.com (default)')}")
-    logger.info(f"  - MAIL_STARTTLS: {os.getenv('MAIL_STARTTLS', 'True')}")
-    logger.info(f"  - MAIL_SSL_TLS: {os.getenv('MAIL_SSL_TLS', 'False')}")
-    logger.info(f"  - USE_CREDENTIALS: {os.getenv('USE_CREDENTIALS', 'True')}")
-    logger.info(f"  - FRONTEND_URL: {os.getenv('FRONTEND_URL', 'http://localhost:3000 (default)')}")
-    
-    if missing_settings:
-        logger.warning(f"Missing required email settings: {', '.join(missing_settings)}")
-        logger.warning("Email functionality will be disabled")
-        logger.info("==== EMAIL CONFIGURATION FAILED ====")
-        return None
-    
-    try:
-        # Convert string values to boolean for TLS settings
-        mail_starttls = os.getenv("MAIL_STARTTLS", "True").lower() in ['true', '1', 'yes', 'y']
-        mail_ssl_tls = os.getenv("MAIL_SSL_TLS", "False").lower() in ['true', '1', 'yes', 'y']
-        use_credentials = os.getenv("USE_CREDENTIALS", "True").lower() in ['true', '1', 'yes', 'y']
-        
-        config = ConnectionConfig(
-            MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
-            MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-            MAIL_FROM=os.getenv("MAIL_FROM"),
-            MAIL_PORT=int(os.getenv("MAIL_PORT", "587")),
-            MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
-            MAIL_STARTTLS=mail_starttls,
-            MAIL_SSL_TLS=mail_ssl_tls,
-            USE_CREDENTIALS=use_credentials
-        )
-        logger.info("Email configuration successfully created")
-        logger.info("==== EMAIL CONFIGURATION COMPLETED ====")
-        return config
-    except Exception as e:
-        logger.error(f"Failed to create email configuration: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.info("==== EMAIL CONFIGURATION FAILED ====")
-        return None
-
-# Initialize email client with detailed logging
+# Emails are not sent here but stored in the outbox (utils/email_outbox.py);
+# a background thread sends them, so requests never wait for the mail server.
 from utils.logger import get_logger
 logger = get_logger(__name__)
 
-try:
-    logger.info("Initializing FastMail client...")
-    conf = get_mail_config()
-    fastmail = FastMail(conf) if conf else None
-    
-    if fastmail:
-        logger.info("FastMail client initialized successfully")
-    else:
-        logger.warning("FastMail client not initialized (no configuration)")
-except Exception as e:
-    logger.error(f"Failed to initialize FastMail client: {str(e)}")
-    logger.error(f"Error type: {type(e).__name__}")
-    fastmail = None
+if email_sender.configured:
+    logger.info(f"Email outbox enabled, SMTP server {email_sender.settings['host']}:{email_sender.settings['port']}")
+else:
+    logger.warning("Missing email settings (MAIL_FROM, MAIL_USERNAME, MAIL_PASSWORD), email functionality will be disabled")
 
 def create_verification_token(email: str) -> str:
     expire = datetime.utcnow() + timedelta(hours=24)
@@ -99,42 +38,48 @@ def verify_token(token: str) -> str:
     except:
         return None
 
+def _queue_email(email: str, subject: str, body: str, kind: str, link_name: str, link: str):
+    """Stores a message in the outbox; without email configuration only the link is logged."""
+    if not email_sender.configured:
+        logger.warning(f"Email not configured. {kind} email cannot be sent to {email}")
+        logger.info(f"{link_name} for {email}: {link}")
+        return
+
+    try:
+        outbox_id = enqueue_email(email, subject, body)
+        logger.info(f"{kind} email to {email} queued (outbox id {outbox_id})")
+        return {
+            "success": True,
+            "queued": True,
+            "email": email,
+            "outbox_id": outbox_id,
+        }
+    except Exception as e:
+        logger.error(f"Failed to queue {kind.lower()} email to {email}: {str(e)}")
+        logger.info(f"{link_name}: {link}")
+        return {
+            "success": False,
+            "email": email,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }
+
 async def send_verification_email(email: str, token: str):
-    from utils.logger import get_logger
-    logger = get_logger(__name__)
-    
-    # Detailed parameter logging
-    logger.info("==== EMAIL VERIFICATION REQUESTED ====")
-    logger.info(f"Parameters received:")
-    logger.info(f"  - Email: {email}")
-    logger.info(f"  - Token length: {len(token)} chars")
-    logger.info(f"  - Token first 10 chars: {token[:10]}...")
-    
-    # Log environment variables used
+    """
+    Queue the email verification message.
+
+    Args:
+        email (str): The recipient's email address
+        token (str): Verification token for the link
+    """
     frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
-    logger.info(f"Email configuration:")
-    logger.info(f"  - FRONTEND_URL: {frontend_url}")
-    logger.info(f"  - MAIL_SERVER: {os.getenv('MAIL_SERVER', 'Not configured')}")
-    logger.info(f"  - MAIL_PORT: {os.getenv('MAIL_PORT', 'Not configured')}")
-    logger.info(f"  - MAIL_FROM: {os.getenv('MAIL_FROM', 'Not configured')}")
-    logger.info(f"  - MAIL_USERNAME: {os.getenv('MAIL_USERNAME', 'Not configured')}")
-    
     verify_url = f"{frontend_url}/verify-email?token={token}"
-    logger.info(f"Created verification URL: {verify_url}")
-    
-    if not fastmail:
-        logger.warning(f"Email not configured. Verification email cannot be sent to {email}")
-        logger.info(f"Verification URL for {email}: {verify_url}")
-        logger.info("==== EMAIL VERIFICATION SKIPPED (No configuration) ====")
-        return
-    
-    logger.info(f"Preparing verification email for {email}")
-    
-    # Create message
-    message = MessageSchema(
-        subject="Verify your email",
-        recipients=[email],
-        body=f"""
+    logger.info(f"Verification email requested for {email}")
+
+    return _queue_email(
+        email,
+        "Verify your email",
+        f"""
         <html>
             <body>
                 <h1>Verify your email address</h1>
@@ -145,78 +90,25 @@ async def send_verification_email(email: str, token: str):
             </body>
         </html>
         """,
-        subtype="html"
+        "Verification", "Verification URL", verify_url
     )
-    
-    # Log message details
-    logger.info(f"Email content prepared:")
-    logger.info(f"  - Subject: {message.subject}")
-    logger.info(f"  - Recipients: {message.recipients}")
-    logger.info(f"  - Verify URL: {verify_url}")
-    
-    try:
-        logger.info(f"Attempting to send verification email to {email}...")
-        start_time = datetime.utcnow()
-        
-        await fastmail.send_message(message)
-        
-        end_time = datetime.utcnow()
-        duration = (end_time - start_time).total_seconds()
-        logger.info(f"Email sent successfully to {email} (took {duration:.2f}s)")
-        logger.info("==== EMAIL VERIFICATION COMPLETED SUCCESSFULLY ====")
-        
-        return {
-            "success": True,
-            "email": email,
-            "verify_url": verify_url,
-            "duration_seconds": duration
-        }
-    except Exception as e:
-        logger.error(f"Failed to send verification email to {email}: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.error(f"Error details: {str(e)}")
-        
-        # In development, print the verification URL to console
-        logger.info(f"Verification URL: {verify_url}")
-        logger.info("==== EMAIL VERIFICATION FAILED ====")
-        
-        return {
-            "success": False,
-            "email": email,
-            "verify_url": verify_url,
-            "error": str(e),
-            "error_type": type(e).__name__
-        }
 
 async def send_password_reset_email(email: str, token: str):
-    from utils.logger import get_logger
-    logger = get_logger(__name__)
-    
-    # Detailed parameter logging
-    logger.info("==== PASSWORD RESET EMAIL REQUESTED ====")
-    logger.info(f"Parameters received:")
-    logger.info(f"  - Email: {email}")
-    logger.info(f"  - Token length: {len(token)} chars")
-    logger.info(f"  - Token first 10 chars: {token[:10]}...")
-    
-    # Log environment variables used
+    """
+    Queue the password reset message.
+
+    Args:
+        email (str): The recipient's email address
+        token (str): Reset token for the link
+    """
     frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
-    logger.info(f"Email configuration:")
-    logger.info(f"  - FRONTEND_URL: {frontend_url}")
-    
     reset_url = f"{frontend_url}/reset-password?token={token}"
-    
-    if not fastmail:
-        logger.warning(f"Email not configured. Password reset email cannot be sent to {email}")
-        logger.info(f"Password reset URL for {email}: {reset_url}")
-        logger.info("==== PASSWORD RESET EMAIL SKIPPED (No configuration) ====")
-        return
-        
-    # Create message
-    message = MessageSchema(
-        subject="Reset your password",
-        recipients=[email],
-        body=f"""
+    logger.info(f"Password reset email requested for {email}")
+
+    return _queue_email(
+        email,
+        "Reset your password",
+        f"""
         <html>
             <body>
                 <h1>Reset your password</h1>
@@ -227,81 +119,24 @@ async def send_password_reset_email(email: str, token: str):
             </body>
         </html>
         """,
-        subtype="html"
+        "Password reset", "Password reset URL", reset_url
     )
-    
-    # Log message details
-    logger.info(f"Email content prepared:")
-    logger.info(f"  - Subject: {message.subject}")
-    logger.info(f"  - Recipients: {message.recipients}")
-    logger.info(f"  - Reset URL: {reset_url}")
-    
-    try:
-        logger.info(f"Attempting to send password reset email to {email}...")
-        start_time = datetime.utcnow()
-        
-        await fastmail.send_message(message)
-        
-        end_time = datetime.utcnow()
-        duration = (end_time - start_time).total_seconds()
-        logger.info(f"Password reset email sent successfully to {email} (took {duration:.2f}s)")
-        logger.info("==== PASSWORD RESET EMAIL COMPLETED SUCCESSFULLY ====")
-        
-        return {
-            "success": True,
-            "email": email,
-            "reset_url": reset_url,
-            "duration_seconds": duration
-        }
-    except Exception as e:
-        logger.error(f"Failed to send password reset email to {email}: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.error(f"Error details: {str(e)}")
-        
-        # In development, print the reset URL to console
-        logger.info(f"Reset URL: {reset_url}")
-        logger.info("==== PASSWORD RESET EMAIL FAILED ====")
-        
-        return {
-            "success": False,
-            "email": email,
-            "reset_url": reset_url,
-            "error": str(e),
-            "error_type": type(e).__name__
-        }
 
 async def send_account_approved_email(email: str):
     """
-    Send an email to notify the user that their account has been approved by an admin.
+    Queue an email to notify the user that their account has been approved by an admin.
     
     Args:
         email (str): The recipient's email address
     """
-    from utils.logger import get_logger
-    logger = get_logger(__name__)
-    
-    # Detailed parameter logging
-    logger.info("==== ACCOUNT APPROVAL EMAIL REQUESTED ====")
-    logger.info(f"Parameters received:")
-    logger.info(f"  - Email: {email}")
-    
-    # Log environment variables used
     frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
-    logger.info(f"Email configuration:")
-    logger.info(f"  - FRONTEND_URL: {frontend_url}")
-    
-    if not fastmail:
-        logger.warning(f"Email not configured. Account approval notification for {email} could not be sent")
-        logger.info("==== ACCOUNT APPROVAL EMAIL SKIPPED (No configuration) ====")
-        return
-    
     login_url = f"{frontend_url}/login"
-    
-    # Create message
-    message = MessageSchema(
-        subject="Your Account Has Been Approved",
-        recipients=[email],
-        body=f"""
+    logger.info(f"Account approval email requested for {email}")
+
+    return _queue_email(
+        email,
+        "Your Account Has Been Approved",
+        f"""
         <html>
             <body>
                 <h1>Account Approved</h1>
@@ -311,45 +146,5 @@ async def send_account_approved_email(email: str):
             </body>
         </html>
         """,
-        subtype="html"
+        "Account approval", "Login URL", login_url
     )
-    
-    # Log message details
-    logger.info(f"Email content prepared:")
-    logger.info(f"  - Subject: {message.subject}")
-    logger.info(f"  - Recipients: {message.recipients}")
-    logger.info(f"  - Login URL: {login_url}")
-    
-    try:
-        logger.info(f"Attempting to send account approval email to {email}...")
-        start_time = datetime.utcnow()
-        
-        await fastmail.send_message(message)
-        
-        end_time = datetime.utcnow()
-        duration = (end_time - start_time).total_seconds()
-        logger.info(f"Account approval email sent successfully to {email} (took {duration:.2f}s)")
-        logger.info("==== ACCOUNT APPROVAL EMAIL COMPLETED SUCCESSFULLY ====")
-        
-        return {
-            "success": True,
-            "email": email,
-            "login_url": login_url,
-            "duration_seconds": duration
-        }
-    except Exception as e:
-        logger.error(f"Failed to send account approval notification to {email}: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.error(f"Error details: {str(e)}")
-        
-        # In development, print the message
-        logger.info(f"Account approval notification content would have been sent to {email}")
-        logger.info("==== ACCOUNT APPROVAL EMAIL FAILED ====")
-        
-        return {
-            "success": False,
-            "email": email,
-            "login_url": login_url,
-            "error": str(e),
-            "error_type": type(e).__name__
-        }
@@ -0,0 +1,433 @@
+"""
+Persistent email outbox with a background sender.
+
+Request handlers only insert the message into email_outbox (enqueue_email) and
+return; they never wait for the mail server. A background thread claims due
+messages in batches of MAIL_OUTBOX_BATCH_SIZE and sends them over one SMTP
+connection, which is kept open between batches for MAIL_SMTP_IDLE_SECONDS and
+reused for up to MAIL_SMTP_MAX_MESSAGES_PER_CONNECTION messages. This saves
+the TCP/TLS handshake and login per message.
+
+Delivery status is stored per message:
+- SENT after the server accepted the message
+- temporary errors (connection problems, 4xx replies) retry with exponential
+  backoff, MAIL_OUTBOX_BACKOFF_SECONDS * 2^(attempts-1) up to
+  MAIL_OUTBOX_BACKOFF_MAX_SECONDS
+- FAILED after MAIL_OUTBOX_MAX_ATTEMPTS attempts or a permanent 5xx rejection
+
+Bodies contain password reset and verification links. The body of a SENT
+message is therefore cleared (set to '', the column is NOT NULL), and SENT and
+FAILED messages are deleted after MAIL_OUTBOX_RETENTION_DAYS by the maintenance
+pass (prune_outbox, run with utils/activity_retention.run_maintenance).
+
+Messages are claimed with a claim_id, so several worker processes can run a
+sender against the same database. The status of every message is stored right
+after its attempt, together with a new claimed_at for the rest of the batch,
+so a batch that is still being sent (one slow SMTP reply after the other)
+never looks abandoned. A claim not refreshed for
+MAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS (the process died while sending) is released
+again; delivery is therefore at least once.
+
+SMTP settings are the same MAIL_* variables used before by fastapi-mail.
+"""
+import logging
+import os
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+from sqlalchemy import bindparam, case, delete, func, select, update
+
+from models.outbox import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# Messages claimed and sent per batch
+MAIL_OUTBOX_BATCH_SIZE = int(os.getenv("MAIL_OUTBOX_BATCH_SIZE", "50"))
+# Seconds between two polls when the sender is not woken by a new message
+MAIL_OUTBOX_POLL_SECONDS = float(os.getenv("MAIL_OUTBOX_POLL_SECONDS", "10"))
+# Attempts before a message is marked FAILED
+MAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+# Delay after the first failed attempt, doubled for every further attempt
+MAIL_OUTBOX_BACKOFF_SECONDS = float(os.getenv("MAIL_OUTBOX_BACKOFF_SECONDS", "30"))
+MAIL_OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("MAIL_OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+# Claims older than this are released (sender died while sending)
+MAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS = float(os.getenv("MAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS", "600"))
+# An idle SMTP connection is closed after this many seconds
+MAIL_SMTP_IDLE_SECONDS = float(os.getenv("MAIL_SMTP_IDLE_SECONDS", "30"))
+# Messages sent over one SMTP connection before it is reopened
+MAIL_SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("MAIL_SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+MAIL_SMTP_TIMEOUT_SECONDS = float(os.getenv("MAIL_SMTP_TIMEOUT_SECONDS", "30"))
+# Days SENT and FAILED messages are kept for diagnosis
+MAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("MAIL_OUTBOX_RETENTION_DAYS", "30"))
+
+PENDING = "PENDING"
+SENDING = "SENDING"
+SENT = "SENT"
+FAILED = "FAILED"
+
+_outbox = OutboxEmail.__table__
+
+_UPDATE_RESULT = (
+    update(_outbox)
+    .where(_outbox.c.id == bindparam("b_id"))
+    .values(
+        status=bindparam("b_status"),
+        attempts=bindparam("b_attempts"),
+        next_attempt_at=bindparam("b_next_attempt_at"),
+        last_error=bindparam("b_last_error"),
+        sent_at=bindparam("b_sent_at"),
+        # The links in a delivered body must not outlive the delivery
+        body=case((bindparam("b_status") == SENT, ""), else_=_outbox.c.body),
+        claim_id=None,
+        claimed_at=None,
+    )
+)
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ['true', '1', 'yes', 'y']
+
+
+def smtp_settings():
+    """
+    Reads the SMTP settings from the environment.
+
+    Returns:
+        dict: Connection settings, or None if email is not configured
+    """
+    sender = os.getenv("MAIL_FROM")
+    use_credentials = _env_flag("USE_CREDENTIALS", "True")
+    username = os.getenv("MAIL_USERNAME")
+    password = os.getenv("MAIL_PASSWORD")
+    if not sender or (use_credentials and not (username and password)):
+        return None
+    return {
+        "host": os.getenv("MAIL_SERVER", "smtp.gmail.com"),
+        "port": int(os.getenv("MAIL_PORT", "587")),
+        "starttls": _env_flag("MAIL_STARTTLS", "True"),
+        "ssl": _env_flag("MAIL_SSL_TLS", "False"),
+        "username": username if use_credentials else None,
+        "password": password if use_credentials else None,
+        "sender": sender,
+    }
+
+
+def backoff_delay(attempts: int, base: float = MAIL_OUTBOX_BACKOFF_SECONDS,
+                  maximum: float = MAIL_OUTBOX_BACKOFF_MAX_SECONDS) -> float:
+    """Seconds to wait before the next attempt after `attempts` failed attempts."""
+    return min(maximum, base * 2 ** max(0, attempts - 1))
+
+
+def _is_permanent(error: Exception) -> bool:
+    """A 5xx rejection of the recipient or the message; retrying won't help."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPDataError, smtplib.SMTPNotSupportedError)):
+        return getattr(error, "smtp_code", 0) >= 500
+    return False
+
+
+class EmailSender:
+    """
+    Sends the messages of the outbox table from a background thread.
+
+    Args:
+        engine: SQLAlchemy engine of the database holding email_outbox
+        settings (dict): SMTP settings, see smtp_settings()
+    """
+
+    def __init__(self, engine, settings: dict, batch_size: int = MAIL_OUTBOX_BATCH_SIZE,
+                 poll_interval: float = MAIL_OUTBOX_POLL_SECONDS, max_attempts: int = MAIL_OUTBOX_MAX_ATTEMPTS,
+                 backoff_seconds: float = MAIL_OUTBOX_BACKOFF_SECONDS,
+                 backoff_max_seconds: float = MAIL_OUTBOX_BACKOFF_MAX_SECONDS,
+                 max_messages_per_connection: int = MAIL_SMTP_MAX_MESSAGES_PER_CONNECTION,
+                 idle_seconds: float = MAIL_SMTP_IDLE_SECONDS):
+        self.engine = engine
+        self.settings = settings
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_seconds = idle_seconds
+        self._smtp = None
+        self._smtp_messages = 0
+        self._smtp_last_used = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.connections = 0
+        self.last_error = None
+
+    @property
+    def configured(self) -> bool:
+        return self.settings is not None
+
+    def start(self):
+        """Starts the background thread (once); does nothing without SMTP settings."""
+        if not self.configured or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Lets the background thread send new messages right away."""
+        self.start()
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                # A full batch means more messages may be due
+                while self.send_pending() == self.batch_size and not self._stopped.is_set():
+                    pass
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Email outbox sender failed: {str(e)}")
+            if self._smtp is not None and time.monotonic() - self._smtp_last_used > self.idle_seconds:
+                self._close()
+        self._close()
+
+    def _claim(self) -> list:
+        now = datetime.utcnow()
+        claim_id = uuid.uuid4().hex
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(_outbox)
+                .where(_outbox.c.status == SENDING)
+                .where(_outbox.c.claimed_at < now - timedelta(seconds=MAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS))
+                .values(status=PENDING, claim_id=None, claimed_at=None)
+            )
+            due = (
+                select(_outbox.c.id)
+                .where(_outbox.c.status == PENDING)
+                .where(_outbox.c.next_attempt_at <= now)
+                .order_by(_outbox.c.next_attempt_at, _outbox.c.id)
+                .limit(self.batch_size)
+            )
+            connection.execute(
+                update(_outbox)
+                .where(_outbox.c.id.in_(due))
+                .where(_outbox.c.status == PENDING)
+                .values(status=SENDING, claim_id=claim_id, claimed_at=now)
+            )
+            rows = connection.execute(
+                select(_outbox.c.id, _outbox.c.recipient, _outbox.c.subject, _outbox.c.body, _outbox.c.attempts,
+                       _outbox.c.claim_id)
+                .where(_outbox.c.claim_id == claim_id)
+                .order_by(_outbox.c.id)
+            )
+            return [dict(row._mapping) for row in rows]
+
+    def _connect(self):
+        settings = self.settings
+        if settings["ssl"]:
+            smtp = smtplib.SMTP_SSL(settings["host"], settings["port"], timeout=MAIL_SMTP_TIMEOUT_SECONDS,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(settings["host"], settings["port"], timeout=MAIL_SMTP_TIMEOUT_SECONDS)
+            if settings["starttls"]:
+                smtp.starttls(context=ssl.create_default_context())
+        if settings["username"]:
+            smtp.login(settings["username"], settings["password"])
+        self._smtp = smtp
+        self._smtp_messages = 0
+        self.connections += 1
+
+    def _close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def _message(self, row: dict) -> EmailMessage:
+        message = EmailMessage()
+        message["Subject"] = row["subject"]
+        message["From"] = self.settings["sender"]
+        message["To"] = row["recipient"]
+        message["Date"] = formatdate(localtime=False)
+        message["Message-ID"] = make_msgid(domain=self.settings["sender"].rpartition("@")[2] or None)
+        message.set_content(row["body"], subtype="html")
+        return message
+
+    def _send(self, row: dict):
+        if self._smtp is not None and self._smtp_messages >= self.max_messages_per_connection:
+            self._close()
+        reused = self._smtp is not None
+        if not reused:
+            self._connect()
+        try:
+            self._smtp.send_message(self._message(row))
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle connection; one retry on a new connection
+            self._smtp = None
+            if not reused:
+                raise
+            self._connect()
+            self._smtp.send_message(self._message(row))
+        self._smtp_messages += 1
+        self._smtp_last_used = time.monotonic()
+
+    def send_pending(self) -> int:
+        """
+        Claims one batch of due messages, sends it and stores the delivery status.
+
+        Returns:
+            int: Number of messages processed (sent, retried or failed)
+        """
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        for row in rows:
+            attempts = row["attempts"] + 1
+            now = datetime.utcnow()
+            result = {"b_id": row["id"], "b_attempts": attempts, "b_last_error": None,
+                      "b_sent_at": None, "b_next_attempt_at": now}
+            try:
+                self._send(row)
+                result["b_status"] = SENT
+                result["b_sent_at"] = now
+                self.sent += 1
+            except Exception as e:
+                error = f"{type(e).__name__}: {str(e)}"[:500]
+                self.last_error = error
+                result["b_last_error"] = error
+                if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    # The connection may be unusable after any other error
+                    self._close()
+                if _is_permanent(e) or attempts >= self.max_attempts:
+                    result["b_status"] = FAILED
+                    self.failed += 1
+                    logger.error(f"Email {row['id']} to {row['recipient']} failed permanently: {error}")
+                else:
+                    delay = backoff_delay(attempts, self.backoff_seconds, self.backoff_max_seconds)
+                    result["b_status"] = PENDING
+                    result["b_next_attempt_at"] = now + timedelta(seconds=delay)
+                    self.retried += 1
+                    logger.warning(f"Email {row['id']} to {row['recipient']} failed, retry in {delay:.0f}s: {error}")
+
+            # Store the attempt and keep the rest of the batch claimed
+            with self.engine.begin() as connection:
+                connection.execute(_UPDATE_RESULT, result)
+                connection.execute(
+                    update(_outbox)
+                    .where(_outbox.c.claim_id == row["claim_id"])
+                    .where(_outbox.c.status == SENDING)
+                    .values(claimed_at=datetime.utcnow())
+                )
+        return len(rows)
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.configured,
+            "running": self._thread is not None,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "smtp_connections": self.connections,
+            "last_error": self.last_error,
+        }
+
+
+def send_email_now(recipient: str, subject: str, body: str, settings: dict = None):
+    """
+    Sends one message right away over its own SMTP connection, bypassing the outbox.
+
+    Only for checking the SMTP configuration (utils/db_fixes.test_email_configuration),
+    where the caller wants the server's answer. Raises on any error.
+    """
+    settings = settings or smtp_settings()
+    if settings is None:
+        raise RuntimeError("Email is not configured (MAIL_FROM and credentials)")
+    sender = EmailSender(None, settings)
+    try:
+        sender._send({"recipient": recipient, "subject": subject, "body": body})
+    finally:
+        sender._close()
+
+
+def prune_outbox(engine, retention_days: int = MAIL_OUTBOX_RETENTION_DAYS) -> int:
+    """
+    Deletes SENT and FAILED messages older than the retention period.
+
+    FAILED messages are dated by their last attempt (next_attempt_at is set to
+    the time of the final attempt).
+
+    Returns:
+        int: Number of deleted messages
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    with engine.begin() as connection:
+        return connection.execute(
+            delete(_outbox)
+            .where(_outbox.c.status.in_([SENT, FAILED]))
+            .where(func.coalesce(_outbox.c.sent_at, _outbox.c.next_attempt_at) < cutoff)
+        ).rowcount
+
+
+def outbox_status_counts(db) -> dict:
+    """Number of outbox messages per status."""
+    rows = db.execute(select(_outbox.c.status, func.count()).group_by(_outbox.c.status))
+    return {status: count for status, count in rows}
+
+
+def enqueue_email(recipient: str, subject: str, body: str, engine=None) -> int:
+    """
+    Stores a message in the outbox and wakes the sender.
+
+    Args:
+        recipient (str): Recipient address
+        subject (str): Subject line
+        body (str): HTML body
+        engine: Database engine, defaults to the application database
+
+    Returns:
+        int: Id of the outbox message
+    """
+    if engine is None:
+        engine = email_sender.engine
+    with engine.begin() as connection:
+        result = connection.execute(_outbox.insert().values(
+            recipient=recipient, subject=subject, body=body, status=PENDING,
+            attempts=0, next_attempt_at=datetime.utcnow(), created_at=datetime.utcnow(),
+        ))
+        message_id = result.inserted_primary_key[0]
+    if engine is email_sender.engine:
+        email_sender.wake()
+    return message_id
+
+
+def _create_sender():
+    from database import engine
+
+    return EmailSender(engine, smtp_settings())
+
+
+email_sender = _create_sender()
@@ -0,0 +1,152 @@
+"""
+Liveness and readiness of the API for container health checks.
+
+GET /health/live only answers that the process serves requests. GET
+/health/ready returns the result of the last readiness check, which a
+background thread runs every HEALTH_CHECK_INTERVAL_SECONDS; a probe therefore
+costs a dict copy and never touches the database or the disk itself.
+
+The readiness check covers:
+- database: SELECT 1 on the user database
+- migrations: all migrations of utils/migrations.py are recorded
+- disk: at least HEALTH_MIN_FREE_DISK_MB free next to the database file
+- writer_queue: the activity writer queue is below HEALTH_MAX_QUEUE_FILL of
+  its maximum (above it, events are about to be dropped)
+
+Until the first check finished, and if the last check is older than
+HEALTH_STALE_INTERVALS intervals (the check thread hangs), the API is not ready.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "10"))
+HEALTH_MIN_FREE_DISK_MB = float(os.getenv("HEALTH_MIN_FREE_DISK_MB", "100"))
+HEALTH_MAX_QUEUE_FILL = float(os.getenv("HEALTH_MAX_QUEUE_FILL", "0.9"))
+HEALTH_STALE_INTERVALS = 3
+
+
+class HealthMonitor:
+    """
+    Runs the readiness checks in a background thread and caches the result.
+
+    Args:
+        engine: SQLAlchemy engine of the user database
+        database_path (str): Path of the database file, None or ":memory:" skips the disk check
+        writer: Buffered writer with stats()["queued"] and max_queue (ActivityRecorder)
+        interval (float): Seconds between two checks
+        min_free_disk_mb (float): Minimum free space on the database volume
+        max_queue_fill (float): Maximum fill ratio of the writer queue
+    """
+
+    def __init__(self, engine, database_path: str = None, writer=None,
+                 interval: float = HEALTH_CHECK_INTERVAL_SECONDS,
+                 min_free_disk_mb: float = HEALTH_MIN_FREE_DISK_MB,
+                 max_queue_fill: float = HEALTH_MAX_QUEUE_FILL):
+        self.engine = engine
+        self.database_path = database_path
+        self.writer = writer
+        self.interval = interval
+        self.min_free_disk_mb = min_free_disk_mb
+        self.max_queue_fill = max_queue_fill
+        self._result = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _check_database(self):
+        started = time.perf_counter()
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def _check_migrations(self):
+        from utils.migrations import MIGRATIONS
+
+        with self.engine.connect() as connection:
+            applied = {row[0] for row in connection.execute(text("SELECT name FROM schema_migrations"))}
+        pending = [name for name, _ in MIGRATIONS if name not in applied]
+        return {"ok": not pending, "pending": pending}
+
+    def _check_disk(self):
+        if not self.database_path or self.database_path == ":memory:":
+            return {"ok": True}
+        free_mb = shutil.disk_usage(os.path.dirname(os.path.abspath(self.database_path))).free / 2**20
+        return {"ok": free_mb >= self.min_free_disk_mb, "free_mb": round(free_mb)}
+
+    def _check_writer_queue(self):
+        if self.writer is None:
+            return {"ok": True}
+        queued = self.writer.stats()["queued"]
+        return {"ok": queued < self.writer.max_queue * self.max_queue_fill,
+                "queued": queued, "max": self.writer.max_queue}
+
+    def check(self) -> dict:
+        """Runs all checks now and stores the result for readiness()."""
+        checks = {}
+        for name, check in (("database", self._check_database), ("migrations", self._check_migrations),
+                            ("disk", self._check_disk), ("writer_queue", self._check_writer_queue)):
+            try:
+                checks[name] = check()
+            except Exception as e:
+                checks[name] = {"ok": False, "error": str(e)}
+        ready = all(result["ok"] for result in checks.values())
+        result = {"status": "ready" if ready else "not_ready", "ready": ready,
+                  "checked_at": datetime.utcnow().isoformat(), "checks": checks}
+
+        with self._lock:
+            if self._result is not None and self._result["ready"] != ready:
+                failed = [name for name, check in checks.items() if not check["ok"]]
+                if ready:
+                    logger.info("Readiness check passed again")
+                else:
+                    logger.warning(f"Readiness check failed: {', '.join(failed)}")
+            self._result = result
+            self._checked_at = time.monotonic()
+        return result
+
+    def start(self):
+        """Starts the background thread (once), which runs the first check right away."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.interval)
+
+    def readiness(self) -> dict:
+        """The cached result of the last check; not ready while starting or if the result is stale."""
+        self.start()
+        with self._lock:
+            result, checked_at = self._result, self._checked_at
+        if result is None:
+            return {"status": "starting", "ready": False, "checked_at": None, "checks": {}}
+        if time.monotonic() - checked_at > self.interval * HEALTH_STALE_INTERVALS:
+            return {**result, "status": "stale", "ready": False}
+        return result
+
+    @property
+    def ready(self) -> bool:
+        return self.readiness()["ready"]
+
+
+def _create_monitor():
+    from database import DATABASE_PATH, engine
+    from utils.activity import activity_recorder
+
+    return HealthMonitor(engine, DATABASE_PATH, activity_recorder)
+
+
+health_monitor = _create_monitor()
@@ -1,221 +1,251 @@
 import os
-import tempfile
 import traceback
 import gpxpy
 import gpxpy.gpx
 import logging
-from io import BytesIO
-from defusedxml import ElementTree
+from datetime import datetime
 from lxml import etree
 
 # Configure logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-# Optional: Try to import pykml for better KML parsing
-try:
-    from pykml import parser as kml_parser
-    PYKML_AVAILABLE = True
-except ImportError:
-    logger.warning("pykml not available, using ElementTree for KML parsing")
-    PYKML_AVAILABLE = False
+# Elements the streaming reader looks at; '{*}' matches the KML 2.2 and gx namespaces
+KML_TAGS = ('{*}name', '{*}when', '{*}coord', '{*}coordinates', '{*}Track', '{*}Placemark')
 
-def kml_to_gpx(kml_file_path):
+
+def parse_timestamps(values):
     """
-    Convert a KML file to GPX format.
-    
+    Parse a list of KML timestamps in one pass.
+
+    Unparsable values become None and are reported with a single warning
+    instead of one per point.
+
     Args:
-        kml_file_path (str): Path to the KML file
-        
+        values (list of str): xsd:dateTime strings, e.g. '2024-05-01T08:00:00Z'
+
     Returns:
-        str: Path to the newly created GPX file
+        list: datetime objects (or None) in the same order
     """
-    logger.info(f"Converting KML file to GPX: {kml_file_path}")
-    
+    parse = datetime.fromisoformat
+    parsed = []
+    failed = 0
+    for value in values:
+        try:
+            parsed.append(parse(value))
+        except (TypeError, ValueError):
+            try:
+                # Python < 3.11 doesn't accept the 'Z' suffix
+                parsed.append(parse(value.strip().replace('Z', '+00:00')))
+            except (AttributeError, ValueError):
+                parsed.append(None)
+                failed += 1
+    if failed:
+        logger.warning(f"Could not parse {failed} of {len(values)} timestamps")
+    return parsed
+
+
+def _parse_coordinate(text, separator=None):
+    """Parses 'lon lat [alt]' (gx:coord) or 'lon,lat[,alt]' (coordinates) into (lat, lon, elevation)."""
+    parts = text.split(separator)
+    if len(parts) < 2:
+        return None
+    elevation = float(parts[2]) if len(parts) > 2 and parts[2] else None
+    return float(parts[1]), float(parts[0]), elevation
+
+
+_local_names = {}
+
+
+def _local_name(tag):
+    """'{namespace}Placemark' -> 'Placemark', cached since only a handful of tags occur."""
+    name = _local_names.get(tag)
+    if name is None:
+        name = _local_names[tag] = tag.rpartition('}')[2] if isinstance(tag, str) else None
+    return name
+
+
+def _release(elem):
+    """Frees a processed element and its already processed siblings."""
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def kml_to_gpx(kml_file_path, source_name=None):
+    """
+    Convert a KML file to an in-memory GPX object.
+
+    The KML document is read with lxml.iterparse: gx:coord and when elements are
+    collected in pairs per gx:Track, their timestamps parsed in bulk, and every
+    processed element is freed right away, so memory stays flat regardless of
+    the file size. The result is the same gpxpy object the GPX import works
+    with, so it can be passed to import_gpx.store_tour directly.
+
+    Args:
+        kml_file_path (str or file): Path to the KML file or a binary file object
+        source_name (str): Original file name, used as fallback tour name for file objects
+
+    Returns:
+        gpxpy.gpx.GPX: The converted track, or None if the conversion failed
+    """
+    is_file_obj = hasattr(kml_file_path, 'read')
+    if source_name is None:
+        source_name = 'upload.kml' if is_file_obj else kml_file_path
+    logger.info(f"Converting KML file to GPX: {source_name}")
+
     try:
-        # Check file existence and size
-        if not os.path.exists(kml_file_path):
-            logger.error(f"KML file does not exist: {kml_file_path}")
-            return None
-            
-        file_size = os.path.getsize(kml_file_path)
+        if is_file_obj:
+            # Determine the size without reading the whole stream
+            kml_file_path.seek(0, os.SEEK_END)
+            file_size = kml_file_path.tell()
+            kml_file_path.seek(0)
+        else:
+            # Check file existence and size
+            if not os.path.exists(kml_file_path):
+                logger.error(f"KML file does not exist: {kml_file_path}")
+                return None
+
+            file_size = os.path.getsize(kml_file_path)
         logger.debug(f"KML file size: {file_size} bytes")
-        
+
         if file_size == 0:
-            logger.error(f"KML file is empty: {kml_file_path}")
+            logger.error(f"KML file is empty: {source_name}")
             return None
-            
-        # Parse KML file
-        namespaces = {
-            'kml': 'http://www.opengis.net/kml/2.2',
-            'gx': 'http://www.google.com/kml/ext/2.2'
-        }
-        
-        logger.debug(f"Attempting to parse KML file: {kml_file_path}")
-        
-        # Use the most robust parsing method available
-        if PYKML_AVAILABLE:
-            try:
-                with open(kml_file_path) as f:
-                    doc = kml_parser.parse(f)
-                    root = doc.getroot()
-                    logger.debug(f"KML file successfully parsed with pykml, root: {root}")
-            except Exception as e:
-                logger.warning(f"pykml parsing failed, falling back to ElementTree: {str(e)}")
-                tree = ElementTree.parse(kml_file_path)
-                root = tree.getroot()
-        else:
-            tree = ElementTree.parse(kml_file_path)
-            root = tree.getroot()
-            
-        logger.debug(f"KML file successfully parsed, root tag: {root.tag}")
-        
-        # Create new GPX file
+
         gpx = gpxpy.gpx.GPX()
-        
-        # Try to extract document name for the GPX name
-        doc_name_elem = root.find(".//kml:Document/kml:name", namespaces)
-        gpx_name = doc_name_elem.text if doc_name_elem is not None else os.path.splitext(os.path.basename(kml_file_path))[0]
-        
-        gpx.name = gpx_name
-        
-        # Extract track name from KML if available
-        track_name = gpx_name
-        track_name_elem = root.find(".//kml:Placemark/kml:name", namespaces)
-        if track_name_elem is not None:
-            track_name = track_name_elem.text
-        
-        # Create a track in our GPX
-        gpx_track = gpxpy.gpx.GPXTrack(name=track_name)
-        gpx.tracks.append(gpx_track)
-        
-        # Create a segment in our GPX track
         gpx_segment = gpxpy.gpx.GPXTrackSegment()
-        gpx_track.segments.append(gpx_segment)
-        
-        # Find all placemarks with LineString or Track data
-        placemarks = root.findall(".//kml:Placemark", namespaces)
-        
-        points_added = False
-        
-        logger.debug(f"Found {len(placemarks)} placemarks in KML file")
-        
-        for i, placemark in enumerate(placemarks):
-            logger.debug(f"Processing placemark {i+1}/{len(placemarks)}")
-            
-            # Check for LineString coordinates
-            coords = placemark.find(".//kml:LineString/kml:coordinates", namespaces)
-            
-            if coords is not None and coords.text:
-                # Try to extract timestamp for this placemark
-                time_elem = placemark.find(".//kml:TimeStamp/kml:when", namespaces)
-                placemark_time = None
-                if time_elem is not None and time_elem.text:
-                    try:
-                        from datetime import datetime
-                        placemark_time = datetime.fromisoformat(time_elem.text.replace('Z', '+00:00'))
-                    except Exception as e:
-                        logger.warning(f"Could not parse LineString timestamp: {time_elem.text}, {str(e)}")
-                
-                # Split the coordinates text into individual point strings
-                coord_text = coords.text.strip()
-                coord_strings = coord_text.split()
-                
-                for coord_str in coord_strings:
-                    # Each coordinate is comma-separated: longitude,latitude,altitude
-                    parts = coord_str.split(',')
-                    if len(parts) >= 2:
-                        lon = float(parts[0])
-                        lat = float(parts[1])
-                        # Altitude is optional in KML
-                        elevation = float(parts[2]) if len(parts) > 2 else None
-                        
-                        # Add point to the GPX segment - apply timestamp to all points in this LineString
-                        gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=elevation, time=placemark_time))
-                        points_added = True
-            
-            # Check for gx:Track data (newer KML format)
-            gx_coords = placemark.findall(".//gx:Track/gx:coord", namespaces)
-            gx_when = placemark.findall(".//gx:Track/kml:when", namespaces)
-            
-            if gx_coords:
-                for i, coord in enumerate(gx_coords):
-                    parts = coord.text.split()
-                    if len(parts) >= 2:
-                        lon = float(parts[0])
-                        lat = float(parts[1])
-                        elevation = float(parts[2]) if len(parts) > 2 else None
-                        
-                        # Try to extract timestamp if available
-                        time = None
-                        if gx_when and i < len(gx_when):
-                            time_str = gx_when[i].text
-                            try:
-                                from datetime import datetime
-                                time = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-                            except Exception as e:
-                                logger.warning(f"Could not parse timestamp: {time_str}, {str(e)}")
-                        
-                        gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=elevation, time=time))
-                        points_added = True
-                        
-            # Check for Point data (waypoints)
-            point_coords = placemark.find(".//kml:Point/kml:coordinates", namespaces)
-            
-            if point_coords is not None and point_coords.text:
-                parts = point_coords.text.strip().split(',')
-                if len(parts) >= 2:
-                    lon = float(parts[0])
-                    lat = float(parts[1])
-                    elevation = float(parts[2]) if len(parts) > 2 else None
-                    
-                    # For single points, create a waypoint
-                    name = placemark.find("kml:name", namespaces)
-                    waypoint_name = name.text if name is not None else "Waypoint"
-                    
-                    # Try to extract timestamp for waypoint
-                    time_elem = placemark.find(".//kml:TimeStamp/kml:when", namespaces)
-                    time = None
-                    if time_elem is not None and time_elem.text:
-                        try:
-                            from datetime import datetime
-                            time = datetime.fromisoformat(time_elem.text.replace('Z', '+00:00'))
-                            logger.debug(f"Found timestamp for waypoint {waypoint_name}: {time}")
-                        except Exception as e:
-                            logger.warning(f"Could not parse waypoint timestamp: {time_elem.text}, {str(e)}")
-                    
-                    gpx.waypoints.append(gpxpy.gpx.GPXWaypoint(lat, lon, elevation=elevation, name=waypoint_name, time=time))
-                    points_added = True
-        
-        if not points_added:
-            logger.warning(f"No valid track points found in KML file: {kml_file_path}")
+        doc_name = None
+        track_name = None
+        placemark_count = 0
+
+        # State of the current placemark and gx:Track
+        placemark_name = None
+        placemark_when = None
+        line_coords = []
+        point_coords = None
+        track_points = []
+        track_coords = []
+        track_whens = []
+
+        # Entities are not resolved and nothing is loaded from the network;
+        # huge_tree allows LineStrings with more than 10 MB of coordinates
+        context = etree.iterparse(
+            kml_file_path, events=('end',), tag=KML_TAGS,
+            resolve_entities=False, no_network=True, huge_tree=True
+        )
+
+        for _, elem in context:
+            tag = _local_name(elem.tag)
+            parent = elem.getparent()
+            parent_tag = _local_name(parent.tag) if parent is not None else None
+
+            if tag == 'coord':
+                # gx:Track: collect, paired with the when elements at the end of the track
+                if elem.text:
+                    track_coords.append(elem.text)
+            elif tag == 'when':
+                if parent_tag == 'Track':
+                    track_whens.append(elem.text)
+                elif parent_tag == 'TimeStamp' and elem.text:
+                    placemark_when = elem.text
+            elif tag == 'coordinates':
+                if parent_tag == 'LineString' and elem.text:
+                    line_coords.append(elem.text)
+                elif parent_tag == 'Point' and elem.text and point_coords is None:
+                    point_coords = elem.text
+            elif tag == 'name':
+                if parent_tag == 'Document' and doc_name is None:
+                    doc_name = elem.text
+                elif parent_tag == 'Placemark' and placemark_name is None:
+                    placemark_name = elem.text
+            elif tag == 'Track':
+                times = parse_timestamps(track_whens) if track_whens else []
+                for i, coord_text in enumerate(track_coords):
+                    coordinate = _parse_coordinate(coord_text)
+                    if coordinate:
+                        lat, lon, elevation = coordinate
+                        time = times[i] if i < len(times) else None
+                        track_points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=elevation, time=time))
+                track_coords = []
+                track_whens = []
+            elif tag == 'Placemark':
+                placemark_count += 1
+                if track_name is None and placemark_name is not None:
+                    track_name = placemark_name
+
+                placemark_time = parse_timestamps([placemark_when])[0] if placemark_when else None
+
+                # LineString coordinates: the placemark timestamp applies to all points
+                for coord_text in line_coords:
+                    for coord_str in coord_text.split():
+                        coordinate = _parse_coordinate(coord_str, ',')
+                        if coordinate:
+                            lat, lon, elevation = coordinate
+                            gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=elevation, time=placemark_time))
+
+                # gx:Track points (newer KML format)
+                gpx_segment.points.extend(track_points)
+
+                # Single points become waypoints
+                if point_coords is not None:
+                    coordinate = _parse_coordinate(point_coords.strip(), ',')
+                    if coordinate:
+                        lat, lon, elevation = coordinate
+                        gpx.waypoints.append(gpxpy.gpx.GPXWaypoint(
+                            lat, lon, elevation=elevation, name=placemark_name or "Waypoint", time=placemark_time
+                        ))
+
+                placemark_name = None
+                placemark_when = None
+                line_coords = []
+                point_coords = None
+                track_points = []
+
+            # Only Placemarks and gx:Tracks are released with their children, other
+            # elements may still be needed by the enclosing placemark
+            if tag in ('coord', 'when', 'Placemark', 'Track') or parent_tag in ('LineString', 'Point'):
+                _release(elem)
+
+        del context
+        logger.debug(f"Processed {placemark_count} placemarks in KML file")
+
+        if not gpx_segment.points and not gpx.waypoints:
+            logger.warning(f"No valid track points found in KML file: {source_name}")
             return None
-        
-        # Write GPX to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.gpx', mode='w') as gpx_file:
-            gpx_file.write(gpx.to_xml())
-            gpx_path = gpx_file.name
-            
-        logger.info(f"KML successfully converted to GPX: {gpx_path}")
-        return gpx_path
-        
+
+        gpx.name = doc_name if doc_name is not None else os.path.splitext(os.path.basename(source_name))[0]
+
+        # Create a track in our GPX
+        gpx_track = gpxpy.gpx.GPXTrack(name=track_name or gpx.name)
+        gpx_track.segments.append(gpx_segment)
+        gpx.tracks.append(gpx_track)
+
+        logger.info(f"KML successfully converted to GPX: {source_name}")
+        return gpx
+
     except Exception as e:
         error_trace = traceback.format_exc()
         logger.error(f"Error converting KML to GPX: {str(e)}")
         logger.error(f"Traceback: {error_trace}")
-        logger.error(f"KML file path: {kml_file_path}")
-        
-        # Check if file exists and its size
-        if os.path.exists(kml_file_path):
-            logger.debug(f"KML file exists, size: {os.path.getsize(kml_file_path)} bytes")
-            # Log first few bytes for debugging
-            try:
+        logger.error(f"KML file: {source_name}")
+
+        # Log first few bytes for debugging
+        try:
+            if is_file_obj:
+                kml_file_path.seek(0)
+                content = kml_file_path.read(200)
+            elif os.path.exists(kml_file_path):
+                logger.debug(f"KML file exists, size: {os.path.getsize(kml_file_path)} bytes")
                 with open(kml_file_path, 'rb') as f:
                     content = f.read(200)
-                    logger.debug(f"First 200 bytes: {content}")
-            except Exception as read_error:
-                logger.error(f"Error reading KML file: {str(read_error)}")
-        else:
-            logger.error(f"KML file does not exist at path: {kml_file_path}")
-            
+            else:
+                logger.error(f"KML file does not exist at path: {kml_file_path}")
+                return None
+            logger.debug(f"First 200 bytes: {content}")
+        except Exception as read_error:
+            logger.error(f"Error reading KML file: {str(read_error)}")
+
         return None
@@ -1,90 +1,176 @@
+import io
 import os
 import zipfile
-import tempfile
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from .kml_converter import kml_to_gpx
+from .uploads import UploadTooLargeError
 
 # Configure logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-def kmz_to_gpx(kmz_file_path):
+# Zip bomb protection, checked against the archive directory before anything is decompressed
+# Maximum decompressed size of a single KML document
+KMZ_MAX_DOCUMENT_SIZE = int(os.getenv("KMZ_MAX_DOCUMENT_SIZE", str(200 * 1024 * 1024)))  # 200 MB
+# Maximum decompressed size of all KML documents of one archive
+KMZ_MAX_TOTAL_SIZE = int(os.getenv("KMZ_MAX_TOTAL_SIZE", str(500 * 1024 * 1024)))  # 500 MB
+# Maximum compression ratio of a document; KML typically compresses 10-20x
+KMZ_MAX_COMPRESSION_RATIO = int(os.getenv("KMZ_MAX_COMPRESSION_RATIO", "100"))
+# Maximum number of KML documents in one archive
+KMZ_MAX_DOCUMENTS = int(os.getenv("KMZ_MAX_DOCUMENTS", "1000"))
+
+# With parallel=True (command line tools only), archives with several documents and
+# at least this much KML are converted in worker processes
+KMZ_PARALLEL_MIN_SIZE = int(os.getenv("KMZ_PARALLEL_MIN_SIZE", str(16 * 1024 * 1024)))  # 16 MB
+KMZ_MAX_WORKERS = int(os.getenv("KMZ_MAX_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _check_limits(documents):
+    """Rejects archives whose directory announces more data than allowed."""
+    if len(documents) > KMZ_MAX_DOCUMENTS:
+        raise UploadTooLargeError(
+            f"KMZ archive contains more than {KMZ_MAX_DOCUMENTS} KML documents", KMZ_MAX_DOCUMENTS
+        )
+
+    total_size = 0
+    for info in documents:
+        if info.file_size > KMZ_MAX_DOCUMENT_SIZE:
+            raise UploadTooLargeError(
+                f"KML document {info.filename} in KMZ archive exceeds the maximum size of "
+                f"{KMZ_MAX_DOCUMENT_SIZE // (1024 * 1024)} MB", KMZ_MAX_DOCUMENT_SIZE
+            )
+        # Small documents may compress extremely well, only larger ones are suspicious
+        if info.file_size > 1024 * 1024 and info.file_size > KMZ_MAX_COMPRESSION_RATIO * max(info.compress_size, 1):
+            raise UploadTooLargeError(
+                f"KML document {info.filename} in KMZ archive exceeds the maximum compression ratio "
+                f"of {KMZ_MAX_COMPRESSION_RATIO}", KMZ_MAX_COMPRESSION_RATIO
+            )
+        total_size += info.file_size
+
+    if total_size > KMZ_MAX_TOTAL_SIZE:
+        raise UploadTooLargeError(
+            f"KMZ archive exceeds the maximum decompressed size of {KMZ_MAX_TOTAL_SIZE // (1024 * 1024)} MB",
+            KMZ_MAX_TOTAL_SIZE
+        )
+    return total_size
+
+
+def _convert_document(zip_ref, name):
+    # ZipExtFile never returns more than the file_size checked in _check_limits
+    with zip_ref.open(name) as kml_file:
+        return kml_to_gpx(kml_file, source_name=name)
+
+
+# Archive opened once per worker process, see _init_worker
+_worker_archive = None
+
+
+def _init_worker(source):
+    global _worker_archive
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    _worker_archive = zipfile.ZipFile(source, 'r')
+
+
+def _convert_in_worker(name):
+    return name, _convert_document(_worker_archive, name)
+
+
+def kmz_to_gpx(kmz_file_path, parallel=False):
     """
-    Convert a KMZ file to GPX format by:
-    1. Extracting the KML file from the KMZ archive
-    2. Converting the extracted KML file to GPX
-    
+    Convert every KML document in a KMZ archive to an in-memory GPX object.
+
+    The archive is read with zipfile straight from the path or file object,
+    nothing is extracted to disk. Each KML document becomes its own tour. The
+    sizes in the archive directory are checked against the limits above before
+    anything is decompressed. With parallel=True, archives with several large
+    documents are converted in worker processes. The workers are spawned, not
+    forked, and log to stderr rather than through the caller's log handlers;
+    use this from command line tools only, never from the API process, whose
+    background threads may hold locks at fork time.
+
     Args:
-        kmz_file_path (str): Path to the KMZ file
-        
+        kmz_file_path (str or file): Path to the KMZ file or a binary file object
+        parallel (bool): Allow worker processes; leave False in the API and in worker processes
+
     Returns:
-        str: Path to the newly created GPX file, or None if conversion failed
+        list: (document name, gpxpy.gpx.GPX) tuples in archive order, or None if
+              the archive is invalid or no document could be converted
+
+    Raises:
+        UploadTooLargeError: If the archive exceeds one of the decompression limits
     """
-    logger.info(f"Converting KMZ file to GPX: {kmz_file_path}")
-    
-    temp_dir = None
+    is_file_obj = hasattr(kmz_file_path, 'read')
+    source_name = 'upload.kmz' if is_file_obj else kmz_file_path
+    logger.info(f"Converting KMZ file to GPX: {source_name}")
+
     try:
-        # Check if file exists and is not empty
-        if not os.path.exists(kmz_file_path):
-            logger.error(f"KMZ file does not exist: {kmz_file_path}")
-            return None
-            
-        file_size = os.path.getsize(kmz_file_path)
+        if is_file_obj:
+            kmz_file_path.seek(0, os.SEEK_END)
+            file_size = kmz_file_path.tell()
+            kmz_file_path.seek(0)
+        else:
+            # Check if file exists and is not empty
+            if not os.path.exists(kmz_file_path):
+                logger.error(f"KMZ file does not exist: {kmz_file_path}")
+                return None
+
+            file_size = os.path.getsize(kmz_file_path)
         logger.debug(f"KMZ file size: {file_size} bytes")
-        
+
         if file_size == 0:
-            logger.error(f"KMZ file is empty: {kmz_file_path}")
+            logger.error(f"KMZ file is empty: {source_name}")
             return None
-        
-        # Create a temporary directory to extract the KMZ contents
-        temp_dir = tempfile.mkdtemp()
-        logger.debug(f"Created temporary directory: {temp_dir}")
-        
-        # Extract the KMZ file (it's just a zip archive)
+
+        # Read the KMZ file (it's just a zip archive)
         try:
             with zipfile.ZipFile(kmz_file_path, 'r') as zip_ref:
-                # List the contents of the zip file
-                file_list = zip_ref.namelist()
-                logger.debug(f"KMZ archive contains: {file_list}")
-                
-                # Look for a KML file (typically doc.kml but could be named differently)
-                kml_files = [f for f in file_list if f.endswith('.kml')]
-                
-                if not kml_files:
+                # Every KML document in the archive (typically doc.kml) is a tour
+                documents = [
+                    info for info in zip_ref.infolist()
+                    if not info.is_dir() and info.filename.lower().endswith('.kml')
+                ]
+                logger.debug(f"KMZ archive contains {len(zip_ref.infolist())} files, {len(documents)} KML documents")
+
+                if not documents:
                     logger.error("No KML file found in the KMZ archive")
                     return None
-                
-                # Use the first KML file found (usually there's only one)
-                kml_file_in_zip = kml_files[0]
-                logger.info(f"Found KML file in archive: {kml_file_in_zip}")
-                
-                # Extract the KML file
-                zip_ref.extract(kml_file_in_zip, temp_dir)
-                
-                # Path to the extracted KML file
-                extracted_kml_path = os.path.join(temp_dir, kml_file_in_zip)
-                logger.debug(f"KML file extracted to: {extracted_kml_path}")
-                
-                # Convert the extracted KML file to GPX
-                gpx_path = kml_to_gpx(extracted_kml_path)
-                if not gpx_path:
-                    logger.error("Failed to convert extracted KML to GPX")
-                    return None
-                
-                logger.info(f"KMZ successfully converted to GPX: {gpx_path}")
-                return gpx_path
-                
+
+                total_size = _check_limits(documents)
+                names = [info.filename for info in documents]
+
+                if parallel and len(names) > 1 and total_size >= KMZ_PARALLEL_MIN_SIZE:
+                    if is_file_obj:
+                        kmz_file_path.seek(0)
+                        worker_source = kmz_file_path.read()
+                    else:
+                        worker_source = kmz_file_path
+                    workers = min(len(names), KMZ_MAX_WORKERS)
+                    logger.info(f"Converting {len(names)} KML documents with {workers} worker processes")
+                    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=(worker_source,)) as executor:
+                        converted = list(executor.map(_convert_in_worker, names))
+                else:
+                    converted = [(name, _convert_document(zip_ref, name)) for name in names]
+
         except zipfile.BadZipFile:
-            logger.error(f"Invalid KMZ file (not a valid zip archive): {kmz_file_path}")
+            logger.error(f"Invalid KMZ file (not a valid zip archive): {source_name}")
             return None
-            
+
+        tours = [(name, gpx) for name, gpx in converted if gpx is not None]
+        if len(tours) < len(converted):
+            logger.warning(f"{len(converted) - len(tours)} of {len(converted)} KML documents could not be converted")
+        if not tours:
+            logger.error("Failed to convert the KML documents of the KMZ archive to GPX")
+            return None
+
+        logger.info(f"KMZ successfully converted to GPX: {source_name} ({len(tours)} tours)")
+        return tours
+
+    except UploadTooLargeError:
+        raise
     except Exception as e:
         logger.error(f"Error converting KMZ file: {str(e)}")
         return None
-        
-    finally:
-        # Clean up the temporary directory if it was created
-        if temp_dir and os.path.exists(temp_dir):
-            import shutil
-            shutil.rmtree(temp_dir)
-            logger.debug(f"Cleaned up temporary directory: {temp_dir}")
@@ -1,59 +1,225 @@
+"""
+Non-blocking logging for the API.
+
+All loggers propagate to the root logger, which has a single QueueHandler.
+Formatting and writing (stdout and the rotating file logs/app.log) happen in
+a QueueListener thread, so a log call on a request only puts the record into
+a queue. If the queue is full (the disk can't keep up) records are dropped and
+counted instead of blocking the request.
+
+Configuration:
+- LOG_LEVEL: level of the root logger (default INFO)
+- LOG_LEVELS: per-module levels, e.g. "utils.email=DEBUG,sqlalchemy.engine=WARNING"
+- LOG_FORMAT: "json" (default, one JSON object per line) or "text"
+- LOG_RATE_LIMIT / LOG_RATE_LIMIT_WINDOW_SECONDS: the same message of the same
+  logger is logged at most this many times per window (default 20 per 60s);
+  the next record after the window carries the number of suppressed messages
+- LOG_QUEUE_SIZE: maximum number of waiting records (default 10000)
+"""
+import atexit
+import json
 import logging
 import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-def get_logger(name):
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_RATE_LIMIT_WINDOW_SECONDS = float(os.getenv("LOG_RATE_LIMIT_WINDOW_SECONDS", "60"))
+
+# Attributes every LogRecord has; everything else was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object, including fields passed with extra={...}."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
     """
-    Creates a logger with the specified name and configuration.
-    Logs will be written to both console and a file.
-    
-    Args:
-        name (str): The name of the logger, typically __name__
-        
-    Returns:
-        logging.Logger: The configured logger
+    Lets the same message of a logger pass at most `limit` times per window.
+
+    Runs on the logging thread before the record is queued, so suppressed
+    records cost one dict lookup.
     """
+
+    MAX_KEYS = 10000
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_LIMIT_WINDOW_SECONDS):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        # (logger, level, message) -> [window start, count in window, suppressed]
+        self._counters = {}
+
+    def filter(self, record):
+        if self.limit <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or now - counter[0] >= self.window:
+                if len(self._counters) >= self.MAX_KEYS:
+                    self._counters.clear()
+                suppressed = counter[2] if counter else 0
+                self._counters[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if counter[1] < self.limit:
+                counter[1] += 1
+                return True
+            counter[2] += 1
+            return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The queue stays in this process, so the record needs no copy and no
+        # formatting here; the listener thread formats it. Only the message
+        # arguments are merged now, they may change after the call.
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec: str) -> dict:
+    """Parses "module=LEVEL,other=LEVEL" into {module: level}; invalid entries are ignored."""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        level = logging.getLevelName(level.strip().upper())
+        if name.strip() and isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+
+def _log_dir():
     try:
         # Create logs directory if it doesn't exist
         log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
         os.makedirs(log_dir, exist_ok=True)
-    except Exception as e:
+    except Exception:
         # Fallback to current directory if there's an issue
         log_dir = os.path.join(os.getcwd(), 'logs')
         os.makedirs(log_dir, exist_ok=True)
-        
-    # Set global logging level - more verbose during debugging
-    logging.basicConfig(level=logging.INFO)
-    
-    # Configure the logger
-    logger = logging.getLogger(name)
-    
-    # Only configure if not already configured
-    if not logger.handlers:
-        logger.setLevel(logging.INFO)
-        
-        # Create formatter
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        
+    return log_dir
+
+
+def setup_logging():
+    """
+    Installs the queue-based logging on the root logger (once per process).
+
+    Returns:
+        QueueListener: The running listener
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        if os.getenv("LOG_FORMAT", "json").lower() == "text":
+            formatter = logging.Formatter(
+                '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            )
+        else:
+            formatter = JsonFormatter()
+
         # Console handler
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
-        
+
         # File handler (rotating to prevent large log files)
         file_handler = RotatingFileHandler(
-            os.path.join(log_dir, 'app.log'),
+            os.path.join(_log_dir(), 'app.log'),
             maxBytes=10485760,  # 10 MB
             backupCount=5
         )
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        
-        # Don't propagate to root logger
-        logger.propagate = False
-    
-    return logger
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger()
+        # Handlers installed earlier (e.g. by basicConfig) would write synchronously
+        for handler in list(root.handlers):
+            if not type(handler).__module__.startswith("_pytest"):
+                root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper()))
+        for name, level in parse_levels(os.getenv("LOG_LEVELS", "")).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = QueueListener(_queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    return _listener
+
+
+def dropped_records() -> int:
+    """Number of records dropped because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def get_logger(name):
+    """
+    Returns the logger with the specified name.
+
+    The records go through the queue of the root logger to the console and
+    the log file, see setup_logging.
+
+    Args:
+        name (str): The name of the logger, typically __name__
+
+    Returns:
+        logging.Logger: The logger
+    """
+    setup_logging()
+    return logging.getLogger(name)
@@ -0,0 +1,67 @@
+"""
+Single-runner guard for the periodic maintenance jobs.
+
+Every worker process starts its own background threads, so without a guard
+each of them would roll up, prune and purge the same tables at the same time.
+maintenance_lock takes a lease in the maintenance_locks table: a row per job
+with the owning process and an expiry. The process that holds an unexpired
+lease runs the job, all others skip it. The lease is released when the job is
+done; if the holder dies, it expires after MAINTENANCE_LOCK_TTL_SECONDS.
+"""
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which the lease of a crashed process can be taken over
+MAINTENANCE_LOCK_TTL_SECONDS = float(os.getenv("MAINTENANCE_LOCK_TTL_SECONDS", "900"))
+
+# Identifies this process as lease owner
+_OWNER = f"{os.getpid()}-{uuid.uuid4().hex}"
+
+
+def acquire_lock(engine, name: str, ttl: float = MAINTENANCE_LOCK_TTL_SECONDS, owner: str = None) -> bool:
+    """Takes the lease on a job if it is free, expired or already ours; returns whether it was taken."""
+    owner = owner or _OWNER
+    now = datetime.utcnow()
+    params = {"name": name, "owner": owner, "now": now, "expires_at": now + timedelta(seconds=ttl)}
+    with engine.begin() as connection:
+        if connection.execute(text(
+            "INSERT OR IGNORE INTO maintenance_locks (name, owner, expires_at) VALUES (:name, :owner, :expires_at)"
+        ), params).rowcount:
+            return True
+        return connection.execute(text(
+            "UPDATE maintenance_locks SET owner = :owner, expires_at = :expires_at "
+            "WHERE name = :name AND (expires_at < :now OR owner = :owner)"
+        ), params).rowcount == 1
+
+
+def release_lock(engine, name: str, owner: str = None):
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM maintenance_locks WHERE name = :name AND owner = :owner"),
+                           {"name": name, "owner": owner or _OWNER})
+
+
+@contextmanager
+def maintenance_lock(engine, name: str, ttl: float = MAINTENANCE_LOCK_TTL_SECONDS, owner: str = None):
+    """
+    Runs the body with the lease on a job held; yields False if another process holds it.
+
+    Usage:
+        with maintenance_lock(engine, "maintenance") as acquired:
+            if acquired:
+                ...
+    """
+    acquired = acquire_lock(engine, name, ttl, owner)
+    if not acquired:
+        logger.debug(f"Maintenance job {name} is running in another process, skipped")
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release_lock(engine, name, owner)
@@ -0,0 +1,266 @@
+"""
+Request, database and upload metrics in Prometheus text format.
+
+A small in-process registry instead of the prometheus_client package: the
+metrics are counters, gauges and histograms with labels, each guarded by its
+own lock, and rendered by render() for GET /metrics. Recording a request costs
+a few dict lookups and one lock per metric.
+
+- MetricsMiddleware (pure ASGI, no BaseHTTPMiddleware overhead) measures every
+  request and labels it with the route template (/api/tours/{tour_id}), not
+  the raw path, so the number of series stays bounded. Unmatched paths are
+  counted as "<unmatched>".
+- instrument_engine() counts and times the SQL statements of an engine.
+- Upload endpoints report through record_upload().
+
+With several worker processes every process has its own registry; Prometheus
+then scrapes each worker or the values are summed by a sidecar.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+# Upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+UPLOAD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        (REGISTRY if registry is None else registry).append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class CallbackGauge(_Metric):
+    """Gauge without labels whose value is read from a function when rendering."""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, function, registry=None):
+        super().__init__(name, documentation, registry=registry)
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        return self._header() + [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS, registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per bucket (not cumulative) counts, the last one is +Inf; then sum
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._values.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render(registry=None) -> str:
+    """All metrics of the registry in Prometheus text format."""
+    lines = []
+    for metric in REGISTRY if registry is None else registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route template and status",
+                        ("method", "route", "status"))
+HTTP_ERRORS = Counter("http_request_errors_total", "HTTP requests that failed with a 5xx status or an exception",
+                      ("method", "route"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route template",
+                         ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being processed")
+
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ("database", "operation"))
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "SQL statements that raised an error", ("database",))
+DB_LATENCY = Histogram("db_query_duration_seconds", "SQL statement duration", ("database", "operation"),
+                       buckets=DB_BUCKETS)
+
+UPLOADS = Counter("uploads_total", "Uploaded tour files by type and result", ("type", "status"))
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes received in uploaded tour files", ("type",))
+UPLOAD_LATENCY = Histogram("upload_ingest_duration_seconds", "Time to store, convert and import one uploaded file",
+                           ("type",), buckets=UPLOAD_BUCKETS)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording count, latency and errors of every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            HTTP_LATENCY.observe(time.perf_counter() - started, method, route)
+            HTTP_REQUESTS.inc(method, route, str(status))
+            if status >= 500:
+                HTTP_ERRORS.inc(method, route)
+
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "CREATE", "DROP", "ALTER", "BEGIN", "COMMIT", "WITH"}
+_instrumented = set()
+
+
+def _operation(statement: str) -> str:
+    keyword = statement.lstrip()[:8].split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in _OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine, database: str):
+    """
+    Counts and times the SQL statements of an engine (once per engine).
+
+    Args:
+        engine: SQLAlchemy engine
+        database (str): Value of the "database" label
+    """
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        operation = _operation(statement)
+        DB_QUERIES.inc(database, operation)
+        DB_LATENCY.observe(time.perf_counter() - started, database, operation)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_QUERY_ERRORS.inc(database)
+
+
+def record_upload(file_type: str, status: str, size: int, duration: float):
+    """Records one uploaded file (type: gpx/kml/kmz, status: success/warning/error/too_large)."""
+    UPLOADS.inc(file_type, status)
+    UPLOAD_BYTES.inc(file_type, amount=size)
+    UPLOAD_LATENCY.observe(duration, file_type)
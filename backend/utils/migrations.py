@@ -0,0 +1,160 @@
+"""
+Recorded schema migrations for the user database.
+
+Every migration runs once per database: after it succeeded its name is stored
+in schema_migrations, so a restart only reads that table (one SELECT) instead
+of checking every table, column and index again. Migrations run in the order of
+MIGRATIONS, each in its own transaction together with its record.
+
+Migrations must be safe on a database that create_all already created with the
+current models (new installations), so they check before they add something.
+Before pending migrations run, the tables of the current models that don't
+exist yet are created (create_all), so every migration finds its table. A
+migration that still finds no table returns False: it is not recorded and
+runs again on the next start.
+New schema changes are appended to MIGRATIONS with a new name; applied
+migrations are never renamed or changed.
+
+Run them with `python -m utils.migrations`; main.py and init_db.py run them on
+start as well.
+"""
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from utils.schema import ACTIVITY_INDEXES, USERS_ADDED_COLUMNS, USERS_DROPPED_INDEXES, USERS_INDEXES
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        name TEXT PRIMARY KEY,
+        applied_at TIMESTAMP NOT NULL
+    )
+"""
+
+
+def _columns(connection, table: str) -> set:
+    return {row[1] for row in connection.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def _users_columns(connection):
+    """Columns added to the users table after the initial schema (e.g. token_version)."""
+    existing = _columns(connection, "users")
+    if not existing:
+        return False
+    for column, definition in USERS_ADDED_COLUMNS.items():
+        if column not in existing:
+            logger.info(f"Adding column users.{column}")
+            connection.execute(text(f"ALTER TABLE users ADD COLUMN {column} {definition}"))
+
+
+def _users_indexes(connection):
+    if not _columns(connection, "users"):
+        return False
+    for statement in USERS_INDEXES.values():
+        connection.execute(text(statement))
+
+
+def _users_listing_indexes(connection):
+    """The listing indexes on COALESCE(created_at, '') replace those on the nullable created_at."""
+    for name in USERS_DROPPED_INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    return _users_indexes(connection)
+
+
+def _user_role_case(connection):
+    """Roles stored in lower case by early versions don't match the UserRole enum."""
+    if not _columns(connection, "users"):
+        return False
+    result = connection.execute(text("UPDATE users SET role = UPPER(role) WHERE role IN ('user', 'admin')"))
+    if result.rowcount:
+        logger.info(f"Fixed the role case of {result.rowcount} users")
+
+
+def _create_model_table(model_path: str):
+    """Creates the table of a model that was added after the initial schema."""
+    def migrate(connection):
+        module_name, class_name = model_path.rsplit(".", 1)
+        module = __import__(module_name, fromlist=[class_name])
+        getattr(module, class_name).__table__.create(bind=connection, checkfirst=True)
+    return migrate
+
+
+def _activity_indexes(connection):
+    if not _columns(connection, "user_activities"):
+        return False
+    for statement in ACTIVITY_INDEXES.values():
+        connection.execute(text(statement))
+
+
+# (name, function(connection)) in the order they are applied
+MIGRATIONS = [
+    ("0001_user_role_case", _user_role_case),
+    ("0002_users_token_version", _users_columns),
+    ("0003_users_listing_indexes", _users_indexes),
+    ("0004_refresh_tokens", _create_model_table("models.tokens.RefreshToken")),
+    ("0005_user_activities_timestamp_index", _activity_indexes),
+    ("0006_user_activity_daily", _create_model_table("models.activity.UserActivityDaily")),
+    ("0007_email_outbox", _create_model_table("models.outbox.OutboxEmail")),
+    ("0008_users_listing_null_created_at", _users_listing_indexes),
+    ("0009_maintenance_locks", _create_model_table("models.locks.MaintenanceLock")),
+]
+
+
+def applied_migrations(connection) -> set:
+    connection.execute(text(MIGRATIONS_TABLE_SQL))
+    return {row[0] for row in connection.execute(text("SELECT name FROM schema_migrations"))}
+
+
+def create_base_schema(engine):
+    """Creates the missing tables of the current models; existing tables are left to the migrations."""
+    import models  # noqa: F401 (registers all tables)
+    from database import Base
+
+    Base.metadata.create_all(bind=engine)
+
+
+def run_migrations(engine, migrations=None) -> list:
+    """
+    Applies the migrations that are not recorded in schema_migrations yet.
+
+    Args:
+        engine: SQLAlchemy engine connected to the user database
+        migrations (list): (name, function) pairs, defaults to MIGRATIONS
+
+    Returns:
+        list: Names of the migrations applied (and recorded) by this call
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    with engine.begin() as connection:
+        applied = applied_migrations(connection)
+    if any(name not in applied for name, _ in migrations):
+        create_base_schema(engine)
+
+    newly_applied = []
+    for name, migrate in migrations:
+        if name in applied:
+            continue
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            if migrate(connection) is False:
+                logger.info(f"Migration {name} deferred, its table doesn't exist yet")
+                continue
+            # A concurrently starting worker may have applied it meanwhile
+            connection.execute(text(
+                "INSERT OR IGNORE INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)"
+            ), {"name": name, "applied_at": datetime.utcnow()})
+        logger.info(f"Applied migration {name} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        newly_applied.append(name)
+    return newly_applied
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    applied = run_migrations(engine)
+    print(f"Applied {len(applied)} migrations: {', '.join(applied) or '-'}")
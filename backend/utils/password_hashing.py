@@ -0,0 +1,238 @@
+"""
+Password hashing off the event loop.
+
+A bcrypt hash or verification costs 100-300 ms of CPU. Called directly in an
+async handler it blocks the event loop for that time, so a burst of logins
+stalls every other request. The coroutines in this module run the work in a
+small dedicated thread pool instead (bcrypt releases the GIL while hashing).
+
+The pool size bounds how many hashes run at once, so logins can't take all
+CPU cores from the read endpoints. Waiting calls are queued up to
+PASSWORD_HASH_MAX_QUEUE; beyond that PasswordHashingBusyError is raised and
+the handlers answer 503 instead of piling up work. Queue and run times are
+recorded for the admin statistics endpoint.
+
+The bcrypt cost factor is taken from BCRYPT_ROUNDS, or calibrated against
+PASSWORD_HASH_TARGET_MS on the machine the API runs on. Calibrate once with
+
+    python -m utils.password_hashing --target-ms 250 --write
+
+or set PASSWORD_HASH_CALIBRATE=true to calibrate at startup. The result is
+kept in PASSWORD_HASH_CALIBRATION_FILE, so all worker processes (and later
+starts) use the same cost. Hashes with a different cost are replaced on the
+next successful login.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Number of passwords hashed or verified at the same time
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Maximum number of calls waiting for a free worker
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# Explicit bcrypt cost factor, takes precedence over the calibration
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+# passlib's default, used when neither BCRYPT_ROUNDS nor a calibration is available
+DEFAULT_BCRYPT_ROUNDS = 12
+# The calibration never goes below or above these costs
+MIN_BCRYPT_ROUNDS = int(os.getenv("MIN_BCRYPT_ROUNDS", "10"))
+MAX_BCRYPT_ROUNDS = int(os.getenv("MAX_BCRYPT_ROUNDS", "15"))
+# Duration of one hash the calibration aims for
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "250"))
+# Calibrate at startup if no calibration file exists yet
+PASSWORD_HASH_CALIBRATE = os.getenv("PASSWORD_HASH_CALIBRATE", "false").lower() == "true"
+# Stored calibration result, next to the database by default
+_database_dir = os.path.dirname(os.getenv("DATABASE_PATH", "")) if os.getenv("DATABASE_PATH") != ":memory:" else ""
+PASSWORD_HASH_CALIBRATION_FILE = os.getenv(
+    "PASSWORD_HASH_CALIBRATION_FILE", os.path.join(_database_dir or ".", "password_hash_calibration.json")
+)
+
+
+class PasswordHashingBusyError(Exception):
+    """Raised when more password operations are waiting than PASSWORD_HASH_MAX_QUEUE allows."""
+
+
+class PasswordHasher:
+    """
+    Runs CryptContext.hash and CryptContext.verify in a bounded thread pool.
+
+    Args:
+        context (CryptContext): passlib context doing the actual work
+        workers (int): Number of worker threads
+        max_queue (int): Maximum number of waiting calls
+    """
+
+    def __init__(self, context, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.context = context
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._started = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_time_total = 0.0
+        self._queue_time_max = 0.0
+        self._run_time_total = 0.0
+        self._run_time_max = 0.0
+
+    def _dequeue(self, job: dict):
+        """Takes a call off the waiting count, once; the caller holds _lock."""
+        if job["waiting"]:
+            job["waiting"] = False
+            self._waiting -= 1
+
+    def _run(self, job, submitted, function, *args):
+        started = time.perf_counter()
+        with self._lock:
+            self._dequeue(job)
+            self._running += 1
+            self._started += 1
+            queue_time = started - submitted
+            self._queue_time_total += queue_time
+            self._queue_time_max = max(self._queue_time_max, queue_time)
+        try:
+            return function(*args)
+        finally:
+            run_time = time.perf_counter() - started
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._run_time_total += run_time
+                self._run_time_max = max(self._run_time_max, run_time)
+
+    async def _submit(self, function, *args):
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise PasswordHashingBusyError(f"{self._waiting} password operations are already waiting")
+            self._waiting += 1
+        job = {"waiting": True}
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._run, job, time.perf_counter(), function, *args)
+        finally:
+            # A call cancelled while queued (client gone, timeout) never reaches _run
+            with self._lock:
+                self._dequeue(job)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(self.context.verify, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self._started or 1
+            completed = self._completed or 1
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "waiting": self._waiting,
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "queue_time_avg_ms": round(self._queue_time_total / started * 1000, 2),
+                "queue_time_max_ms": round(self._queue_time_max * 1000, 2),
+                "run_time_avg_ms": round(self._run_time_total / completed * 1000, 2),
+                "run_time_max_ms": round(self._run_time_max * 1000, 2),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def measure_bcrypt(rounds: int) -> float:
+    """Seconds one bcrypt hash with the given cost takes on this machine."""
+    from passlib.hash import bcrypt
+
+    hasher = bcrypt.using(rounds=rounds)
+    started = time.perf_counter()
+    hasher.hash("calibration password")
+    return time.perf_counter() - started
+
+
+def calibrate_bcrypt_rounds(target_ms: float = PASSWORD_HASH_TARGET_MS,
+                            min_rounds: int = MIN_BCRYPT_ROUNDS, max_rounds: int = MAX_BCRYPT_ROUNDS):
+    """
+    Find the highest bcrypt cost whose hash time stays within the target.
+
+    Every additional round doubles the work, so the cost is raised while the
+    next round is expected to stay within the target. min_rounds is a lower
+    bound for security and used even if it is slower than the target.
+
+    Returns:
+        tuple: (rounds, measured milliseconds per hash)
+    """
+    rounds = min_rounds
+    elapsed_ms = measure_bcrypt(rounds) * 1000
+    while rounds < max_rounds and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms = measure_bcrypt(rounds) * 1000
+    if elapsed_ms > target_ms:
+        logger.warning(f"bcrypt cost {rounds} takes {elapsed_ms:.0f} ms, more than the target of {target_ms:.0f} ms")
+    return rounds, elapsed_ms
+
+
+def write_calibration(rounds: int, elapsed_ms: float, path: str = PASSWORD_HASH_CALIBRATION_FILE):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"rounds": rounds, "hash_ms": round(elapsed_ms, 1), "calibrated_at": time.time()}, f)
+    # Atomic, other worker processes never read a partial file
+    os.replace(temp_path, path)
+
+
+def read_calibration(path: str = PASSWORD_HASH_CALIBRATION_FILE):
+    """Calibrated cost from the calibration file, None if there is no usable one."""
+    try:
+        with open(path) as f:
+            return int(json.load(f)["rounds"])
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable password hash calibration {path}: {e}")
+        return None
+
+
+def configured_bcrypt_rounds() -> int:
+    """bcrypt cost to hash new passwords with: BCRYPT_ROUNDS, the stored calibration or the default."""
+    if BCRYPT_ROUNDS:
+        return int(BCRYPT_ROUNDS)
+    rounds = read_calibration()
+    if rounds is not None:
+        return rounds
+    if PASSWORD_HASH_CALIBRATE:
+        rounds, elapsed_ms = calibrate_bcrypt_rounds()
+        logger.info(f"Calibrated bcrypt cost {rounds} ({elapsed_ms:.0f} ms per hash)")
+        try:
+            write_calibration(rounds, elapsed_ms)
+        except OSError as e:
+            logger.warning(f"Could not store the password hash calibration: {e}")
+        return rounds
+    return DEFAULT_BCRYPT_ROUNDS
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the bcrypt cost factor against a latency target")
+    parser.add_argument("--target-ms", type=float, default=PASSWORD_HASH_TARGET_MS, help="Target duration of one hash")
+    parser.add_argument("--min-rounds", type=int, default=MIN_BCRYPT_ROUNDS)
+    parser.add_argument("--max-rounds", type=int, default=MAX_BCRYPT_ROUNDS)
+    parser.add_argument("--write", action="store_true", help=f"Store the result in {PASSWORD_HASH_CALIBRATION_FILE}")
+    args = parser.parse_args()
+
+    rounds, elapsed_ms = calibrate_bcrypt_rounds(args.target_ms, args.min_rounds, args.max_rounds)
+    print(f"BCRYPT_ROUNDS={rounds}  ({elapsed_ms:.0f} ms per hash, target {args.target_ms:.0f} ms)")
+    if args.write:
+        write_calibration(rounds, elapsed_ms)
+        print(f"Stored in {PASSWORD_HASH_CALIBRATION_FILE}")
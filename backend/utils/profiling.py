@@ -0,0 +1,244 @@
+"""
+On-demand profiling of single requests for admins.
+
+An admin adds the header `X-Profile: 1` (or the query parameter `profile=1`)
+to a request; that request then runs under a sampling profiler (pyinstrument
+in async mode, which follows the request across awaits; cProfile if
+pyinstrument is not installed). The report is written to a ring buffer on
+disk (REQUEST_PROFILE_DIR, the newest REQUEST_PROFILE_MAX_REPORTS reports are
+kept) and the response carries its id in the X-Profile-Id header. Reports are
+listed and served by GET /api/admin/profiles.
+
+Requests without the flag only pass a check of the query string and the
+headers; requests of other users with the flag run unprofiled. With
+REQUEST_PROFILING=false the middleware is not installed at all.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "true").lower() in ("1", "true", "yes")
+REQUEST_PROFILE_DIR = os.getenv(
+    "REQUEST_PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "profiles"),
+)
+REQUEST_PROFILE_MAX_REPORTS = int(os.getenv("REQUEST_PROFILE_MAX_REPORTS", "50"))
+# Sampling interval of pyinstrument in seconds
+REQUEST_PROFILE_INTERVAL = float(os.getenv("REQUEST_PROFILE_INTERVAL", "0.001"))
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+_PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{12}-[0-9]+$")
+_QUERY_FLAG = re.compile(rb"(?:^|&)profile=(?:1|true)(?:&|$)")
+
+# Report formats: extension -> media type
+MEDIA_TYPES = {"html": "text/html; charset=utf-8", "txt": "text/plain; charset=utf-8"}
+
+
+class ProfileStore:
+    """
+    Ring buffer of profile reports in a directory.
+
+    Every report is a file <id>.<html|txt> with a <id>.json next to it that
+    describes the request. Ids sort by time; when more than max_reports are
+    stored, the oldest are deleted.
+    """
+
+    def __init__(self, directory: str = REQUEST_PROFILE_DIR, max_reports: int = REQUEST_PROFILE_MAX_REPORTS):
+        self.directory = directory
+        self.max_reports = max_reports
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def new_id(self) -> str:
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        return f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{sequence}"
+
+    def save(self, profile_id: str, report: str, extension: str, meta: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{profile_id}.{extension}"), "w", encoding="utf-8") as report_file:
+            report_file.write(report)
+        with open(os.path.join(self.directory, f"{profile_id}.json"), "w", encoding="utf-8") as meta_file:
+            json.dump({"id": profile_id, "format": extension, **meta}, meta_file)
+        self._trim()
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json") and _PROFILE_ID.match(name[:-5]))
+
+    def _trim(self):
+        with self._lock:
+            ids = self._ids()
+            for profile_id in ids[:max(len(ids) - self.max_reports, 0)]:
+                for extension in ("json", *MEDIA_TYPES):
+                    try:
+                        os.remove(os.path.join(self.directory, f"{profile_id}.{extension}"))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self) -> list:
+        """Descriptions of the stored reports, newest first."""
+        reports = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(os.path.join(self.directory, f"{profile_id}.json"), encoding="utf-8") as meta_file:
+                    reports.append(json.load(meta_file))
+            except (OSError, ValueError):
+                continue
+        return reports
+
+    def get(self, profile_id: str):
+        """(path, media type) of a report, None if it doesn't exist (or the id is invalid)."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        for extension, media_type in MEDIA_TYPES.items():
+            path = os.path.join(self.directory, f"{profile_id}.{extension}")
+            if os.path.exists(path):
+                return path, media_type
+        return None
+
+
+class _Profiler:
+    """pyinstrument if installed, otherwise cProfile."""
+
+    def __init__(self, interval: float):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self.extension = "txt"
+        else:
+            self._profiler = Profiler(interval=interval, async_mode="enabled")
+            self.extension = "html"
+
+    def start(self):
+        if self.extension == "html":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.extension == "html":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def report(self) -> str:
+        if self.extension == "html":
+            return self._profiler.output_html()
+        import io
+        import pstats
+        output = io.StringIO()
+        pstats.Stats(self._profiler, stream=output).sort_stats("cumulative").print_stats(80)
+        return output.getvalue()
+
+
+def profiling_requested(scope) -> bool:
+    if _QUERY_FLAG.search(scope.get("query_string", b"")):
+        return True
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER:
+            return value.strip().lower() in (b"1", b"true")
+    return False
+
+
+async def admin_username(scope):
+    """Username of the admin that sent the request, None for everyone else."""
+    from fastapi import HTTPException
+
+    from auth import get_current_active_user, get_current_user
+    from database import SessionLocal
+    from models.users import UserRole
+
+    authorization = dict(scope.get("headers", ())).get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    with SessionLocal() as db:
+        try:
+            user = await get_current_active_user(await get_current_user(token, db))
+        except HTTPException:
+            return None
+    return user.username if user.role == UserRole.ADMIN else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles requests flagged by an admin.
+
+    Args:
+        app: ASGI application
+        store (ProfileStore): Where reports are written
+        authorize: async function(scope) returning the username allowed to profile, or None
+        interval (float): Sampling interval of pyinstrument in seconds
+    """
+
+    def __init__(self, app, store: ProfileStore = None, authorize=admin_username,
+                 interval: float = REQUEST_PROFILE_INTERVAL):
+        self.app = app
+        self.store = store or profile_store
+        self.authorize = authorize
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        username = await self.authorize(scope)
+        if username is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = self.store.new_id()
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", ()),
+                                                   (PROFILE_ID_HEADER, profile_id.encode())]}
+            await send(message)
+
+        profiler = _Profiler(self.interval)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            duration_ms = (time.perf_counter() - started) * 1000
+            meta = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status,
+                "duration_ms": round(duration_ms, 1),
+                "user": username,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+            # Rendering the report takes a while for long requests, keep it off the event loop
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: self.store.save(profile_id, profiler.report(), profiler.extension, meta)
+                )
+                logger.info(f"Profiled {meta['method']} {meta['path']} for {username}: "
+                            f"{meta['duration_ms']} ms, report {profile_id}")
+            except Exception as e:
+                logger.error(f"Saving profile {profile_id} failed: {str(e)}")
+
+
+profile_store = ProfileStore()
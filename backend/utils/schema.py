@@ -0,0 +1,134 @@
+"""
+Schema management for the raw-SQL tour tables.
+
+The tours table is not managed by the SQLAlchemy models but written with raw
+SQL by import_gpx.py. This module creates it if needed and adds columns that
+were introduced after the initial schema, so existing databases keep working.
+The definitions for the model-managed user tables below are applied by the
+recorded migrations in utils/migrations.py.
+"""
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOURS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS tours (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        type TEXT,
+        date TEXT NOT NULL,
+        ebike BOOLEAN DEFAULT 0,
+        speed_kmh REAL DEFAULT 0,
+        distance_km REAL,
+        duration_s REAL,
+        elevation_up REAL DEFAULT 0,
+        elevation_down REAL DEFAULT 0,
+        start_lat REAL,
+        start_lon REAL,
+        komootid TEXT UNIQUE,
+        komoothref TEXT,
+        track_geojson TEXT NOT NULL,
+        metrics_version INTEGER DEFAULT 0,
+        source_format TEXT
+    );
+"""
+
+# Full-fidelity track points per tour, see utils/track_store.py
+TOUR_TRACKS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS tour_tracks (
+        tour_id INTEGER PRIMARY KEY REFERENCES tours(id) ON DELETE CASCADE,
+        point_count INTEGER NOT NULL,
+        codec TEXT NOT NULL,
+        lat BLOB NOT NULL,
+        lon BLOB NOT NULL,
+        elevation BLOB,
+        time BLOB,
+        segments BLOB
+    );
+"""
+
+# Columns added after the initial schema: name -> column definition
+TOURS_ADDED_COLUMNS = {
+    "metrics_version": "INTEGER DEFAULT 0",  # Version of the algorithms that derived the tour metrics
+    "source_format": "TEXT",  # Format of the imported file (gpx or kml), input of the tour type heuristic
+}
+
+# Columns added to the tour_tracks table after the initial schema: name -> column definition
+TOUR_TRACKS_ADDED_COLUMNS = {
+    "segments": "BLOB",  # Track and segment boundaries, NULL for a single segment
+}
+
+# Secondary indexes on the tours table: name -> CREATE statement
+TOURS_INDEXES = {
+    "idx_komootid": "CREATE INDEX IF NOT EXISTS idx_komootid ON tours(komootid)",
+}
+
+# Columns added to the users table after the initial schema: name -> column definition
+USERS_ADDED_COLUMNS = {
+    "token_version": "INTEGER NOT NULL DEFAULT 0",  # Bumped to revoke all access tokens of a user
+}
+
+# Indexes on the users table, same names as in models/users.py: name -> CREATE statement
+USERS_INDEXES = {
+    "ix_users_listing": "CREATE INDEX IF NOT EXISTS ix_users_listing ON users(COALESCE(created_at, ''), username)",
+    "ix_users_status_listing": "CREATE INDEX IF NOT EXISTS ix_users_status_listing "
+                               "ON users(status, COALESCE(created_at, ''), username)",
+}
+
+# Indexes of the users table replaced by USERS_INDEXES, they didn't cover users without created_at
+USERS_DROPPED_INDEXES = ("ix_users_created_at", "ix_users_status_created_at")
+
+# Indexes on the user_activities table, same names as in models/activity.py: name -> CREATE statement
+ACTIVITY_INDEXES = {
+    "ix_user_activities_timestamp": "CREATE INDEX IF NOT EXISTS ix_user_activities_timestamp ON user_activities(timestamp)",
+}
+
+_ensured = set()
+
+
+def ensure_tours_schema(engine):
+    """
+    Create the tour tables and add missing columns and indexes.
+
+    The check runs once per engine and process; later calls return immediately.
+
+    Args:
+        engine: SQLAlchemy engine connected to the tour database
+    """
+    key = str(engine.url)
+    if key in _ensured:
+        return
+
+    with engine.begin() as connection:
+        connection.execute(text(TOURS_TABLE_SQL))
+        connection.execute(text(TOUR_TRACKS_TABLE_SQL))
+
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(tours)"))}
+        for column, definition in TOURS_ADDED_COLUMNS.items():
+            if column not in existing:
+                logger.info(f"Adding column tours.{column}")
+                connection.execute(text(f"ALTER TABLE tours ADD COLUMN {column} {definition}"))
+
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(tour_tracks)"))}
+        for column, definition in TOUR_TRACKS_ADDED_COLUMNS.items():
+            if column not in existing:
+                logger.info(f"Adding column tour_tracks.{column}")
+                connection.execute(text(f"ALTER TABLE tour_tracks ADD COLUMN {column} {definition}"))
+
+        create_tours_indexes(connection)
+
+    _ensured.add(key)
+
+
+def drop_tours_indexes(connection):
+    """Drop the secondary indexes of the tours table, e.g. before a bulk load."""
+    for name in TOURS_INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def create_tours_indexes(connection):
+    """Create the secondary indexes of the tours table if they don't exist."""
+    for statement in TOURS_INDEXES.values():
+        connection.execute(text(statement))
+
@@ -0,0 +1,253 @@
+"""
+Slow-query log and per-statement statistics.
+
+instrument_engine() times every SQL statement of an engine (raw text() SQL of
+main.py and import_gpx.py as well as the ORM queries of auth.py and
+routers/users.py). Statements are grouped by their fingerprint: the SQL with
+literals and bind parameters replaced by ?, IN lists collapsed and whitespace
+normalized, so the same query with other values counts as one statement.
+
+Statements slower than SLOW_QUERY_THRESHOLD_MS are logged as a warning with
+the fingerprint, the shape of the parameters (names and types, never values),
+the duration and the EXPLAIN QUERY PLAN of the statement. The plan is taken
+on the same connection right after the statement and kept per fingerprint for
+SLOW_QUERY_PLAN_TTL_SECONDS, so a statement that is slow on every call is not
+explained on every call; while one thread explains a fingerprint, the others
+log without a plan instead of explaining it again.
+
+Taking the plan is synchronous: it runs inside the request's statement
+execution, within its open transaction, and adds the (usually sub-millisecond)
+time of the EXPLAIN to a request that is already slow. Set
+SLOW_QUERY_EXPLAIN=false to log slow statements without their plan.
+
+GET /api/admin/slow-queries returns the statistics per fingerprint.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from functools import partial
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_PLAN_TTL_SECONDS = float(os.getenv("SLOW_QUERY_PLAN_TTL_SECONDS", "300"))
+# Whether slow statements are explained (synchronously, on the request's connection)
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+# Maximum number of fingerprints with statistics, further statements are counted as "<other>"
+SLOW_QUERY_MAX_FINGERPRINTS = int(os.getenv("SLOW_QUERY_MAX_FINGERPRINTS", "1000"))
+
+OTHER_FINGERPRINT = "<other>"
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.I)
+_PARAMETERS = re.compile(r":\w+|%\(\w+\)s|\?")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_ROWS = re.compile(r"(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Statements that can't be explained
+_NOT_EXPLAINABLE = ("EXPLAIN", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "CREATE",
+                    "DROP", "ALTER", "ANALYZE", "VACUUM")
+
+
+def fingerprint(statement: str) -> str:
+    """Normalized SQL of a statement: literals and parameters as ?, IN lists as (...)."""
+    sql = _COMMENTS.sub(" ", statement)
+    sql = _STRINGS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    sql = _PARAMETERS.sub("?", sql)
+    sql = _LISTS.sub("(...)", sql)
+    sql = _VALUES_ROWS.sub(r"\1", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def parameter_shape(parameters, executemany: bool = False) -> str:
+    """Names and types of the parameters, e.g. "{limit: int, username: str}" (no values)."""
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = parameter_shape(parameters[0]) if parameters else "()"
+        return f"{len(parameters)} x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in sorted(parameters.items())) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+class SlowQueryLog:
+    """
+    Statistics per statement fingerprint and the log of slow statements.
+
+    Args:
+        threshold_ms (float): Statements at or above this duration are slow
+        plan_ttl (float): Seconds an EXPLAIN QUERY PLAN is reused for the same fingerprint
+        max_fingerprints (int): Maximum number of fingerprints with their own statistics
+        explain_plans (bool): Whether instrumented engines take the plan of slow statements
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, plan_ttl: float = SLOW_QUERY_PLAN_TTL_SECONDS,
+                 max_fingerprints: int = SLOW_QUERY_MAX_FINGERPRINTS, explain_plans: bool = SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.plan_ttl = plan_ttl
+        self.max_fingerprints = max_fingerprints
+        self.explain_plans = explain_plans
+        self._lock = threading.Lock()
+        # (database, fingerprint) -> statistics
+        self._stats = {}
+        # SQL string -> fingerprint; SQLAlchemy reuses the compiled strings, so most lookups hit
+        self._fingerprints = {}
+        # (database, fingerprint) -> (monotonic time, plan); guarded by _lock
+        self._plans = {}
+        self._instrumented = set()
+
+    def _fingerprint(self, statement: str) -> str:
+        result = self._fingerprints.get(statement)
+        if result is None:
+            result = fingerprint(statement)
+            if len(self._fingerprints) >= 4 * self.max_fingerprints:
+                self._fingerprints.clear()
+            self._fingerprints[statement] = result
+        return result
+
+    def record(self, database: str, statement: str, duration_ms: float, explain=None,
+               parameters=None, executemany: bool = False):
+        """
+        Adds a statement to the statistics and logs it if it was slow.
+
+        Args:
+            database (str): Name of the database (engine)
+            statement (str): SQL as sent to the driver
+            duration_ms (float): Execution time
+            explain: function() returning the query plan, only called for slow statements
+            parameters: Bind parameters, only their shape is logged
+            executemany (bool): Whether parameters is a list of parameter sets
+        """
+        sql = self._fingerprint(statement)
+        slow = duration_ms >= self.threshold_ms
+        with self._lock:
+            key = (database, sql)
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    key = (database, OTHER_FINGERPRINT)
+                    stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "slow": 0, "plan": None}
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            if duration_ms > stats["max_ms"]:
+                stats["max_ms"] = duration_ms
+            if slow:
+                stats["slow"] += 1
+        if not slow:
+            return
+
+        plan = self._plan(key, statement, explain)
+        if plan is not None:
+            with self._lock:
+                stats["plan"] = plan
+        logger.warning(
+            f"Slow query ({duration_ms:.0f} ms, {database}): {sql}",
+            extra={
+                "database": database,
+                "duration_ms": round(duration_ms, 2),
+                "fingerprint": sql,
+                "parameters": parameter_shape(parameters, executemany),
+                "plan": plan,
+            },
+        )
+
+    def _plan(self, key, statement: str, explain):
+        if explain is None or statement.lstrip()[:9].upper().startswith(_NOT_EXPLAINABLE):
+            return None
+        with self._lock:
+            cached = self._plans.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.plan_ttl:
+                return cached[1]
+            # Claim the fingerprint, concurrent slow statements use the previous plan (or none) meanwhile
+            self._plans[key] = (time.monotonic(), cached[1] if cached is not None else None)
+        try:
+            plan = explain()
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {e}"]
+        with self._lock:
+            self._plans[key] = (time.monotonic(), plan)
+        return plan
+
+    def instrument(self, engine, database: str):
+        """Times the statements of an engine (once per engine)."""
+        if id(engine) in self._instrumented:
+            return
+        self._instrumented.add(id(engine))
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            duration_ms = (time.perf_counter() - conn.info["slow_query_started"].pop()) * 1000
+            explain = None
+            logged_parameters = parameters
+            if duration_ms >= self.threshold_ms:
+                if self.explain_plans:
+                    explain = partial(explain_query_plan, conn, statement, parameters, executemany)
+                # SQLite gets positional parameters; the compiled statement knows their names
+                names = getattr(getattr(context, "compiled", None), "positiontup", None)
+                if names and not executemany and len(names) == len(parameters):
+                    logged_parameters = dict(zip(names, parameters))
+            self.record(database, statement, duration_ms, explain, logged_parameters, executemany)
+
+        @event.listens_for(engine, "handle_error")
+        def _error(context):
+            stack = context.connection.info.get("slow_query_started") if context.connection is not None else None
+            if stack:
+                stack.pop()
+
+    def statements(self, sort: str = "total_ms", limit: int = 50) -> list:
+        """Statistics per fingerprint, sorted descending by total_ms, max_ms, count or slow."""
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+        result = []
+        for (database, sql), stats in items:
+            result.append({
+                "database": database,
+                "fingerprint": sql,
+                "count": stats["count"],
+                "slow": stats["slow"],
+                "total_ms": round(stats["total_ms"], 2),
+                "mean_ms": round(stats["total_ms"] / stats["count"], 3),
+                "max_ms": round(stats["max_ms"], 2),
+                "plan": stats["plan"],
+            })
+        result.sort(key=lambda entry: entry[sort], reverse=True)
+        return result[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._plans.clear()
+
+
+def explain_query_plan(conn, statement: str, parameters, executemany: bool = False) -> list:
+    """EXPLAIN QUERY PLAN of a statement on the DBAPI connection it just ran on (SQLite)."""
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def instrument_engine(engine, database: str):
+    """Adds the statements of an engine to the slow-query log, see SlowQueryLog.instrument."""
+    slow_query_log.instrument(engine, database)
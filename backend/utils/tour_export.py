@@ -0,0 +1,230 @@
+"""
+Streaming export of tours as GPX, GeoJSON and KML, and of many tours as a ZIP.
+
+Every writer is a generator of text chunks, so a response can be streamed while
+it is being generated. Tracks are read from tour_tracks (with elevation and
+time) and fall back to the coordinates in tours.track_geojson for tours that
+have no stored track. The ZIP writer uses zipfile on an unseekable sink that
+is drained after every write: it needs neither temp files nor memory that
+grows with the number of tours beyond the archive's central directory.
+"""
+import io
+import json
+import re
+import zipfile
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+from sqlalchemy import text
+
+from .track_store import decode_track, iter_points
+
+# format -> (file extension, media type)
+EXPORT_FORMATS = {
+    "gpx": ("gpx", "application/gpx+xml"),
+    "geojson": ("geojson", "application/geo+json"),
+    "kml": ("kml", "application/vnd.google-earth.kml+xml"),
+}
+
+# Number of track points written per chunk
+POINTS_PER_CHUNK = 1000
+# Number of tours loaded per query by the bulk export
+TOURS_PER_BATCH = 50
+
+EXPORT_TOUR_SQL = """
+    SELECT t.id, t.name, t.type, t.date, t.distance_km, t.duration_s, t.speed_kmh,
+           t.elevation_up, t.elevation_down, t.ebike, t.komootid, t.komoothref, t.track_geojson,
+           tt.point_count, tt.codec, tt.lat, tt.lon, tt.elevation, tt.time, tt.segments
+    FROM tours t LEFT JOIN tour_tracks tt ON tt.tour_id = t.id
+"""
+
+
+def _mapping(row):
+    return row._mapping if hasattr(row, "_mapping") else row
+
+
+def tour_points(row) -> list:
+    """Returns the (lat, lon, elevation, epoch_time) points of an EXPORT_TOUR_SQL row."""
+    row = _mapping(row)
+    if row["codec"] is not None:
+        return list(iter_points(decode_track(row)))
+    try:
+        coordinates = json.loads(row["track_geojson"]).get("coordinates", [])
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return []
+    return [(coord[1], coord[0], coord[2] if len(coord) > 2 else None, None) for coord in coordinates]
+
+
+def _format_time(epoch) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _chunks(points, format_point):
+    for start in range(0, len(points), POINTS_PER_CHUNK):
+        yield "".join(format_point(point) for point in points[start:start + POINTS_PER_CHUNK])
+
+
+def _gpx_point(point):
+    lat, lon, elevation, epoch = point
+    xml = f'<trkpt lat="{lat!r}" lon="{lon!r}">'
+    if elevation is not None:
+        xml += f"<ele>{elevation!r}</ele>"
+    if epoch is not None:
+        xml += f"<time>{_format_time(epoch)}</time>"
+    return xml + "</trkpt>\n"
+
+
+def write_gpx(tour, points):
+    """Yields a GPX 1.1 document; the Komoot link is kept so a re-import detects duplicates."""
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<gpx version="1.1" creator="Tourmanager" xmlns="http://www.topografix.com/GPX/1/1">\n'
+           f'<metadata><name>{escape(tour["name"])}</name><time>{escape(tour["date"])}</time></metadata>\n'
+           f'<trk><name>{escape(tour["name"])}</name>')
+    if tour["komoothref"]:
+        yield f'<link href={quoteattr(tour["komoothref"])}/>'
+    if tour["type"]:
+        yield f'<type>{escape(tour["type"])}</type>'
+    yield "<trkseg>\n"
+    yield from _chunks(points, _gpx_point)
+    yield "</trkseg></trk>\n</gpx>\n"
+
+
+def _geojson_point(point):
+    lat, lon, elevation, _ = point
+    return f"[{lon!r},{lat!r},{elevation!r}]" if elevation is not None else f"[{lon!r},{lat!r}]"
+
+
+def write_geojson(tour, points):
+    """Yields a GeoJSON Feature; point times are stored in properties.coordTimes."""
+    properties = {key: tour[key] for key in (
+        "id", "name", "type", "date", "distance_km", "duration_s", "speed_kmh",
+        "elevation_up", "elevation_down", "komootid", "komoothref"
+    )}
+    properties["ebike"] = bool(tour["ebike"])
+    if points and any(point[3] is not None for point in points):
+        properties["coordTimes"] = [_format_time(p[3]) if p[3] is not None else None for p in points]
+
+    yield f'{{"type": "Feature", "properties": {json.dumps(properties)}, "geometry": {{"type": "LineString", "coordinates": ['
+    first = True
+    for chunk in _chunks(points, lambda point: "," + _geojson_point(point)):
+        yield chunk[1:] if first else chunk
+        first = False
+    yield "]}}\n"
+
+
+def write_kml(tour, points):
+    """Yields a KML 2.2 document with a gx:Track if the points have times, otherwise a LineString."""
+    name = escape(tour["name"])
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+           f'<Document><name>{name}</name>\n<Placemark><name>{name}</name>\n')
+    if points and all(point[3] is not None for point in points):
+        yield "<gx:Track>\n"
+        yield from _chunks(points, lambda point: f"<when>{_format_time(point[3])}</when>\n")
+        yield from _chunks(points, lambda point: (
+            f"<gx:coord>{point[1]!r} {point[0]!r}{' ' + repr(point[2]) if point[2] is not None else ''}</gx:coord>\n"
+        ))
+        yield "</gx:Track>\n"
+    else:
+        yield "<LineString><coordinates>\n"
+        yield from _chunks(points, lambda point: (
+            f"{point[1]!r},{point[0]!r}{',' + repr(point[2]) if point[2] is not None else ''}\n"
+        ))
+        yield "</coordinates></LineString>\n"
+    yield "</Placemark>\n</Document>\n</kml>\n"
+
+
+WRITERS = {"gpx": write_gpx, "geojson": write_geojson, "kml": write_kml}
+
+
+def export_tour(row, export_format):
+    """Yields the export of one EXPORT_TOUR_SQL row as encoded chunks."""
+    tour = _mapping(row)
+    for chunk in WRITERS[export_format](tour, tour_points(tour)):
+        yield chunk.encode("utf-8")
+
+
+def export_filename(tour, export_format) -> str:
+    """'<id>_<name>.<ext>' with the name reduced to characters that are safe in file names."""
+    name = re.sub(r"[^\w.-]+", "_", tour["name"] or "", flags=re.ASCII).strip("._")[:80] or "tour"
+    return f"{tour['id']}_{name}.{EXPORT_FORMATS[export_format][0]}"
+
+
+def iter_export_rows(engine, where="", params=None):
+    """
+    Yields EXPORT_TOUR_SQL rows ordered by id, TOURS_PER_BATCH at a time.
+
+    Every batch uses a short-lived connection (keyset pagination on the id), so
+    a slow download doesn't keep a read transaction open for its whole duration.
+    """
+    last_id = 0
+    while True:
+        with engine.connect() as connection:
+            rows = connection.execute(
+                text(f"{EXPORT_TOUR_SQL} WHERE t.id > :last_id {where} ORDER BY t.id LIMIT :limit"),
+                {**(params or {}), "last_id": last_id, "limit": TOURS_PER_BATCH}
+            ).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable file object collecting what zipfile writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    """
+    Yields a ZIP archive while it is written.
+
+    Args:
+        entries: Iterable of (file name, date_time tuple, iterable of bytes chunks)
+    """
+    sink = _ZipSink()
+    # zipfile writes data descriptors after each entry since the sink can't seek back
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, date_time, chunks in entries:
+            info = zipfile.ZipInfo(filename, date_time=date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, "w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            # Rest of the compressed data and the data descriptor
+            yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+
+def _zip_date_time(date):
+    try:
+        timestamp = datetime.fromisoformat(date.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return (1980, 1, 1, 0, 0, 0)
+    return timestamp.timetuple()[:6] if timestamp.year >= 1980 else (1980, 1, 1, 0, 0, 0)
+
+
+def export_zip(rows, export_format):
+    """Yields a ZIP archive with one file per tour of the given rows."""
+    return stream_zip(
+        (export_filename(_mapping(row), export_format), _zip_date_time(_mapping(row)["date"]), export_tour(row, export_format))
+        for row in rows
+    )
@@ -0,0 +1,108 @@
+"""
+Derived tour metrics.
+
+Speed, distance, moving time, elevation gain and the tour type/e-bike
+heuristics are computed here, both at import time and by the backfill
+engine (backfill_metrics.py). Bump METRICS_VERSION whenever one of the
+algorithms changes, so the backfill re-derives the metrics of existing tours.
+"""
+
+# Version of the metric algorithms, stored per tour in tours.metrics_version
+METRICS_VERSION = 1
+
+
+def clean_tour_name(tour_name: str) -> str:
+    """Removes the '(Completed)' marker Komoot adds to recorded tours"""
+    if '(Completed)' in tour_name:
+        tour_name = tour_name.replace('(Completed)', '').strip()
+    return tour_name
+
+
+def is_ebike_tour(tour_name: str) -> bool:
+    """Detects e-bike tours based on the tour name"""
+    tour_name_lower = tour_name.lower()
+    return 'e-bike' in tour_name_lower or 'ebike' in tour_name_lower or 'husq' in tour_name_lower
+
+
+def classify_tour_type(tour_name: str, speed_kmh: float, file_ext: str = '') -> str:
+    """
+    Determines the tour type from the tour name, falling back to the average speed.
+
+    Args:
+        tour_name (str): Cleaned tour name
+        speed_kmh (float): Average moving speed in km/h
+        file_ext (str): Extension of the original file, e.g. '.kml'
+
+    Returns:
+        str: One of 'Bike', 'Hike', 'Inline' or 'Undefined'
+    """
+    # Tour-Typ basierend auf Name bestimmen
+    tour_name_lower = tour_name.lower()
+    if 'fahrradtour' in tour_name_lower:
+        tour_type = 'Bike'
+    elif 'wanderung' in tour_name_lower:
+        tour_type = 'Hike'
+    elif 'inline' in tour_name_lower:
+        tour_type = 'Inline'
+    elif 'mountainbike' in tour_name_lower:
+        tour_type = 'Bike'
+    elif 'e-bike' in tour_name_lower:
+        tour_type = 'Bike'
+    else:
+        tour_type = 'Undefined'
+
+    # Tour-Typ korrigieren falls "Undefined" basierend auf Geschwindigkeit
+    if tour_type == 'Undefined' and speed_kmh > 0:
+        if speed_kmh < 8:
+            tour_type = 'Hike'
+        elif 8 <= speed_kmh < 15:
+            tour_type = 'Inline'
+        else:
+            tour_type = 'Bike'
+
+    # Für KML Dateien: Wenn die Geschwindigkeit zwischen 8 und 15 km/h ist und der Typ nicht explizit definiert wurde,
+    # dann ist es wahrscheinlich eine Inline-Tour
+    if file_ext == '.kml' and 8 <= speed_kmh < 15 and tour_type not in ['Inline']:
+        tour_type = 'Inline'
+
+    return tour_type
+
+
+def derive_metrics(gpx, tour_name: str, file_ext: str = '') -> dict:
+    """
+    Computes all derived metrics of a tour from its parsed GPX data.
+
+    Args:
+        gpx (gpxpy.gpx.GPX): Parsed track data
+        tour_name (str): Cleaned tour name
+        file_ext (str): Extension of the original file, e.g. '.kml'
+
+    Returns:
+        dict: type, ebike, speed_kmh, distance_km, duration_s, elevation_up and
+              elevation_down, rounded the way they are stored in the database
+    """
+    moving_data = gpx.get_moving_data()
+
+    # Höhendaten berechnen
+    uphill, downhill = gpx.get_uphill_downhill()
+    elevation_up = uphill if uphill else 0.0
+    elevation_down = downhill if downhill else 0.0
+
+    # Geschwindigkeit berechnen (km/h)
+    speed_kmh = 0.0
+    distance_km = 0.0
+    if moving_data and moving_data.moving_time and moving_data.moving_time > 0:
+        # Geschwindigkeit = Distanz (km) / Zeit (h)
+        distance_km = moving_data.moving_distance / 1000
+        time_hours = moving_data.moving_time / 3600
+        speed_kmh = distance_km / time_hours
+
+    return {
+        "type": classify_tour_type(tour_name, speed_kmh, file_ext),
+        "ebike": is_ebike_tour(tour_name),
+        "speed_kmh": round(speed_kmh, 2),
+        "distance_km": distance_km,
+        "duration_s": moving_data.moving_time if moving_data else 0,
+        "elevation_up": round(elevation_up, 2),
+        "elevation_down": round(elevation_down, 2),
+    }
@@ -0,0 +1,218 @@
+"""
+Full-fidelity track storage.
+
+Besides the [lon, lat] LineString in tours.track_geojson, which the map
+endpoints use, every tour keeps its complete track in the tour_tracks table:
+one row per tour with four typed columns (latitude, longitude, elevation and
+epoch time), each stored as a zlib-compressed little-endian array.
+
+    lat, lon    float64
+    elevation   float32 (NaN where a point has no elevation, NULL if none has)
+    time        float64 seconds since the epoch, UTC (NaN / NULL like elevation)
+    segments    uint32 pairs (index of the first point, track number) per
+                track segment; NULL for a track with a single segment
+
+The segments keep the track and segment boundaries of the source file, so
+metrics derived from a stored track (pauses, gaps) match those at import.
+
+The list endpoints never read this table. Decoded columns are plain bytes and
+can be wrapped without copying, e.g. with numpy.frombuffer (see as_numpy).
+"""
+import calendar
+import math
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+
+from sqlalchemy import text
+
+# Identifies the encoding of the blobs, stored per row
+TRACK_CODEC = "zlib-le-v1"
+COMPRESSION_LEVEL = 6
+
+# Array type codes and matching NumPy dtypes of the columns
+COLUMN_TYPES = {
+    "lat": ("d", "<f8"),
+    "lon": ("d", "<f8"),
+    "elevation": ("f", "<f4"),
+    "time": ("d", "<f8"),
+}
+
+# Array type code of the segments column
+SEGMENT_TYPE = "I"
+
+# Decoded track: point_count, the columns as bytes objects with little-endian values (or None)
+# and the segments as a tuple of (first point, track number) pairs
+TrackColumns = namedtuple("TrackColumns", ["point_count", "lat", "lon", "elevation", "time", "segments"],
+                          defaults=[((0, 0),)])
+
+_NAN = float("nan")
+
+
+def to_epoch(timestamp) -> float:
+    """Converts a datetime to seconds since the epoch; naive datetimes are taken as UTC."""
+    return calendar.timegm(timestamp.utctimetuple()) + timestamp.microsecond / 1e6
+
+
+def _pack(type_code, values):
+    values = array(type_code, values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return zlib.compress(values.tobytes(), COMPRESSION_LEVEL)
+
+
+def encode_track(lats, lons, elevations, times, segments=None) -> dict:
+    """
+    Encodes the columns of a track into the values of a tour_tracks row.
+
+    Args:
+        lats (list of float): Latitudes
+        lons (list of float): Longitudes
+        elevations (list of float or None): Elevations in meters
+        times (list of datetime or None): Timestamps of the points
+        segments (list of tuple, optional): (first point, track number) per segment,
+            None for a single segment
+
+    Returns:
+        dict: point_count, codec and the compressed lat, lon, elevation, time and segments blobs
+    """
+    has_elevation = any(value is not None for value in elevations)
+    has_time = any(value is not None for value in times)
+    if segments is not None and list(segments) in ([], [(0, 0)]):
+        segments = None
+
+    return {
+        "point_count": len(lats),
+        "codec": TRACK_CODEC,
+        "lat": _pack("d", lats),
+        "lon": _pack("d", lons),
+        "elevation": _pack("f", (_NAN if value is None else value for value in elevations)) if has_elevation else None,
+        "time": _pack("d", (_NAN if value is None else to_epoch(value) for value in times)) if has_time else None,
+        "segments": _pack(SEGMENT_TYPE, (value for segment in segments for value in segment)) if segments else None,
+    }
+
+
+def track_from_gpx(gpx) -> dict:
+    """Collects all track points of a gpxpy object and encodes them with their segments."""
+    lats, lons, elevations, times, segments = [], [], [], [], []
+    for track_number, track in enumerate(gpx.tracks):
+        for segment in track.segments:
+            if segment.points:
+                segments.append((len(lats), track_number))
+            for point in segment.points:
+                lats.append(point.latitude)
+                lons.append(point.longitude)
+                elevations.append(point.elevation)
+                times.append(point.time)
+    return encode_track(lats, lons, elevations, times, segments)
+
+
+def decode_track(row) -> TrackColumns:
+    """
+    Decompresses a tour_tracks row.
+
+    Args:
+        row: Row or mapping with point_count, codec, lat, lon, elevation, time and
+            optionally segments
+
+    Returns:
+        TrackColumns: Uncompressed little-endian column bytes
+    """
+    row = row._mapping if hasattr(row, "_mapping") else row
+    if row["codec"] != TRACK_CODEC:
+        raise ValueError(f"Unsupported track codec: {row['codec']}")
+
+    def unpack(blob):
+        return zlib.decompress(blob) if blob is not None else None
+
+    columns = TrackColumns(
+        point_count=row["point_count"],
+        lat=unpack(row["lat"]),
+        lon=unpack(row["lon"]),
+        elevation=unpack(row["elevation"]),
+        time=unpack(row["time"]),
+    )
+    segments = row["segments"] if "segments" in row else None
+    if segments is None:
+        return columns
+    values = array(SEGMENT_TYPE)
+    values.frombytes(zlib.decompress(segments))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return columns._replace(segments=tuple(zip(values[::2], values[1::2])))
+
+
+def as_arrays(columns: TrackColumns) -> dict:
+    """Returns the columns of a decoded track as array.array objects (None for missing columns)."""
+    result = {}
+    for name, (type_code, _) in COLUMN_TYPES.items():
+        data = getattr(columns, name)
+        if data is None:
+            result[name] = None
+            continue
+        values = array(type_code)
+        values.frombytes(data)
+        if sys.byteorder == "big":
+            values.byteswap()
+        result[name] = values
+    return result
+
+
+def as_numpy(columns: TrackColumns) -> dict:
+    """
+    Wraps the columns of a decoded track in read-only NumPy arrays without copying.
+
+    NumPy is an optional dependency and only imported when this is called.
+    """
+    import numpy as np
+
+    return {
+        name: np.frombuffer(getattr(columns, name), dtype=dtype) if getattr(columns, name) is not None else None
+        for name, (_, dtype) in COLUMN_TYPES.items()
+    }
+
+
+def iter_points(columns: TrackColumns):
+    """Yields (lat, lon, elevation, epoch_time) tuples; missing values are None."""
+    arrays = as_arrays(columns)
+    elevations = arrays["elevation"]
+    times = arrays["time"]
+    for i in range(columns.point_count):
+        elevation = elevations[i] if elevations is not None else None
+        timestamp = times[i] if times is not None else None
+        yield (
+            arrays["lat"][i],
+            arrays["lon"][i],
+            None if elevation is None or math.isnan(elevation) else elevation,
+            None if timestamp is None or math.isnan(timestamp) else timestamp,
+        )
+
+
+def iter_segments(columns: TrackColumns):
+    """Yields (track number, points) per segment, with the points as returned by iter_points."""
+    points = list(iter_points(columns))
+    starts = [start for start, _ in columns.segments]
+    for (start, track_number), end in zip(columns.segments, starts[1:] + [len(points)]):
+        yield track_number, points[start:end]
+
+
+INSERT_TRACK_SQL = """
+    INSERT OR REPLACE INTO tour_tracks (tour_id, point_count, codec, lat, lon, elevation, time, segments)
+    VALUES (:tour_id, :point_count, :codec, :lat, :lon, :elevation, :time, :segments)
+"""
+
+
+def store_track(connection, tour_id: int, track: dict):
+    """Writes the encoded track of a tour (see encode_track) within the caller's transaction."""
+    connection.execute(text(INSERT_TRACK_SQL), {"tour_id": tour_id, **track})
+
+
+def load_track(connection, tour_id: int):
+    """Loads and decodes the stored track of a tour, or returns None if the tour has none."""
+    row = connection.execute(
+        text("SELECT point_count, codec, lat, lon, elevation, time, segments FROM tour_tracks "
+             "WHERE tour_id = :tour_id"),
+        {"tour_id": tour_id}
+    ).fetchone()
+    return decode_track(row) if row else None
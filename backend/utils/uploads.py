@@ -0,0 +1,121 @@
+"""
+Size limits for uploaded tour files.
+
+Starlette's multipart parser reads the whole request body before the upload
+handlers run; it keeps each file in a SpooledTemporaryFile (in memory up to
+1 MB, on disk beyond that) that the handlers hand to the parsers directly.
+Limits therefore have to act before parsing:
+
+- UploadSizeLimitMiddleware bounds the bytes received per upload request:
+  a Content-Length above UPLOAD_MAX_REQUEST_SIZE is rejected with 413 before
+  any body is read, and a body that grows beyond it while it is received
+  (chunked, or a wrong Content-Length) is cut off with 413 as soon as the
+  limit is crossed. At most UPLOAD_MAX_REQUEST_SIZE bytes are ever spooled.
+- check_file_size() checks each parsed file against UPLOAD_MAX_FILE_SIZE. It
+  runs after parsing, so it rejects the file but doesn't reduce what was
+  received (that is bounded by the request limit).
+"""
+import json
+import os
+
+# Maximum size of a single uploaded file
+UPLOAD_MAX_FILE_SIZE = int(os.getenv("UPLOAD_MAX_FILE_SIZE", str(50 * 1024 * 1024)))  # 50 MB
+# Maximum size of the body of one upload request (all files plus multipart overhead)
+UPLOAD_MAX_REQUEST_SIZE = int(os.getenv("UPLOAD_MAX_REQUEST_SIZE", str(200 * 1024 * 1024)))  # 200 MB
+
+# Routes whose request bodies are limited by UploadSizeLimitMiddleware
+UPLOAD_PATHS = ("/api/tours/upload", "/api/tours/upload/batch")
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the per-file or per-request size limit."""
+
+    def __init__(self, message: str, limit: int):
+        super().__init__(message)
+        self.limit = limit
+
+
+def check_file_size(upload, max_file_size: int = UPLOAD_MAX_FILE_SIZE) -> int:
+    """
+    Size of a parsed UploadFile, rewound to the start for the parsers.
+
+    Raises:
+        UploadTooLargeError: If the file exceeds max_file_size
+    """
+    size = upload.size
+    if size is None:
+        upload.file.seek(0, os.SEEK_END)
+        size = upload.file.tell()
+    upload.file.seek(0)
+    if size > max_file_size:
+        raise UploadTooLargeError(
+            f"File {upload.filename} exceeds the maximum size of {max_file_size // (1024 * 1024)} MB",
+            max_file_size
+        )
+    return size
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that limits the request body of the upload routes.
+
+    Args:
+        app: ASGI application
+        paths: Request paths the limit applies to
+        max_bytes (int): Maximum number of body bytes per request
+    """
+
+    def __init__(self, app, paths=UPLOAD_PATHS, max_bytes: int = UPLOAD_MAX_REQUEST_SIZE):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send):
+        body = json.dumps({
+            "detail": f"Upload request exceeds the maximum total size of {self.max_bytes // (1024 * 1024)} MB"
+        }).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode()),
+                                (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope.get("headers", ())).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLargeError("Upload request body too large", self.max_bytes)
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # The app turns the error from receive into a 400/500 of its own, the 413 replaces it
+            if exceeded and not response_started:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded or response_started:
+                raise
+        if exceeded and not response_started:
+            await self._reject(send)
@@ -0,0 +1,96 @@
+"""
+In-process caches of user records and token versions.
+
+Access tokens carry the claims authorization needs (see auth.get_current_user),
+so a request only has to check that the token version is still current.
+token_versions caches the current version per user; it is only read from the
+database for unknown users, for tokens newer than the cached version and after
+TOKEN_VERSION_TTL_SECONDS, so other worker processes pick up revocations.
+
+Endpoints that need the full record use auth.get_current_user_record, which
+caches the detached user objects in user_cache. A cached record is only used
+for tokens of the same token version, and it is dropped as soon as a newer
+version is read from the database. Its TTL never exceeds the token version
+TTL, so a change made by another worker process (password, role, status) is
+not served from this cache longer than that process still accepts the old
+tokens.
+
+Code that changes a user's status, role, password or verification state must
+call auth.revoke_user_tokens, which updates both caches.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Maximum age of a cached token version, bounds how long other processes accept revoked tokens
+TOKEN_VERSION_TTL_SECONDS = float(os.getenv("TOKEN_VERSION_TTL_SECONDS", "30"))
+# Maximum age of a cached user record, at most the token version TTL
+USER_CACHE_TTL_SECONDS = min(float(os.getenv("USER_CACHE_TTL_SECONDS", "30")), TOKEN_VERSION_TTL_SECONDS)
+# Maximum number of cached users, the least recently used ones are evicted first
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
+
+
+class UserCache:
+    """
+    Size-bounded LRU cache with a time-to-live per entry.
+
+    Args:
+        max_size (int): Maximum number of entries
+        ttl (float): Seconds an entry stays valid
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_MAX_SIZE, ttl: float = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str):
+        """Returns the cached user or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                expires, user = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(username)
+                    self.hits += 1
+                    return user
+                del self._entries[username]
+            self.misses += 1
+            return None
+
+    def put(self, username: str, user):
+        with self._lock:
+            self._entries[username] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, username: str):
+        """Drops the cached record of a user, e.g. after a status or password change."""
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+user_cache = UserCache()
+token_versions = UserCache(ttl=TOKEN_VERSION_TTL_SECONDS)
@@ -29,18 +29,52 @@ api.interceptors.request.use(
   }
 )
 
+// Exchanges the stored refresh token for a new token pair; concurrent 401s share one request
+let refreshPromise = null
+
+const refreshAccessToken = () => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem('refresh_token')
+    refreshPromise = axios.post(`${API_BASE_URL}/token/refresh`, { refresh_token: refreshToken })
+      .then((response) => {
+        localStorage.setItem('token', response.data.access_token)
+        localStorage.setItem('refresh_token', response.data.refresh_token)
+        return response.data.access_token
+      })
+      .finally(() => {
+        refreshPromise = null
+      })
+  }
+  return refreshPromise
+}
+
 // Response interceptor
 api.interceptors.response.use(
   (response) => {
     return response
   },
-  (error) => {
+  async (error) => {
+    // Expired access token: renew it with the refresh token and retry once
+    const original = error.config
+    if (error.response?.status === 401 && original && !original._retried && !original.url?.startsWith('/token') &&
+        localStorage.getItem('refresh_token')) {
+      original._retried = true
+      try {
+        const token = await refreshAccessToken()
+        original.headers.Authorization = `Bearer ${token}`
+        return api(original)
+      } catch (refreshError) {
+        localStorage.removeItem('refresh_token')
+      }
+    }
+
     // Handle common errors
     if (error.response) {
       // Check for token expiration (401 Unauthorized)
       if (error.response.status === 401) {
-        // Clear token from localStorage
+        // Clear tokens from localStorage
         localStorage.removeItem('token')
+        localStorage.removeItem('refresh_token')
         
         // Redirect to login page
         if (window.location.pathname !== '/login') {
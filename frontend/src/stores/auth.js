@@ -28,6 +28,7 @@ export const useAuthStore = defineStore('auth', {
         
         this.token = response.data.access_token;
         localStorage.setItem('token', response.data.access_token);
+        localStorage.setItem('refresh_token', response.data.refresh_token);
         
         // Fetch user data
         await this.fetchUser();
@@ -64,6 +65,7 @@ export const useAuthStore = defineStore('auth', {
       this.token = null;
       this.user = null;
       localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
       
       // If session expired, we'll add the notification message when redirecting
       if (expiredSession) {
@@ -88,6 +90,12 @@ export const useAuthStore = defineStore('auth', {
           current_password: currentPassword,
           new_password: newPassword
         });
+        // The password change revokes the old token, the response carries a new one
+        if (response.data.access_token) {
+          this.token = response.data.access_token;
+          localStorage.setItem('token', response.data.access_token);
+          localStorage.setItem('refresh_token', response.data.refresh_token);
+        }
         return { success: true, message: response.data.message };
       } catch (error) {
         console.error('Password change error:', error);
@@ -5,18 +5,26 @@ import { useToastStore } from './toast'
 export const useUserStore = defineStore('users', {
   state: () => ({
     users: [],
+    // Paginated listing: total number of matching users, cursor of the next page and the active filters
+    total: 0,
+    nextCursor: null,
+    filters: {},
     loading: false,
     error: null
   }),
 
   actions: {
-    async fetchUsers() {
+    // filters: status, role, email_verified, q (prefix of username or email)
+    async fetchUsers(filters = {}) {
       this.loading = true
       try {
         console.log('🔍 Fetching users from API...')
-        const response = await api.get('/api/users')
+        const response = await api.get('/api/users', { params: filters })
         console.log('🔍 API Response:', response)
-        this.users = response.data
+        this.filters = filters
+        this.users = response.data.items
+        this.total = response.data.total
+        this.nextCursor = response.data.next_cursor
         return this.users
       } catch (error) {
         console.error('❌ API Error:', error)
@@ -28,6 +36,31 @@ export const useUserStore = defineStore('users', {
       }
     },
 
+    async fetchMoreUsers() {
+      if (!this.nextCursor) {
+        return this.users
+      }
+      this.loading = true
+      try {
+        const response = await api.get('/api/users', { params: { ...this.filters, cursor: this.nextCursor } })
+        this.users = [...this.users, ...response.data.items]
+        this.total = response.data.total
+        this.nextCursor = response.data.next_cursor
+        return this.users
+      } catch (error) {
+        this.error = error.message
+        useToastStore().error('Failed to load users')
+        return this.users
+      } finally {
+        this.loading = false
+      }
+    },
+
+    async fetchPendingUsers() {
+      const response = await api.get('/api/users', { params: { status: 'pending', limit: 200 } })
+      return response.data.items
+    },
+
     async registerUser(userData) {
       this.loading = true
       try {